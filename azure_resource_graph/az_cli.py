@@ -0,0 +1,628 @@
+"""
+Runs az commands for the processor: the subprocess, in-process REST, replay and
+recording backends, and the executor batching ARM GETs into /batch requests.
+"""
+import abc
+import hashlib
+import http.client
+import json
+import os
+import queue
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import quote, urlsplit
+
+from az_command import (
+    ARM_API_VERSIONS, ARM_ENDPOINT, CALL_INFO, GRAPH_ENDPOINT, chunk_list, flatten_arm_resource,
+    normalize_command, parse_az_command
+)
+from profiler import Profiler
+from rate_governor import (
+    BACKOFF_BASE, BACKOFF_CAP, DEFAULT_MAX_RETRIES, RETRY_AFTER_PATTERN, THROTTLE_PATTERN, RateGovernor
+)
+
+# ARM /batch endpoint, which accepts up to 500 requests per call
+ARM_BATCH_URL = f"{ARM_ENDPOINT}/batch?api-version=2020-06-01"
+ARM_BATCH_MAX = 500
+# How long the batch executor waits for more requests before sending a partial batch
+ARM_BATCH_LINGER = 0.05
+
+
+class AzureCLIBackend(abc.ABC):
+    """
+    Executes one az command line and returns the parsed JSON, the raw string
+    output, or an empty list on failure (the contract of AzureCLI.run_az_cli).
+    """
+    name = "base"
+
+    @abc.abstractmethod
+    def run(self, command: str):
+        """
+        Runs 'command' and records failures and throttling in CALL_INFO.
+        """
+
+    def close(self):
+        pass
+
+
+class SubprocessBackend(AzureCLIBackend):
+    """
+    Spawns the real 'az' executable for every command.
+    """
+    name = "subprocess"
+
+    def run(self, command: str):
+        try:
+            result = subprocess.run(command, shell=True, capture_output=True, text=True)
+            CALL_INFO.bytes = len(result.stdout)
+            if result.returncode != 0:
+                CALL_INFO.failed = True
+                if THROTTLE_PATTERN.search(result.stderr):
+                    CALL_INFO.throttled = True
+                    retry_after = RETRY_AFTER_PATTERN.search(result.stderr)
+                    CALL_INFO.retry_after = float(retry_after.group(1)) if retry_after else None
+                print(f"[ERROR] Command failed ({result.returncode}): {command}\n{result.stderr}")
+                return []
+            # Try to parse JSON
+            try:
+                return json.loads(result.stdout)
+            except json.JSONDecodeError:
+                # If not valid JSON, just return the raw string
+                return result.stdout
+        except Exception as e:
+            CALL_INFO.failed = True
+            print(f"Exception while running command: {e}")
+            return []
+
+
+class HTTPConnectionPool:
+    """
+    Keep-alive HTTPS connections per host, shared by all worker threads.
+    """
+    def __init__(self, max_idle_per_host: int = 32, timeout: float = 60):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def _idle_queue(self, host: str) -> queue.LifoQueue:
+        with self.lock:
+            if host not in self.idle:
+                self.idle[host] = queue.LifoQueue(maxsize=self.max_idle_per_host)
+            return self.idle[host]
+
+    def request(self, method: str, url: str, body: bytes = None, headers: Dict = None):
+        """
+        Returns (status, headers, body_bytes). Retries once on a stale pooled connection.
+        """
+        parts = urlsplit(url)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+        idle = self._idle_queue(parts.netloc)
+        for attempt in range(2):
+            try:
+                conn = idle.get_nowait()
+            except queue.Empty:
+                conn = http.client.HTTPSConnection(parts.netloc, timeout=self.timeout)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                response = conn.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            if response.will_close:
+                conn.close()
+            else:
+                try:
+                    idle.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            return response.status, response.headers, data
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                while not idle.empty():
+                    idle.get_nowait().close()
+            self.idle.clear()
+
+
+class RestBackend(AzureCLIBackend):
+    """
+    Serves the az commands used by the collector in-process, with direct ARM,
+    Resource Graph and Microsoft Graph REST calls over pooled keep-alive
+    connections. Access tokens are fetched once per audience through
+    'az account get-access-token' and refreshed shortly before they expire.
+    Commands without a REST translation fall back to the subprocess backend.
+    """
+    name = "rest"
+
+    def __init__(self, pool: HTTPConnectionPool = None, fallback: AzureCLIBackend = None):
+        self.pool = pool or HTTPConnectionPool()
+        self.fallback = fallback or SubprocessBackend()
+        self.tokens = {}  # resource -> (token, expires_on)
+        self.token_lock = threading.Lock()
+        self.role_names = {}  # roleDefinitionId (lower) -> roleName
+        self.handlers = {
+            "account list": self._account_list,
+            "graph query": self._graph_query,
+            "role assignment list": self._role_assignment_list,
+            "identity show": self._identity_show,
+            "identity federated-credential list": self._federated_credential_list,
+            "ad user show": lambda opts: self._ad_show("users", opts.get("id"), opts),
+            "ad sp show": lambda opts: self._ad_show("servicePrincipals", opts.get("id"), opts),
+            "ad group show": lambda opts: self._ad_show("groups", opts.get("group"), opts),
+            "rest": self._rest,
+        }
+
+    def run(self, command: str):
+        try:
+            group, options = parse_az_command(command)
+        except ValueError:
+            group, options = None, {}
+        handler = self.handlers.get(group)
+        if handler is None:
+            return self.fallback.run(command)
+        try:
+            result = handler(options)
+        except Exception as e:
+            CALL_INFO.failed = True
+            print(f"Exception while running command: {e}")
+            return []
+        if result is None:
+            CALL_INFO.failed = True
+            return []
+        return self._format(result, options)
+
+    def close(self):
+        self.pool.close()
+
+    ##########################################################################
+    #  Plumbing
+    ##########################################################################
+    def _token(self, resource: str) -> str:
+        with self.token_lock:
+            token, expires_on = self.tokens.get(resource, (None, 0))
+            if token and expires_on - time.time() > 300:
+                return token
+            result = self.fallback.run(
+                f"az account get-access-token --resource {resource} --output json"
+            )
+            if not isinstance(result, dict) or "accessToken" not in result:
+                raise RuntimeError(f"Could not get an access token for {resource}")
+            expires_on = float(result.get("expires_on") or time.time() + 1800)
+            self.tokens[resource] = (result["accessToken"], expires_on)
+            return result["accessToken"]
+
+    @staticmethod
+    def _rate_limit_info(status: int, headers):
+        """
+        Reports throttling (429, Retry-After) and the lowest remaining ARM quota to the governor.
+        """
+        remaining = [
+            int(value) for key, value in headers.items()
+            if key.lower().startswith("x-ms-ratelimit-remaining-") and value.isdigit()
+        ]
+        if remaining:
+            current = getattr(CALL_INFO, "remaining", None)
+            CALL_INFO.remaining = min(remaining + ([current] if current is not None else []))
+        if status == 429:
+            CALL_INFO.throttled = True
+            retry_after = headers.get("Retry-After")
+            CALL_INFO.retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+
+    def _request(self, method: str, url: str, body=None):
+        """
+        Returns the decoded JSON body, or None (after logging) on an HTTP error.
+        """
+        parts = urlsplit(url)
+        resource = f"{parts.scheme}://{parts.netloc}/"
+        headers = {
+            "Authorization": f"Bearer {self._token(resource)}",
+            "Accept": "application/json",
+        }
+        payload = None
+        if body is not None:
+            payload = body if isinstance(body, bytes) else json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        status, response_headers, data = self.pool.request(method, url, payload, headers)
+        CALL_INFO.bytes = getattr(CALL_INFO, "bytes", 0) + len(data)
+        self._rate_limit_info(status, response_headers)
+        if status >= 400:
+            print(f"[ERROR] {method} {url} failed ({status}):\n{data[:500].decode(errors='replace')}")
+            return None
+        if not data:
+            return {}
+        return json.loads(data)
+
+    def _arm_get(self, path: str, api_version: str):
+        separator = "&" if "?" in path else "?"
+        return self._request("GET", f"{ARM_ENDPOINT}{path}{separator}api-version={api_version}")
+
+    def _arm_get_all(self, path: str, api_version: str) -> Optional[List[Dict]]:
+        """
+        Follows ARM 'nextLink' paging and returns every item of 'value', or None
+        when any page failed, rather than a silently truncated list.
+        """
+        items = []
+        page = self._arm_get(path, api_version)
+        while True:
+            if page is None:
+                return None
+            items.extend(page.get("value", []))
+            next_link = page.get("nextLink")
+            if not next_link:
+                return items
+            page = self._request("GET", next_link)
+
+    @staticmethod
+    def _format(result, options: Dict):
+        """
+        Applies the simple dotted '--query' paths and '--output tsv' the collector uses.
+        """
+        expression = options.get("query")
+        if isinstance(expression, str):
+            for key in expression.split("."):
+                result = result.get(key) if isinstance(result, dict) else None
+        if options.get("output") == "tsv":
+            if result is None:
+                return ""
+            if isinstance(result, list):
+                return "\n".join(str(item) for item in result) + "\n"
+            return f"{result}\n"
+        return result
+
+    ##########################################################################
+    #  Command translations
+    ##########################################################################
+    def _account_list(self, options: Dict):
+        subscriptions = self._arm_get_all("/subscriptions", ARM_API_VERSIONS["subscriptions"])
+        if subscriptions is None:
+            return None
+        return [
+            {
+                "id": sub.get("subscriptionId"),
+                "name": sub.get("displayName"),
+                "state": sub.get("state"),
+                "tenantId": sub.get("tenantId"),
+            }
+            for sub in subscriptions
+        ]
+
+    def _graph_query(self, options: Dict):
+        body = {"query": options.get("q") or options.get("graph-query"), "options": {}}
+        if isinstance(options.get("subscriptions"), str):
+            body["subscriptions"] = options["subscriptions"].split()
+        if isinstance(options.get("first"), str):
+            body["options"]["$top"] = int(options["first"])
+        if isinstance(options.get("skip-token"), str):
+            body["options"]["$skipToken"] = options["skip-token"]
+        url = (f"{ARM_ENDPOINT}/providers/Microsoft.ResourceGraph/resources"
+               f"?api-version={ARM_API_VERSIONS['resourcegraph']}")
+        response = self._request("POST", url, body)
+        if response is None:
+            return None
+        return {
+            "count": response.get("count"),
+            "data": response.get("data", []),
+            "skip_token": response.get("$skipToken"),
+            "total_records": response.get("totalRecords"),
+        }
+
+    def _role_name(self, role_definition_id: str) -> str:
+        key = role_definition_id.lower()
+        if key not in self.role_names:
+            definition = self._arm_get(role_definition_id, ARM_API_VERSIONS["authorization"]) or {}
+            self.role_names[key] = (definition.get("properties") or {}).get("roleName")
+        return self.role_names[key]
+
+    def _role_assignment_list(self, options: Dict):
+        scope = options["scope"].rstrip("/")
+        # atScope() also returns inherited assignments; az keeps only the exact scope
+        assignments = self._arm_get_all(
+            f"{scope}/providers/Microsoft.Authorization/roleAssignments?$filter=atScope()",
+            ARM_API_VERSIONS["authorization"]
+        )
+        if assignments is None:
+            return None
+        results = []
+        for assignment in assignments:
+            flat = flatten_arm_resource(assignment)
+            if (flat.get("scope") or "").rstrip("/").lower() != scope.lower():
+                continue
+            flat["roleDefinitionName"] = self._role_name(flat.get("roleDefinitionId", ""))
+            results.append(flat)
+        return results
+
+    def _identity_show(self, options: Dict):
+        identity = self._arm_get(options["ids"], ARM_API_VERSIONS["managedidentity"])
+        return flatten_arm_resource(identity) if identity is not None else None
+
+    def _federated_credential_list(self, options: Dict):
+        path = (f"/subscriptions/{options['subscription']}/resourceGroups/{options['resource-group']}"
+                f"/providers/Microsoft.ManagedIdentity/userAssignedIdentities/{options['identity-name']}"
+                f"/federatedIdentityCredentials")
+        credentials = self._arm_get_all(path, ARM_API_VERSIONS["managedidentity"])
+        return [flatten_arm_resource(fc) for fc in credentials] if credentials is not None else None
+
+    def _ad_show(self, collection: str, object_id: str, options: Dict):
+        return self._request("GET", f"{GRAPH_ENDPOINT}/v1.0/{collection}/{quote(object_id)}")
+
+    def _rest(self, options: Dict):
+        body = options.get("body")
+        if isinstance(body, str) and body.startswith("@"):
+            with open(body[1:]) as file:
+                body = file.read()
+        return self._request(
+            str(options.get("method", "GET")).upper(),
+            options["url"],
+            body.encode() if isinstance(body, str) else None
+        )
+
+
+class ReplayBackend(AzureCLIBackend):
+    """
+    Serves previously recorded command results from a directory, fully offline.
+    Recordings are JSON files named after a hash of the normalized command.
+    """
+    name = "replay"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @staticmethod
+    def recording_path(directory: str, command: str) -> str:
+        digest = hashlib.sha256(normalize_command(command).encode()).hexdigest()
+        return os.path.join(directory, f"{digest}.json")
+
+    def run(self, command: str):
+        path = self.recording_path(self.directory, command)
+        try:
+            with open(path) as file:
+                CALL_INFO.bytes = os.fstat(file.fileno()).st_size
+                recording = json.load(file)
+            # Recorded failures fail again, so callers fall back the same way
+            if recording.get("failed"):
+                CALL_INFO.failed = True
+            return recording["result"]
+        except FileNotFoundError:
+            CALL_INFO.failed = True
+            print(f"[ERROR] No recording for command: {command}")
+            return []
+
+
+class RecordingBackend(AzureCLIBackend):
+    """
+    Wraps another backend and saves every result, and whether the command
+    failed, for later use by ReplayBackend.
+    """
+    name = "record"
+
+    def __init__(self, inner: AzureCLIBackend, directory: str):
+        self.inner = inner
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, command: str):
+        result = self.inner.run(command)
+        path = ReplayBackend.recording_path(self.directory, command)
+        recording = {"command": normalize_command(command), "result": result}
+        if getattr(CALL_INFO, "failed", False):
+            recording["failed"] = True
+        with open(path, "w") as file:
+            json.dump(recording, file)
+        return result
+
+    def close(self):
+        self.inner.close()
+
+
+class AzureCLI:
+    BACKENDS = ("subprocess", "rest", "replay")
+
+    def __init__(self, backend: AzureCLIBackend = None, profiler: Profiler = None,
+                 governor: RateGovernor = None):
+        self.backend = backend or SubprocessBackend()
+        self.profiler = profiler or Profiler()
+        self.governor = governor
+
+    def run_az_cli(self, command: str):
+        """
+        Runs an Azure CLI command through the configured backend and returns the parsed JSON or raw string.
+        If an error occurs or the command exits with a non-zero code, returns an empty list.
+        With a rate governor, throttled commands are retried before giving up.
+        """
+        if self.governor is not None:
+            return self.governor.call(command, self._run_once)
+        if not self.profiler.enabled:
+            CALL_INFO.failed = False
+            return self.backend.run(command)
+        return self._run_once(command)
+
+    @staticmethod
+    def last_call_failed() -> bool:
+        """
+        Whether this thread's last run_az_cli call failed; failures also return [].
+        """
+        return getattr(CALL_INFO, "failed", False)
+
+    def _run_once(self, command: str):
+        CALL_INFO.bytes = 0
+        CALL_INFO.failed = False
+        CALL_INFO.throttled = False
+        CALL_INFO.retry_after = None
+        CALL_INFO.remaining = None
+        start = time.perf_counter()
+        result = self.backend.run(command)
+        if self.profiler.enabled:
+            self.profiler.record_command(command, start, time.perf_counter() - start,
+                                         CALL_INFO.bytes, CALL_INFO.failed)
+        return result
+
+    def run_az_rest(self, method: str, url: str, body: Dict = None):
+        """
+        Runs 'az rest'. Bodies go through a temporary file (they can exceed the
+        shell's argument size limit) named after their content, so identical
+        requests produce identical commands for recording and replay.
+        """
+        command = f'az rest --method {method} --url "{url}" --output json'
+        if body is None:
+            return self.run_az_cli(command)
+        payload = json.dumps(body, separators=(",", ":"), sort_keys=True)
+        digest = hashlib.sha256(payload.encode()).hexdigest()[:32]
+        path = os.path.join(tempfile.gettempdir(), f"azure_resource_graph_body_{digest}.json")
+        with open(path, "w") as file:
+            file.write(payload)
+        try:
+            return self.run_az_cli(f'{command} --headers Content-Type=application/json --body "@{path}"')
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def close(self):
+        self.backend.close()
+
+
+class ArmBatchExecutor:
+    """
+    Collects individual ARM GET requests from any thread and sends them as
+    ARM /batch calls of up to ARM_BATCH_MAX requests, then hands every caller
+    its own response. Requests for the same URL share one in-flight future;
+    ARM paths are case-insensitive, so URLs are compared case-folded (like the
+    processor's memo), the first caller's casing is sent.
+
+    Futures resolve to the response content for 2xx, {} for 404 and None when
+    the request (or the whole batch) failed, so callers can fall back to the
+    individual az command. Throttled (429) requests are sent again in a later
+    batch, after their Retry-After, up to max_retries times (by default the
+    rate governor's).
+    """
+    def __init__(self, cli: AzureCLI, max_batch_size: int = ARM_BATCH_MAX,
+                 linger: float = ARM_BATCH_LINGER, max_concurrent_batches: int = 4,
+                 max_retries: int = None):
+        self.cli = cli
+        if max_retries is None:
+            max_retries = cli.governor.max_retries if cli.governor is not None else DEFAULT_MAX_RETRIES
+        self.max_retries = max_retries
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self.pending = []    # relative URLs waiting to be sent
+        self.futures = {}    # lowercased relative URL -> Future, until the caller collects it
+        self.condition = threading.Condition()
+        self.closed = False
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix="arm-batch")
+        self.flusher = threading.Thread(target=self._flush_loop, name="arm-batch-flusher", daemon=True)
+        self.flusher.start()
+
+    def submit(self, url: str) -> Future:
+        """
+        Queues a GET for an ARM path (including api-version) without waiting.
+        """
+        with self.condition:
+            future = self.futures.get(url.lower())
+            if future is None:
+                future = self.futures[url.lower()] = Future()
+                self.pending.append(url)
+                self.condition.notify()
+            return future
+
+    def get(self, url: str):
+        """
+        Queues a GET (unless already queued) and waits for its response.
+        """
+        result = self.submit(url).result()
+        with self.condition:
+            self.futures.pop(url.lower(), None)
+        return result
+
+    def _flush_loop(self):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closed:
+                    self.condition.wait()
+                if not self.pending and self.closed:
+                    return
+                # Give other threads a moment to add requests to this batch
+                deadline = time.monotonic() + self.linger
+                while len(self.pending) < self.max_batch_size and not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                urls, self.pending = self.pending, []
+                futures = [self.futures[url.lower()] for url in urls]
+            for chunk in chunk_list(list(zip(urls, futures)), self.max_batch_size):
+                self.executor.submit(self._send_batch, chunk)
+
+    @staticmethod
+    def _retry_after(response: Dict) -> float:
+        for key, value in (response.get("headers") or {}).items():
+            if key.lower() == "retry-after" and str(value).isdigit():
+                return float(value)
+        return 0.0
+
+    def _post_batch(self, chunk) -> Dict:
+        """
+        Sends one ARM /batch call and returns its sub-responses by name, {} if it failed.
+        """
+        requests = [
+            {"httpMethod": "GET", "name": str(i), "url": url}
+            for i, (url, _) in enumerate(chunk)
+        ]
+        print(f"[DEBUG] Sending ARM batch of {len(requests)} request(s) ...")
+        try:
+            result = self.cli.run_az_rest("POST", ARM_BATCH_URL, {"requests": requests})
+        except Exception as e:
+            print(f"Exception while sending ARM batch: {e}")
+            result = None
+        if not isinstance(result, dict):
+            print("[WARNING] ARM batch failed, callers will fall back to individual requests.")
+            return {}
+        return {response.get("name"): response for response in result.get("responses", [])}
+
+    def _send_batch(self, chunk):
+        for attempt in range(self.max_retries + 1):
+            responses = self._post_batch(chunk)
+            throttled = []
+            retry_after = 0.0
+            for i, (url, future) in enumerate(chunk):
+                response = responses.get(str(i))
+                status = response.get("httpStatusCode", 0) if response else 0
+                if 200 <= status < 300:
+                    future.set_result(response.get("content") or {})
+                elif status == 404:
+                    future.set_result({})
+                elif status == 429 and attempt < self.max_retries:
+                    throttled.append((url, future))
+                    retry_after = max(retry_after, self._retry_after(response))
+                else:
+                    if response:
+                        print(f"[ERROR] Batched GET {url} failed ({status})")
+                    future.set_result(None)
+            if not throttled:
+                return
+            # The /batch call itself succeeded, so the governor has not seen this throttling
+            if self.cli.governor is not None:
+                self.cli.governor.limiters["arm"].report_throttle(retry_after)
+            # Full jitter, but never sooner than the server asked for
+            delay = max(retry_after, random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+            print(f"[WARNING] {len(throttled)} batched GET(s) throttled, retry {attempt + 1}/{self.max_retries} "
+                  f"in {delay:.1f}s")
+            time.sleep(delay)
+            chunk = throttled
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.flusher.join()
+        self.executor.shutdown(wait=True)
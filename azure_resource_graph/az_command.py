@@ -0,0 +1,91 @@
+"""
+Helpers shared by the az backends and the processor: az command parsing, the
+REST endpoints and API versions, and the per-thread details of the call in progress.
+"""
+import shlex
+import threading
+from typing import Dict
+from urllib.parse import urlsplit
+
+# In-process REST backend endpoints and API versions
+ARM_ENDPOINT = "https://management.azure.com"
+GRAPH_ENDPOINT = "https://graph.microsoft.com"
+ARM_API_VERSIONS = {
+    "subscriptions": "2022-12-01",
+    "resourcegraph": "2021-03-01",
+    "authorization": "2022-04-01",
+    "managedidentity": "2023-01-31",
+}
+
+# Per-thread details about the az call in progress, filled in by the backends
+CALL_INFO = threading.local()
+
+
+def chunk_list(lst, chunk_size=7):
+    """
+    Yield successive chunks of size 'chunk_size' from the list 'lst'.
+    """
+    for i in range(0, len(lst), chunk_size):
+        yield lst[i : i + chunk_size]
+
+
+def normalize_command(command: str) -> str:
+    """
+    Collapses quoting and whitespace differences so equivalent commands compare equal.
+    """
+    try:
+        return " ".join(shlex.split(command))
+    except ValueError:
+        return " ".join(command.split())
+
+
+def parse_az_command(command: str):
+    """
+    Splits an 'az ...' command line into its command group ("identity show")
+    and a dict of options ({"ids": "...", "query": "principalId"}).
+    Options followed by several values keep them space-separated.
+    """
+    tokens = shlex.split(command)
+    if not tokens or tokens[0] != "az":
+        return None, {}
+    i = 1
+    words = []
+    while i < len(tokens) and not tokens[i].startswith("-"):
+        words.append(tokens[i])
+        i += 1
+    options = {}
+    while i < len(tokens):
+        key = tokens[i].lstrip("-")
+        values = []
+        i += 1
+        while i < len(tokens) and not tokens[i].startswith("--"):
+            values.append(tokens[i])
+            i += 1
+        options[key] = " ".join(values) if values else True
+    return " ".join(words), options
+
+
+def flatten_arm_resource(resource: Dict) -> Dict:
+    """
+    az flattens 'properties' into the top level of most resource outputs.
+    """
+    flat = {k: v for k, v in resource.items() if k != "properties"}
+    flat.update(resource.get("properties") or {})
+    return flat
+
+
+def command_family(command: str) -> str:
+    """
+    Groups az commands for reporting: "role assignment list", "graph query",
+    "rest getByIds", "rest batch", ...
+    """
+    try:
+        group, options = parse_az_command(command)
+    except ValueError:
+        group, options = None, {}
+    if not group:
+        return command.split(" ", 2)[1] if " " in command else command
+    if group == "rest" and isinstance(options.get("url"), str):
+        path = urlsplit(options["url"]).path.rstrip("/")
+        return f"rest {path.rsplit('/', 1)[-1] or path}"
+    return group
@@ -1,102 +1,276 @@
-import json
-import subprocess
-from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import os
+import shlex
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
 from typing import List, Dict
 
-# The color palette (unchanged)
-RESOURCE_COLORS = {
-    "Microsoft.Compute/virtualMachines": "#1f77b4",
-    "Microsoft.Compute/virtualMachineScaleSets": "#aec7e8",
-    "Microsoft.Storage/storageAccounts": "#2ca02c",
-    "Microsoft.KeyVault/vaults": "#9467bd",
-    "Microsoft.Web/sites": "#e377c2",
-    "Microsoft.ManagedIdentity/userAssignedIdentities": "#ff7f0e",
-    "Microsoft.ContainerService/managedClusters": "#17becf",
-    "Microsoft.Automation/automationAccounts": "#8c564b",
-    "ResourceGroup": "#7f7f7f",
-    "Subscription": "#bcbd22",
-    "SystemAssignedManagedIdentity": "#98df8a",
-    "UserAssignedManagedIdentity": "#ff7f0e",
-    "Principal": "#d62728",
-    "FederatedCredential": "#9edae5"
-}
-
-##############################################################################
-#                           HELPER: Chunking IDs
-##############################################################################
-def chunk_list(lst, chunk_size=7):
+from az_cli import (
+    ArmBatchExecutor, AzureCLI, RecordingBackend, ReplayBackend, RestBackend, SubprocessBackend
+)
+from az_command import ARM_API_VERSIONS, CALL_INFO, chunk_list, flatten_arm_resource, normalize_command
+from checkpoint import DEFAULT_CHECKPOINT_INTERVAL, CheckpointJournal
+from graph_layout import DEFAULT_LAYOUT_ITERATIONS, forceatlas2_layout
+from graph_model import (
+    IAM_EDGE_COLOR, KEY_VAULT_POLICY_LABELS, RESOURCE_COLORS, AzureResourceGraph, normalize_resource_type
+)
+from graph_output import GraphWriter, SQLiteGraphWriter, write_parquet
+from persistent_cache import DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_ENTRIES, PersistentCache
+from profiler import Profiler, profiled
+from rate_governor import DEFAULT_MAX_RETRIES, RATE_LIMITS, RateGovernor
+from sharding import SHARD_METHODS, parse_shard, shard_subscriptions
+from work_scheduler import DEFAULT_MAX_WORKERS, WorkScheduler
+
+# Resource types collected by default
+RESOURCE_TYPES = [
+    "Microsoft.Compute/virtualMachines",
+    "Microsoft.Compute/virtualMachineScaleSets",
+    "Microsoft.Storage/storageAccounts",
+    "Microsoft.KeyVault/vaults",
+    "Microsoft.Web/sites",
+    "Microsoft.ManagedIdentity/userAssignedIdentities",
+    "Microsoft.ContainerService/managedClusters",
+    "Microsoft.Automation/automationAccounts"
+]
+
+# Microsoft Graph accepts at most 1000 IDs per directoryObjects/getByIds call
+GRAPH_GET_BY_IDS_URL = "https://graph.microsoft.com/v1.0/directoryObjects/getByIds"
+GRAPH_GET_BY_IDS_MAX = 1000
+
+# Resource Graph returns at most 1000 rows per page
+ARG_PAGE_SIZE_MAX = 1000
+
+ARG_ROLE_ASSIGNMENTS_QUERY = (
+    "authorizationresources "
+    "| where type =~ 'microsoft.authorization/roleassignments' "
+    "| project scope = tostring(properties.scope), "
+    "principalId = tostring(properties.principalId), "
+    "roleDefinitionId = tostring(properties.roleDefinitionId)"
+)
+ARG_ROLE_DEFINITIONS_QUERY = (
+    "authorizationresources "
+    "| where type =~ 'microsoft.authorization/roledefinitions' "
+    "| project id, roleName = tostring(properties.roleName)"
+)
+
+ARG_RESOURCE_GROUPS_QUERY = "Resources | distinct resourceGroup"
+
+
+def kql_string(value: str) -> str:
     """
-    Yield successive chunks of size 'chunk_size' from the list 'lst'.
+    Quotes a value as a KQL string literal.
     """
-    for i in range(0, len(lst), chunk_size):
-        yield lst[i : i + chunk_size]
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
 
 
-class AzureCLI:
-    @staticmethod
-    def run_az_cli(command: str):
-        """
-        Runs a shell command with Azure CLI and returns the parsed JSON or raw string.
-        If an error occurs or the command exits with a non-zero code, returns an empty list.
-        """
-        try:
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
-            if result.returncode != 0:
-                print(f"[ERROR] Command failed ({result.returncode}): {command}\n{result.stderr}")
-                return []
-            # Try to parse JSON
-            try:
-                return json.loads(result.stdout)
-            except json.JSONDecodeError:
-                # If not valid JSON, just return the raw string
-                return result.stdout
-        except Exception as e:
-            print(f"Exception while running command: {e}")
-            return []
-
-
-class AzureResourceGraph:
-    def __init__(self):
-        self.nodes = []
-        self.edges = []
-        self.node_set = set()  # To deduplicate nodes by ID
-        self.edge_set = set()  # To deduplicate edges by (source, target, label)
-
-    def add_node(self, node_id, name, node_type, color=None):
-        if node_id not in self.node_set:
-            self.node_set.add(node_id)
-            color = color or RESOURCE_COLORS.get(node_type, "#1f77b4")
-            self.nodes.append({
-                "id": node_id,
-                "label": name,
-                "type": node_type,
-                "color": color
-            })
+def build_resources_query(resource_types: List[str] = None, resource_ids: List[str] = None) -> str:
+    """
+    KQL fetching only the resource types we graph (every type without
+    resource_types), with only the columns we read.
+    Key Vault rows also carry their access policies and RBAC mode.
+    Optionally restricted to the given resource IDs.
+    """
+    type_filter = ""
+    if resource_types:
+        type_filter = f"| where type in~ ({', '.join(kql_string(t) for t in resource_types)}) "
+    id_filter = ""
+    if resource_ids:
+        id_filter = f"| where id in~ ({', '.join(kql_string(i) for i in resource_ids)}) "
+    return (
+        f"Resources "
+        f"{type_filter}"
+        f"{id_filter}"
+        f"| extend isVault = type =~ 'microsoft.keyvault/vaults' "
+        f"| extend accessPolicies = iff(isVault, properties.accessPolicies, dynamic(null)), "
+        f"enableRbacAuthorization = iff(isVault, tobool(properties.enableRbacAuthorization), bool(null)) "
+        f"| project id, name, type, resourceGroup, subscriptionId, identity, "
+        f"accessPolicies, enableRbacAuthorization"
+    )
 
-    def add_edge(self, source, target, label, color="black"):
-        edge_key = (source, target, label)
-        if edge_key not in self.edge_set:
-            self.edge_set.add(edge_key)
-            self.edges.append({
-                "source": source,
-                "target": target,
-                "label": label,
-                "color": color
-            })
 
-    def write_to_file(self, filename="output_azure_resource_data.json"):
-        data = {"nodes": self.nodes, "edges": self.edges}
-        with open(filename, "w") as file:
-            json.dump(data, file, indent=2)
-        print(f"[INFO] Data written to {filename}")
+def build_changes_query(since: str) -> str:
+    """
+    KQL listing every change (create/update/delete) recorded after 'since' (ISO 8601):
+    resources from 'resourcechanges', subscriptions and resource groups from
+    'resourcecontainerchanges'. Resource Graph keeps 14 days of change history.
+    """
+    return (
+        "union resourcechanges, resourcecontainerchanges "
+        "| extend changeTime = todatetime(properties.changeAttributes.timestamp), "
+        "targetResourceId = tostring(properties.targetResourceId), "
+        "changeType = tostring(properties.changeType) "
+        f"| where changeTime > datetime({since}) "
+        "| project targetResourceId, changeType, changeTime"
+    )
+
+
+RESOURCE_CHANGES_RETENTION_DAYS = 14
+
+
+def utc_timestamp() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def within_change_retention(timestamp: str) -> bool:
+    """
+    True if resourcechanges still covers everything since 'timestamp'.
+    """
+    try:
+        then = datetime.datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=datetime.timezone.utc)
+    except (TypeError, ValueError):
+        return False
+    age = datetime.datetime.now(datetime.timezone.utc) - then
+    # Keep a day of margin so we never ask for history that has just expired
+    return age < datetime.timedelta(days=RESOURCE_CHANGES_RETENTION_DAYS - 1)
+
+
+# Role assignments are <scope>/providers/Microsoft.Authorization/roleAssignments/<name>
+ROLE_ASSIGNMENT_SEGMENT = "/providers/microsoft.authorization/roleassignments/"
 
 
 class AzureResourceProcessor:
-    def __init__(self, graph: AzureResourceGraph, cli: AzureCLI):
+    IAM_SOURCES = ("scope", "arg")
+    # Node types whose role assignments are never collected (UAMIs skip the resource RBAC pass)
+    NON_IAM_SCOPE_TYPES = ("Principal", "Microsoft.ManagedIdentity/userAssignedIdentities",
+                           "UserAssignedManagedIdentity", "SystemAssignedManagedIdentity", "FederatedCredential")
+
+    def __init__(self, graph: AzureResourceGraph, cli: AzureCLI, cache: PersistentCache = None,
+                 iam_source: str = "scope", arg_page_size: int = ARG_PAGE_SIZE_MAX,
+                 max_workers: int = DEFAULT_MAX_WORKERS, arm_batch: bool = False,
+                 profiler: Profiler = None, journal: CheckpointJournal = None, shard: tuple = None):
         self.graph = graph
         self.cli = cli
+        self.profiler = profiler or Profiler()
+        # Checkpoint journal: finished units are recorded, and skipped when resuming
+        self.journal = journal
+        # Futures scheduled by the current thread's subscription, to mark it done and time it
+        self.unit_futures = threading.local()
+        # (index, count, method): only collect this shard of the subscriptions
+        self.shard = shard
+        # "scope": 'az role assignment list' per scope, "arg": one tenant-wide ARG query
+        if iam_source not in self.IAM_SOURCES:
+            raise ValueError(f"Unknown IAM source '{iam_source}', expected one of {self.IAM_SOURCES}")
+        self.iam_source = iam_source
+        # Rows requested per Resource Graph page (ARG caps this at 1000)
+        self.arg_page_size = max(1, min(arg_page_size, ARG_PAGE_SIZE_MAX))
+        # Per-scope tasks run on this scheduler during process_all_subscriptions
+        self.max_workers = max_workers
+        self.scheduler = None
+        # Optional ARM /batch executor for per-UAMI GETs (federated credentials, identity show)
+        self.batch = ArmBatchExecutor(cli) if arm_batch else None
+        # lowercased scope -> [{principalId, roleDefinitionName}], filled by load_role_assignment_index()
+        self.role_assignment_index = None
+        # Persistent cross-run cache; a bypass cache behaves as if there was none
+        self.cache = cache or PersistentCache(mode="bypass")
+        # Normalized az command -> Future of its result, for this run only
+        self.memo = {}
+        self.memo_lock = threading.Lock()
         # principalId -> displayName or fallback
         self.principal_name_cache = {}
+        # principalId -> Future for lookups currently being resolved by another thread
+        self.principal_inflight = {}
+        self.principal_lock = threading.Lock()
+        # Principal nodes added with a placeholder label, resolved in bulk later
+        self.pending_principal_ids = set()
+
+    def schedule(self, fn, *args):
+        """
+        Queues a per-scope task on the active scheduler, or runs it inline
+        when no scheduler is active (e.g. process_subscription called directly).
+        With a checkpoint journal, each task is a unit of work ("<method>:<scope>")
+        that is recorded when it finishes and skipped if already done.
+        """
+        if self.journal is not None:
+            scope = args[0]["id"] if isinstance(args[0], dict) else args[0]
+            unit = f"{fn.__name__}:{scope}"
+            if self.journal.is_done(unit):
+                return
+            fn, args = self._run_unit, (unit, fn, *args)
+        if self.scheduler is None:
+            fn(*args)
+            return
+        future = self.scheduler.submit(fn, *args)
+        tracked = getattr(self.unit_futures, "futures", None)
+        if tracked is not None:
+            tracked.append(future)
+
+    def _run_unit(self, unit: str, fn, *args):
+        fn(*args)
+        self.journal.mark_done(unit)
+
+    @staticmethod
+    def when_done(futures: List[Future], callback):
+        """
+        Calls callback(succeeded) once every future has finished; 'succeeded'
+        is False if any of them was cancelled or raised.
+        """
+        remaining = [len(futures), True]
+        lock = threading.Lock()
+
+        def task_done(future):
+            failed = future.cancelled() or future.exception() is not None
+            with lock:
+                remaining[0] -= 1
+                remaining[1] = remaining[1] and not failed
+                finished = remaining[0] == 0
+            if finished:
+                callback(remaining[1])
+
+        if not futures:
+            callback(True)
+        for future in futures:
+            future.add_done_callback(task_done)
+
+    def queue_unresolved_principals(self):
+        """
+        Queues Principal nodes still labelled with their ID (e.g. from a resumed
+        journal) for resolve_pending_principals().
+        """
+        with self.graph.lock:
+            unresolved = [n["id"] for n in self.graph.nodes if n["type"] == "Principal" and n["label"] == n["id"]]
+        with self.principal_lock:
+            self.pending_principal_ids.update(unresolved)
+
+    @staticmethod
+    def memo_key(command: str) -> str:
+        return normalize_command(command).lower()
+
+    def memoized(self, command: str, fetch):
+        """
+        Returns fetch() for 'command', computing it at most once per run.
+        ARM IDs are case-insensitive, so commands are compared case-folded.
+        Concurrent callers with the same command wait on the first caller's future.
+        Failures (an exception, or fetch's last az call failing) are handed to
+        those callers but not memoized, so later calls try again.
+        """
+        key = self.memo_key(command)
+        with self.memo_lock:
+            future = self.memo.get(key)
+            owner = future is None
+            if owner:
+                future = self.memo[key] = Future()
+        self.profiler.count_cache("memo", int(not owner), int(owner))
+        if owner:
+            failed = True
+            try:
+                # fetch may not call az at all (cache, batch), so clear an older failure
+                CALL_INFO.failed = False
+                result = fetch()
+                failed = AzureCLI.last_call_failed()
+                future.set_result(result)
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                if failed:
+                    with self.memo_lock:
+                        del self.memo[key]
+        return future.result()
+
+    def close(self):
+        if self.batch is not None:
+            self.batch.close()
 
     #########################################################################
     #                          PRINCIPAL NAME LOOKUP
@@ -130,42 +304,151 @@ class AzureResourceProcessor:
         # fallback
         return pid
 
+    @profiled("principal getByIds")
+    def fetch_principal_names_by_ids(self, principal_ids: List[str]) -> Dict[str, str]:
+        """
+        Resolves up to GRAPH_GET_BY_IDS_MAX principals through
+        directoryObjects/getByIds. IDs the directory does not return are left
+        out of the result, as are all of them if getByIds keeps failing.
+        """
+        print(f"[DEBUG] Resolving {len(principal_ids)} principal(s) via getByIds ...")
+        names = self._get_by_ids(principal_ids)
+        if names is None:
+            names = self._split_get_by_ids(principal_ids)
+        if names is None:
+            print(f"[WARNING] getByIds failed, {len(principal_ids)} principal(s) keep their ID as label.")
+            return {}
+        return names
+
+    def _get_by_ids(self, principal_ids: List[str]):
+        """
+        One getByIds call (the body goes through a file, see AzureCLI.run_az_rest),
+        retried once. Returns {id: displayName}, or None if it failed.
+        """
+        body = {"ids": principal_ids, "types": ["user", "servicePrincipal", "group"]}
+        for _ in range(2):
+            result = self.cli.run_az_rest("POST", GRAPH_GET_BY_IDS_URL, body)
+            if isinstance(result, dict):
+                return {
+                    obj["id"]: obj["displayName"] for obj in result.get("value", [])
+                    if obj.get("id") and obj.get("displayName")
+                }
+        return None
+
+    def _split_get_by_ids(self, principal_ids: List[str]):
+        """
+        After getByIds failed for 'principal_ids', looks their halves up separately
+        to isolate the IDs it rejects, splitting further into halves that fail.
+        Returns None when both halves fail too: the call fails whatever the IDs.
+        A single rejected ID is resolved by get_principal_name_single.
+        """
+        if len(principal_ids) == 1:
+            pid = principal_ids[0]
+            name = self.get_principal_name_single(pid)
+            return {pid: name} if name != pid else {}
+        middle = len(principal_ids) // 2
+        halves = [principal_ids[:middle], principal_ids[middle:]]
+        results = [self._get_by_ids(half) for half in halves]
+        if all(result is None for result in results):
+            return None
+        names = {}
+        for half, result in zip(halves, results):
+            if result is None:
+                result = self._split_get_by_ids(half) or {}
+            names.update(result)
+        return names
+
     def get_principal_names(self, principal_ids: List[str]) -> Dict[str, str]:
         """
         For each principalId, return a dict of {id: displayName}.
-        We'll do them one-by-one (simple approach).
+        Uncached IDs are resolved in chunks through getByIds. IDs already being
+        resolved by another thread are not requested again; we wait on that lookup instead.
         """
-        to_resolve = [p for p in principal_ids if p not in self.principal_name_cache]
-        for p_id in to_resolve:
-            name = self.get_principal_name_single(p_id)
-            self.principal_name_cache[p_id] = name
+        unique_ids = list(dict.fromkeys(principal_ids))
+        uncached = [p for p in unique_ids if p not in self.principal_name_cache]
+        self.profiler.count_cache("principal_names", len(unique_ids) - len(uncached), len(uncached))
+        persisted = self.cache.get_many("principal_name", uncached)
+
+        owned = {}
+        waiting = {}
+        with self.principal_lock:
+            self.principal_name_cache.update(persisted)
+            for pid in dict.fromkeys(principal_ids):
+                if pid in self.principal_name_cache:
+                    continue
+                if pid in self.principal_inflight:
+                    waiting[pid] = self.principal_inflight[pid]
+                else:
+                    future = Future()
+                    self.principal_inflight[pid] = future
+                    owned[pid] = future
+
+        if owned:
+            resolved = {}
+            try:
+                chunks = list(chunk_list(list(owned), GRAPH_GET_BY_IDS_MAX))
+                if len(chunks) == 1:
+                    resolved.update(self.fetch_principal_names_by_ids(chunks[0]))
+                else:
+                    with ThreadPoolExecutor(max_workers=min(len(chunks), 4)) as executor:
+                        for names in executor.map(self.fetch_principal_names_by_ids, chunks):
+                            resolved.update(names)
+                # Only persist real names, unresolved IDs are retried next run
+                self.cache.set_many("principal_name", resolved)
+            finally:
+                with self.principal_lock:
+                    for pid, future in owned.items():
+                        name = resolved.get(pid, pid)
+                        self.principal_name_cache[pid] = name
+                        del self.principal_inflight[pid]
+                        future.set_result(name)
+
+        for future in waiting.values():
+            future.result()
 
         # Now return a map of all
         return {p: self.principal_name_cache.get(p, p) for p in principal_ids}
 
+    def add_principal_node(self, pid: str):
+        """
+        Adds a Principal node without blocking on a directory lookup.
+        If the name is not cached yet, the principalId is used as a placeholder
+        label and queued for resolve_pending_principals().
+        """
+        display_name = self.principal_name_cache.get(pid)
+        if display_name is None:
+            with self.principal_lock:
+                self.pending_principal_ids.add(pid)
+            display_name = pid
+        self.graph.add_node(pid, display_name, "Principal", RESOURCE_COLORS.get("Principal"))
+
+    @profiled("resolve principals")
+    def resolve_pending_principals(self):
+        """
+        Resolves every principal queued by add_principal_node() in bulk and
+        updates the placeholder labels of their graph nodes.
+        """
+        with self.principal_lock:
+            # Sorted, so the getByIds bodies (and their recordings) do not depend on set order
+            pending = sorted(self.pending_principal_ids)
+            self.pending_principal_ids.clear()
+        if not pending:
+            return
+        print(f"[INFO] Resolving {len(pending)} pending principal name(s) ...")
+        pid_to_name = self.get_principal_names(pending)
+        for pid, display_name in pid_to_name.items():
+            self.graph.update_node_label(pid, display_name)
+
     #########################################################################
     #                         KEY VAULT ACCESS POLICIES
     #########################################################################
-    def fetch_key_vault_access_policies(self, vault_id: str) -> List[Dict]:
-        parts = vault_id.split("/")
-        resource_group = parts[4]
-        vault_name = parts[-1]
-        subscription_id = parts[2]
-        print(f"[DEBUG] Fetching Key Vault access policies for {vault_name} in {resource_group}...")
-        command = (
-            f"az keyvault show "
-            f"--resource-group {resource_group} "
-            f"--name {vault_name} "
-            f"--subscription {subscription_id} "
-            f"--query 'properties.accessPolicies' "
-            f"--output json"
-        )
-        access_policies = self.cli.run_az_cli(command)
-        return access_policies if isinstance(access_policies, list) else []
-
-    def process_key_vault_access_policies(self, vault_id: str):
-        policies = self.fetch_key_vault_access_policies(vault_id)
-        if not policies:
+    @profiled("key vault policies")
+    def process_key_vault_access_policies(self, vault_id: str, policies: List[Dict]):
+        """
+        Creates Secrets/Keys/Certificates edges from the vault's access policies,
+        as returned by the resource query (no per-vault 'az keyvault show').
+        """
+        if not isinstance(policies, list) or not policies:
             return
         principal_to_permissions = {}
         for policy in policies:
@@ -185,19 +468,103 @@ class AzureResourceProcessor:
             principal_to_permissions[principal_id].update(categories)
         if not principal_to_permissions:
             return
-        principal_ids = list(principal_to_permissions.keys())
-        pid_to_name = self.get_principal_names(principal_ids)
-        print(f"[DEBUG] Creating Key Vault edges for {len(principal_ids)} principals on vault {vault_id}...")
+        print(f"[DEBUG] Creating Key Vault edges for {len(principal_to_permissions)} principals on vault {vault_id}...")
         for pid, cat_set in principal_to_permissions.items():
-            principal_label = pid_to_name[pid]
-            self.graph.add_node(pid, principal_label, "Principal", RESOURCE_COLORS.get("Principal"))
+            self.add_principal_node(pid)
             for cat in cat_set:
                 self.graph.add_edge(pid, vault_id, cat, color="#9edae5")
 
     #########################################################################
     #                         ROLE ASSIGNMENTS (RBAC)
     #########################################################################
+    def fetch_graph_query_page(self, query: str, extra_args: str = "", skip_token: str = None):
+        """
+        Fetches a single Resource Graph page. Returns (rows, next_skip_token).
+        Raises RuntimeError when the page cannot be fetched, rather than ending
+        the results early as if every row had been read.
+        """
+        command = f"az graph query -q {shlex.quote(query)} --first {self.arg_page_size} {extra_args}"
+        if skip_token:
+            command += f' --skip-token "{skip_token}"'
+        command += " --output json"
+        raw_result = self.cli.run_az_cli(command)
+        if self.cli.last_call_failed():
+            page = f"the page after skip token {skip_token}" if skip_token else "the first page"
+            raise RuntimeError(f"Resource Graph query failed on {page}: {query[:200]}")
+        if isinstance(raw_result, dict):
+            return raw_result.get("data", []), raw_result.get("skip_token") or raw_result.get("$skipToken")
+        if isinstance(raw_result, list):
+            return raw_result, None
+        print(f"[WARNING] Unexpected result type for graph query: {type(raw_result)}")
+        return [], None
+
+    def iter_graph_query(self, query: str, extra_args: str = ""):
+        """
+        Yields Resource Graph rows page by page, following skip tokens.
+        The next page is fetched in the background while the caller consumes the
+        current one, so at most two pages are held in memory. A failed page
+        raises in the caller once the rows before it are consumed.
+        """
+        rows, skip_token = self.fetch_graph_query_page(query, extra_args)
+        with ThreadPoolExecutor(max_workers=1) as prefetcher:
+            while True:
+                next_page = None
+                if skip_token:
+                    next_page = prefetcher.submit(self.fetch_graph_query_page, query, extra_args, skip_token)
+                yield from rows
+                if next_page is None:
+                    return
+                rows, skip_token = next_page.result()
+
+    def run_graph_query_paginated(self, query: str, extra_args: str = "") -> List[Dict]:
+        """
+        Runs an 'az graph query' and follows skip tokens until every row is fetched.
+        """
+        return list(self.iter_graph_query(query, extra_args))
+
+    @profiled("role assignment index")
+    def load_role_assignment_index(self, subscription_ids: List[str] = None):
+        """
+        Pulls every role assignment and role definition visible to the caller from
+        the 'authorizationresources' table and indexes the assignments by scope,
+        so fetch_role_assignments() becomes a dictionary lookup.
+        Assignments can be limited to some subscriptions (e.g. a shard's).
+        """
+        print("[INFO] Fetching tenant-wide role definitions from ARG ...")
+        role_names = {}
+        for definition in self.run_graph_query_paginated(ARG_ROLE_DEFINITIONS_QUERY):
+            definition_id = definition.get("id")
+            role_name = definition.get("roleName")
+            if definition_id and role_name:
+                # Assignments reference definitions by a subscription-scoped ID,
+                # built-in definitions are listed tenant-scoped; match on the GUID.
+                role_names[definition_id.rstrip("/").split("/")[-1].lower()] = role_name
+
+        print("[INFO] Fetching tenant-wide role assignments from ARG ...")
+        index = {}
+        extra_args = f"--subscriptions {' '.join(subscription_ids)}" if subscription_ids else ""
+        assignments = self.run_graph_query_paginated(ARG_ROLE_ASSIGNMENTS_QUERY, extra_args)
+        for assignment in assignments:
+            scope = assignment.get("scope")
+            definition_id = assignment.get("roleDefinitionId") or ""
+            role_guid = definition_id.rstrip("/").split("/")[-1].lower()
+            if not scope:
+                continue
+            index.setdefault(self.scope_key(scope), []).append({
+                "principalId": assignment.get("principalId"),
+                "roleDefinitionName": role_names.get(role_guid, role_guid)
+            })
+        self.role_assignment_index = index
+        print(f"[INFO] Indexed {len(assignments)} role assignment(s) across {len(index)} scope(s).")
+
+    @staticmethod
+    def scope_key(scope: str) -> str:
+        # Scopes are case-insensitive and may carry a trailing slash; the root scope is "/"
+        return scope.rstrip("/").lower() or "/"
+
     def fetch_role_assignments(self, scope: str) -> List[Dict]:
+        if self.role_assignment_index is not None:
+            return self.role_assignment_index.get(self.scope_key(scope), [])
         print(f"[DEBUG] Fetching role assignments for scope: {scope} ...")
         command = (
             f"az role assignment list "
@@ -207,6 +574,7 @@ class AzureResourceProcessor:
         output = self.cli.run_az_cli(command)
         return output if isinstance(output, list) else []
 
+    @profiled("iam scope")
     def process_iam_for_scope(self, scope_id: str):
         assignments = self.fetch_role_assignments(scope_id)
         if not assignments:
@@ -221,14 +589,11 @@ class AzureResourceProcessor:
             if pid not in principal_roles_map:
                 principal_roles_map[pid] = set()
             principal_roles_map[pid].add(role_name)
-        principal_ids = list(principal_roles_map.keys())
-        pid_to_name = self.get_principal_names(principal_ids)
-        print(f"[DEBUG] Creating IAM edges for {len(principal_ids)} principals at {scope_id}...")
+        print(f"[DEBUG] Creating IAM edges for {len(principal_roles_map)} principals at {scope_id}...")
         for pid, roles in principal_roles_map.items():
-            display_name = pid_to_name[pid]
-            self.graph.add_node(pid, display_name, "Principal", RESOURCE_COLORS.get("Principal"))
+            self.add_principal_node(pid)
             for role_name in roles:
-                self.graph.add_edge(pid, scope_id, role_name, color="#d62728")
+                self.graph.add_edge(pid, scope_id, role_name, color=IAM_EDGE_COLOR)
 
     #########################################################################
     #  FETCH FEDERATED CREDENTIALS FOR A UAMI
@@ -239,29 +604,131 @@ class AzureResourceProcessor:
           az identity federated-credential list --identity-name <uamiName> --resource-group <rg> --subscription <sub>
         Returns list of {name, issuer, subject, etc.}
         """
+        cmd = self.federated_credentials_command(uami_id)
+        return self.memoized(cmd, lambda: self._run_federated_credentials(uami_id, cmd))
+
+    @staticmethod
+    def federated_credentials_command(uami_id: str) -> str:
         # Example resource ID:
         # /subscriptions/xxxxxx/resourceGroups/rg-name/providers/Microsoft.ManagedIdentity/userAssignedIdentities/uamiName
         parts = uami_id.split("/")
         subscription_id = parts[2]
         rg_name = parts[4]
         identity_name = parts[-1]
-
-        cmd = (
+        return (
             f"az identity federated-credential list "
             f"--identity-name {identity_name} "
             f"--resource-group {rg_name} "
             f"--subscription {subscription_id} "
             f"--output json"
         )
-        print(f"[DEBUG] Running: {cmd}")
-        result = self.cli.run_az_cli(cmd)
+
+    @staticmethod
+    def identity_show_command(uami_id: str) -> str:
+        return (
+            f"az identity show "
+            f"--ids \"{uami_id}\" "
+            f"--query principalId "
+            f"--output tsv"
+        )
+
+    @staticmethod
+    def federated_credentials_url(uami_id: str) -> str:
+        return f"{uami_id}/federatedIdentityCredentials?api-version={ARM_API_VERSIONS['managedidentity']}"
+
+    @staticmethod
+    def identity_url(uami_id: str) -> str:
+        return f"{uami_id}?api-version={ARM_API_VERSIONS['managedidentity']}"
+
+    def prefetch_uami(self, uami_id: str, principal_id: bool = True):
+        """
+        Queues the UAMI's federated-credential listing (and identity read) on the
+        ARM batch executor without waiting, so batches fill up while resources
+        stream in. The later fetch_* calls pick up the queued responses; UAMIs
+        already fetched (or being fetched) in this run, or cached, are skipped,
+        as nothing would collect their responses.
+        """
+        if self.batch is None:
+            return
+        cache_key = uami_id.lower()
+        requests = [(self.federated_credentials_command(uami_id), "federated_credentials",
+                     self.federated_credentials_url(uami_id))]
+        if principal_id:
+            requests.append((self.identity_show_command(uami_id), "uami_principal", self.identity_url(uami_id)))
+        for command, namespace, url in requests:
+            if self.cache.get(namespace, cache_key) is not None:
+                continue
+            # Under the memo lock, so the fetch either sees the queued request or was memoized first
+            with self.memo_lock:
+                if self.memo_key(command) not in self.memo:
+                    self.batch.submit(url)
+
+    def _run_federated_credentials(self, uami_id: str, cmd: str):
+        cache_key = uami_id.lower()
+        cached = self.cache.get("federated_credentials", cache_key)
+        if cached is not None:
+            return cached
+        result = None
+        if self.batch is not None:
+            content = self.batch.get(self.federated_credentials_url(uami_id))
+            values = []
+            while content is not None:
+                values.extend(content.get("value", []))
+                next_link = content.get("nextLink")
+                if not next_link:
+                    result = [flatten_arm_resource(fc) for fc in values]
+                    break
+                content = self.cli.run_az_rest("GET", next_link)
+                if not isinstance(content, dict):
+                    content = None
+        failed = False
+        if result is None:
+            print(f"[DEBUG] Running: {cmd}")
+            result = self.cli.run_az_cli(cmd)
+            failed = AzureCLI.last_call_failed()
         if isinstance(result, list):
+            # No federated credentials is a definitive answer too; failed calls are not cached
+            if not failed:
+                self.cache.set("federated_credentials", cache_key, result)
             return result
         return []
 
+    def fetch_uami_principal_id(self, uami_id: str):
+        """
+        Returns the principalId of a UAMI via 'az identity show', or None.
+        """
+        cmd = self.identity_show_command(uami_id)
+        return self.memoized(cmd, lambda: self._run_identity_show(uami_id, cmd))
+
+    def _run_identity_show(self, uami_id: str, cmd: str):
+        cache_key = uami_id.lower()
+        cached = self.cache.get("uami_principal", cache_key)
+        if cached is not None:
+            return cached
+        if self.batch is not None:
+            content = self.batch.get(self.identity_url(uami_id))
+            if content is not None:
+                principal_id = (content.get("properties") or {}).get("principalId")
+                if principal_id:
+                    self.cache.set("uami_principal", cache_key, principal_id)
+                return principal_id
+        result = self.cli.run_az_cli(cmd)
+        principal_id = None
+        if isinstance(result, str) and result.strip():
+            principal_id = result.strip()
+        elif isinstance(result, list) and result:
+            principal_id = result[0].strip()
+        elif isinstance(result, dict):
+            principal_id = result.get("principalId")
+
+        if principal_id:
+            self.cache.set("uami_principal", cache_key, principal_id)
+        return principal_id
+
     #########################################################################
     #  NEW: EXPLICITLY PROCESS UAMI RESOURCE
     #########################################################################
+    @profiled("uami resource")
     def process_uami_resource(self, resource: dict):
         """
         Processes a "Microsoft.ManagedIdentity/userAssignedIdentities" resource.
@@ -291,23 +758,15 @@ class AzureResourceProcessor:
             self.graph.add_edge(uami_id, fc_id, "Federated Credentials", color="#9edae5")
 
         # Optionally fetch principalId from 'az identity show' for a direct link
-        cmd = f"az identity show --ids \"{uami_id}\" --query principalId --output tsv"
-        principal_id = self.cli.run_az_cli(cmd)
-        if isinstance(principal_id, str) and principal_id.strip():
-            principal_id = principal_id.strip()
-            pid_to_name = self.get_principal_names([principal_id])
-            principal_display_name = pid_to_name[principal_id]
-            self.graph.add_node(
-                principal_id,
-                principal_display_name,
-                "Principal",
-                color=RESOURCE_COLORS.get("Principal")
-            )
+        principal_id = self.fetch_uami_principal_id(uami_id)
+        if principal_id:
+            self.add_principal_node(principal_id)
             self.graph.add_edge(uami_id, principal_id, "Linked", color="blue")
 
     #########################################################################
     #  PROCESS MANAGED IDENTITIES ON OTHER RESOURCES
     #########################################################################
+    @profiled("resource identities")
     def process_resource_identities(self, resource: dict):
         resource_id = resource["id"]
         identity_data = resource.get("identity")
@@ -329,14 +788,7 @@ class AzureResourceProcessor:
                 )
                 self.graph.add_edge(resource_id, sami_node_id, "SystemAssignedMI", color="#98df8a")
                 # Link to principal node
-                pid_to_name = self.get_principal_names([sys_assigned_principal_id])
-                display_name = pid_to_name[sys_assigned_principal_id]
-                self.graph.add_node(
-                    node_id=sys_assigned_principal_id,
-                    name=display_name,
-                    node_type="Principal",
-                    color=RESOURCE_COLORS.get("Principal")
-                )
+                self.add_principal_node(sys_assigned_principal_id)
                 self.graph.add_edge(sami_node_id, sys_assigned_principal_id, "Linked", color="blue")
 
         # If resource has UserAssigned identities
@@ -355,14 +807,7 @@ class AzureResourceProcessor:
                 # Link to principal
                 uami_principal_id = uami_info.get("principalId")
                 if uami_principal_id:
-                    pid_to_name = self.get_principal_names([uami_principal_id])
-                    principal_display_name = pid_to_name[uami_principal_id]
-                    self.graph.add_node(
-                        node_id=uami_principal_id,
-                        name=principal_display_name,
-                        node_type="Principal",
-                        color=RESOURCE_COLORS.get("Principal")
-                    )
+                    self.add_principal_node(uami_principal_id)
                     self.graph.add_edge(uami_id, uami_principal_id, "Linked", color="blue")
 
                 # Also fetch Federated Credentials for that UAMI
@@ -381,6 +826,7 @@ class AzureResourceProcessor:
     #########################################################################
     #  OPTIONAL: LINK PRINCIPALS & UAMIs BY THE SAME NAME
     #########################################################################
+    @profiled("link by name")
     def link_principals_uamis_by_name(self):
         principals_by_label = {}
         uamis_by_label = {}
@@ -413,6 +859,7 @@ class AzureResourceProcessor:
     #########################################################################
     #  FINAL PASS: LINK UAMI->PRINCIPAL BY REAL principalId
     #########################################################################
+    @profiled("link by principalId")
     def link_uami_principals_by_id(self):
         """
         For each User Assigned Managed Identity node, call 'az identity show --ids <uamiResourceId>'
@@ -430,157 +877,552 @@ class AzureResourceProcessor:
             return
 
         print(f"[DEBUG] Found {len(uami_ids)} UAMI nodes to process.")
-        for uami_resource_id in uami_ids:
-            cmd = (
-                f"az identity show "
-                f"--ids \"{uami_resource_id}\" "
-                f"--query principalId "
-                f"--output tsv"
-            )
-            result = self.cli.run_az_cli(cmd)
-            principal_id = None
-            if isinstance(result, str) and result.strip():
-                principal_id = result.strip()
-            elif isinstance(result, list) and result:
-                principal_id = result[0].strip()
-            elif isinstance(result, dict):
-                principal_id = result.get("principalId")
-
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            principal_ids = list(executor.map(self.fetch_uami_principal_id, uami_ids))
+        for uami_resource_id, principal_id in zip(uami_ids, principal_ids):
             if not principal_id:
                 print(f"[DEBUG] UAMI {uami_resource_id} has no principalId.")
                 continue
 
-            pid_to_name = self.get_principal_names([principal_id])
-            display_name = pid_to_name[principal_id]
-            self.graph.add_node(principal_id, display_name, "Principal", RESOURCE_COLORS.get("Principal"))
+            self.add_principal_node(principal_id)
             self.graph.add_edge(uami_resource_id, principal_id, "Linked", color="blue")
-            print(f"[DEBUG] Linked UAMI '{uami_resource_id}' -> Principal '{display_name}' ({principal_id})")
+            print(f"[DEBUG] Linked UAMI '{uami_resource_id}' -> Principal ({principal_id})")
+
+        self.resolve_pending_principals()
 
     #########################################################################
     #                           MAIN PROCESS LOGIC
     #########################################################################
+    @profiled("resource")
+    def process_resource(self, resource: dict, subscription_id: str):
+        """
+        Adds a single ARG resource row to the graph and schedules its IAM,
+        identity and Key Vault policy work.
+        """
+        resource_type = resource["type"]
+        normalized_type = resource_type.lower()
+        resource_id = resource["id"]
+        # Don't keep the raw policy list alive with the row in queued tasks
+        access_policies = resource.pop("accessPolicies", None)
+        resource_name = resource["name"]
+        rg_name = resource["resourceGroup"]
+        resource_group_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}"
+
+        # Determine canonical type and color from the precomputed index
+        matched_type = normalize_resource_type(resource_type)
+        resource_color = RESOURCE_COLORS.get(matched_type, "#1f77b4")
+
+        # Add the resource node
+        self.graph.add_node(resource_id, resource_name, matched_type, color=resource_color)
+        self.graph.add_edge(resource_group_id, resource_id, "Contains", color=resource_color)
+
+        # If it's a "Microsoft.ManagedIdentity/userAssignedIdentities" resource itself,
+        # process it with our new logic, then skip the default identity flow.
+        if normalized_type == "microsoft.managedidentity/userassignedidentities":
+            print(f"[INFO] Processing a user-assigned identity resource: {resource_name}")
+            self.prefetch_uami(resource_id)
+            self.schedule(self.process_uami_resource, resource)
+            return
+
+        # Process resource-level RBAC
+        print(f"[INFO] Processing RBAC for resource {resource_name} ({resource_type}) ...")
+        self.schedule(self.process_iam_for_scope, resource_id)
+
+        # If KeyVault, process Access Policies straight from the ARG row; vaults using
+        # Azure RBAC ignore access policies, their access is covered by the IAM pass
+        if normalized_type == "microsoft.keyvault/vaults" and not resource.get("enableRbacAuthorization"):
+            print(f"[INFO] Processing Key Vault access policies for {resource_name} ...")
+            self.process_key_vault_access_policies(resource_id, access_policies)
+
+        # Process (system/user assigned) identity blocks
+        identity_data = resource.get("identity") or {}
+        for uami_id in identity_data.get("userAssignedIdentities") or {}:
+            self.prefetch_uami(uami_id, principal_id=False)
+        self.schedule(self.process_resource_identities, resource)
+
     def process_subscription(self, subscription_id: str, subscription_name: str, resource_types: List[str]):
+        """
+        Enumerates a subscription, then waits for its per-scope tasks in the
+        background. Once they have all finished, the subscription is recorded
+        in the checkpoint journal, and its "subscription" profiler span covers
+        the enumeration and every task it scheduled.
+        """
+        unit = f"subscription:{subscription_id}"
+        if self.journal is not None and self.journal.is_done(unit):
+            print(f"[INFO] Skipping subscription {subscription_name} ({subscription_id}), already collected.")
+            return
+        start = time.perf_counter()
+        self.unit_futures.futures = futures = []
+        try:
+            self.enumerate_subscription(subscription_id, subscription_name, resource_types)
+        finally:
+            self.unit_futures.futures = None
+
+        def finished(succeeded: bool):
+            if succeeded and self.journal is not None:
+                self.journal.mark_done(unit)
+            if self.profiler.enabled:
+                self.profiler.record_span("subscription", f"/subscriptions/{subscription_id}",
+                                          start, time.perf_counter() - start)
+
+        self.when_done(futures, finished)
+
+    @profiled("enumerate subscription")
+    def enumerate_subscription(self, subscription_id: str, subscription_name: str, resource_types: List[str]):
+        """
+        Adds the subscription, its resource groups and resources, and schedules their per-scope tasks.
+        """
         print(f"\n[INFO] Processing subscription: {subscription_name} ({subscription_id}) ...")
         subscription_node_id = f"/subscriptions/{subscription_id}"
         self.graph.add_node(subscription_node_id, subscription_name, "Subscription", color=RESOURCE_COLORS.get("Subscription"))
         print("[INFO] Processing SUBSCRIPTION-level RBAC...")
-        self.process_iam_for_scope(subscription_node_id)
+        self.schedule(self.process_iam_for_scope, subscription_node_id)
 
-        print("[INFO] Fetching resources from ARG...")
-        command = (
-            'az graph query -q "Resources '
-            '| project id, name, type, resourceGroup, subscriptionId, identity" '
-            f"--subscriptions {subscription_id} --output json"
-        )
-        raw_result = self.cli.run_az_cli(command)
-        if isinstance(raw_result, dict):
-            resources = raw_result.get("data", [])
-        elif isinstance(raw_result, list):
-            resources = raw_result
-        else:
-            resources = []
-            print(f"[WARNING] Unexpected result type for subscription {subscription_id}: {type(raw_result)}")
-
-        print(f"[INFO] Found {len(resources)} resources in subscription {subscription_name}.")
-        processed_rgs = set()
-        for resource in resources:
-            if not isinstance(resource, dict):
+        subscription_args = f"--subscriptions {subscription_id}"
+        print("[INFO] Fetching resource groups from ARG...")
+        for row in self.iter_graph_query(ARG_RESOURCE_GROUPS_QUERY, subscription_args):
+            rg_name = row.get("resourceGroup") if isinstance(row, dict) else None
+            if not rg_name:
                 continue
-            resource_id = resource["id"]
-            resource_name = resource["name"]
-            resource_type = resource["type"]
-            rg_name = resource["resourceGroup"]
             resource_group_id = f"/subscriptions/{subscription_id}/resourceGroups/{rg_name}"
-
-            # Add RG node/edge (if not present)
             self.graph.add_node(resource_group_id, rg_name, "ResourceGroup", RESOURCE_COLORS.get("ResourceGroup"))
             self.graph.add_edge(subscription_node_id, resource_group_id, "Contains", color="#7f7f7f")
+            print(f"[INFO] Processing RBAC for resource group {rg_name} ...")
+            self.schedule(self.process_iam_for_scope, resource_group_id)
 
-            # Process RG-level IAM once
-            if resource_group_id not in processed_rgs:
-                print(f"[INFO] Processing RBAC for resource group {rg_name} ...")
-                self.process_iam_for_scope(resource_group_id)
-                processed_rgs.add(resource_group_id)
-
-            # If this resource is not in the resource_types we care about, skip
-            if resource_type.lower() not in [t.lower() for t in resource_types]:
+        print("[INFO] Fetching resources from ARG...")
+        wanted_types = {t.lower() for t in resource_types}
+        resource_count = 0
+        for resource in self.iter_graph_query(build_resources_query(resource_types), subscription_args):
+            if not isinstance(resource, dict):
                 continue
-
-            # Determine color from dictionary
-            normalized_type = resource_type.lower()
-            matched_type = next((k for k in RESOURCE_COLORS if k.lower() == normalized_type), resource_type)
-            resource_color = RESOURCE_COLORS.get(matched_type, "#1f77b4")
-
-            # Add the resource node
-            self.graph.add_node(resource_id, resource_name, matched_type, color=resource_color)
-            self.graph.add_edge(resource_group_id, resource_id, "Contains", color=resource_color)
-
-            # If it's a "Microsoft.ManagedIdentity/userAssignedIdentities" resource itself,
-            # process it with our new logic, then skip the default identity flow.
-            if normalized_type == "microsoft.managedidentity/userassignedidentities":
-                print(f"[INFO] Processing a user-assigned identity resource: {resource_name}")
-                self.process_uami_resource(resource)
+            # The query already filters by type; this guards against replayed or unfiltered results
+            if resource["type"].lower() not in wanted_types:
                 continue
+            resource_count += 1
+            self.process_resource(resource, subscription_id)
 
-            # Process resource-level RBAC
-            print(f"[INFO] Processing RBAC for resource {resource_name} ({resource_type}) ...")
-            self.process_iam_for_scope(resource_id)
-
-            # Process (system/user assigned) identity blocks
-            self.process_resource_identities(resource)
-
-            # If KeyVault, process Access Policies
-            if matched_type.lower() == "microsoft.keyvault/vaults":
-                print(f"[INFO] Processing Key Vault access policies for {resource_name} ...")
-                self.process_key_vault_access_policies(resource_id)
-
-        print(f"[INFO] Finished subscription: {subscription_name} ({subscription_id})")
+        print(f"[INFO] Queued {resource_count} resources in subscription {subscription_name}.")
+        print(f"[INFO] Finished enumerating subscription: {subscription_name} ({subscription_id})")
 
+    @profiled("all subscriptions")
     def process_all_subscriptions(self, resource_types: List[str]):
         subscriptions = self.cli.run_az_cli("az account list --output json")
         if not subscriptions:
             print("No subscriptions found.")
             return
         print(f"[INFO] Found {len(subscriptions)} subscriptions to process.")
-        with ThreadPoolExecutor() as executor:
-            futures = [
-                executor.submit(
-                    self.process_subscription,
-                    subscription["id"],
-                    subscription["name"],
-                    resource_types
-                )
-                for subscription in subscriptions
-            ]
-            for future in futures:
-                future.result()
+        subscription_ids = None
+        if self.shard is not None:
+            index, count, method = self.shard
+            subscriptions = shard_subscriptions(subscriptions, index, count, method)
+            subscription_ids = [sub["id"] for sub in subscriptions]
+            print(f"[INFO] Shard {index}/{count} ({method}): processing {len(subscriptions)} subscription(s).")
+            if not subscriptions:
+                return
+        if self.iam_source == "arg" and self.role_assignment_index is None:
+            self.load_role_assignment_index(subscription_ids)
+        with WorkScheduler(self.max_workers) as scheduler:
+            self.scheduler = scheduler
+            try:
+                for subscription in subscriptions:
+                    scheduler.submit(
+                        self.process_subscription,
+                        subscription["id"],
+                        subscription["name"],
+                        resource_types
+                    )
+                scheduler.wait()
+            finally:
+                self.scheduler = None
+                if self.journal is not None:
+                    self.journal.flush()
+
+        # Resolve all Principal display names collected during the scan in bulk
+        self.resolve_pending_principals()
+
+    #########################################################################
+    #                        INCREMENTAL COLLECTION
+    #########################################################################
+    def fetch_changes_since(self, since: str):
+        """
+        Asks Resource Graph what changed after 'since'. Returns:
+          changes:    {lowercased resourceId: (resourceId, latest changeType)}
+          iam_scopes: {lowercased scope} with role assignment changes in the history
+        Deleted role assignments are not reliably in the history; changed_iam_scopes()
+        finds those by diffing the graph against the current assignments.
+        """
+        latest = {}
+        iam_scopes = set()
+        print(f"[INFO] Fetching resource changes since {since} ...")
+        for change in self.iter_graph_query(build_changes_query(since)):
+            target = change.get("targetResourceId") if isinstance(change, dict) else None
+            if not target:
+                continue
+            lowered = target.rstrip("/").lower()
+            if ROLE_ASSIGNMENT_SEGMENT in lowered:
+                iam_scopes.add(lowered[:lowered.index(ROLE_ASSIGNMENT_SEGMENT)])
+                continue
+            change_time = change.get("changeTime") or ""
+            previous = latest.get(lowered)
+            if previous is None or change_time >= previous[2]:
+                latest[lowered] = (target, change.get("changeType"), change_time)
+
+        changes = {k: (target, change_type) for k, (target, change_type, _) in latest.items()}
+        print(f"[INFO] {len(changes)} changed resource(s), {len(iam_scopes)} scope(s) with role assignment changes.")
+        return changes, iam_scopes
+
+    def changed_iam_scopes(self) -> set:
+        """
+        Lowercased IDs of graphed scopes whose role assignments (principal, role)
+        differ from the IAM edges in the graph, so created, updated and deleted
+        assignments are all caught. Needs load_role_assignment_index().
+        """
+        graphed = {}
+        with self.graph.lock:
+            scopes = {n["id"].lower() for n in self.graph.nodes if n["type"] not in self.NON_IAM_SCOPE_TYPES}
+            for e in self.graph.edges:
+                if e["color"] == IAM_EDGE_COLOR:
+                    graphed.setdefault(e["target"].lower(), set()).add((e["source"], e["label"]))
+        current = {
+            scope: {(a["principalId"], a["roleDefinitionName"]) for a in assignments
+                    if a.get("principalId") and a.get("roleDefinitionName")}
+            for scope, assignments in self.role_assignment_index.items()
+        }
+        return {
+            scope for scope in (graphed.keys() | current.keys()) & scopes
+            if graphed.get(scope, set()) != current.get(scope, set())
+        }
+
+    @profiled("incremental")
+    def process_incremental(self, since: str, resource_types: List[str]):
+        """
+        Patches a graph loaded from the previous snapshot in place: removes deleted
+        subscriptions, resource groups and resources, drops the edges owned by
+        changed resources and scopes, then re-processes only those.
+        Role assignments always come from the tenant-wide ARG index here, which
+        the graph is diffed against to find the scopes to refresh.
+        """
+        subscriptions = self.cli.run_az_cli("az account list --output json")
+        if not isinstance(subscriptions, list):
+            subscriptions = []
+        known_subscriptions = {n["id"].lower() for n in self.graph.nodes if n["type"] == "Subscription"}
+        current_subscriptions = {f"/subscriptions/{sub['id']}".lower() for sub in subscriptions}
+        new_subscriptions = [
+            sub for sub in subscriptions
+            if f"/subscriptions/{sub['id']}".lower() not in known_subscriptions
+        ]
+        # An empty listing is more likely an auth problem than every subscription being gone
+        removed_subscriptions = known_subscriptions - current_subscriptions if subscriptions else set()
+
+        self.load_role_assignment_index()
+        changes, iam_scopes = self.fetch_changes_since(since)
+        iam_scopes |= self.changed_iam_scopes()
+
+        created_rgs = []
+        deleted_rgs = set()
+        deleted = set()
+        resource_ids = []
+        for lowered, (target, change_type) in changes.items():
+            segments = lowered.strip("/").split("/")
+            if len(segments) == 4 and segments[2] == "resourcegroups":
+                if change_type == "Delete":
+                    deleted_rgs.add(lowered)
+                else:
+                    created_rgs.append(target)
+            elif len(segments) >= 8 and segments[4] == "providers":
+                # A federated credential change is a change of its UAMI, which lists them
+                if len(segments) > 8 and segments[6] == "userassignedidentities":
+                    target = "/" + "/".join(target.strip("/").split("/")[:8])
+                resource_ids.append(target)
+        resource_ids = list({rid.lower(): rid for rid in resource_ids}.values())
+
+        # Current state of the changed resources; anything missing was deleted or is out of scope
+        current = {}
+        for chunk in chunk_list(resource_ids, 200):
+            for resource in self.iter_graph_query(build_resources_query(resource_types, chunk)):
+                if isinstance(resource, dict):
+                    current[resource["id"].lower()] = resource
+        deleted.update(rid.lower() for rid in resource_ids if rid.lower() not in current)
+        deleted |= deleted_rgs
+        updated = set(current)
+        # Cached UAMI lookups of changed resources predate the change
+        for namespace in ("federated_credentials", "uami_principal"):
+            self.cache.delete_many(namespace, updated)
+        refresh_iam = iam_scopes | updated | {rg.lower() for rg in created_rgs}
+        # Everything below a removed subscription or resource group goes with it
+        containers = tuple(f"{scope}/" for scope in removed_subscriptions | deleted_rgs)
+
+        def owned_node(node_id):
+            lowered = node_id.lower()
+            if lowered in deleted or lowered in removed_subscriptions:
+                return True
+            if containers and lowered.startswith(containers):
+                return True
+            parent = None
+            if "/federatedcredentials/" in lowered:
+                parent = lowered.split("/federatedcredentials/")[0]
+            elif lowered.endswith("/systemassignedidentity"):
+                parent = lowered[:-len("/systemassignedidentity")]
+            return parent is not None and (parent in deleted or parent in updated)
+
+        def owned_edge(source, target, label, color):
+            target = target.lower()
+            if color == IAM_EDGE_COLOR and target in refresh_iam:
+                return True
+            if label in KEY_VAULT_POLICY_LABELS and target in updated:
+                return True
+            # Re-added from the resource's current resource group
+            if label == "Contains" and target in updated:
+                return True
+            # Identity edges (SystemAssignedMI, Uses UAMI, Linked, Federated Credentials)
+            return source.lower() in updated
+
+        print(f"[INFO] Incremental update: {len(new_subscriptions)} new subscription(s), "
+              f"{len(removed_subscriptions)} removed subscription(s), {len(updated)} changed and "
+              f"{len(deleted)} deleted resource(s)/group(s).")
+        self.graph.remove(owned_node, owned_edge)
+
+        node_ids = {n["id"].lower(): n["id"] for n in self.graph.nodes}
+        with WorkScheduler(self.max_workers) as scheduler:
+            self.scheduler = scheduler
+            try:
+                for sub in new_subscriptions:
+                    scheduler.submit(self.process_subscription, sub["id"], sub["name"], resource_types)
+
+                for rg_id in created_rgs:
+                    segments = rg_id.strip("/").split("/")
+                    subscription_node_id = node_ids.get(f"/subscriptions/{segments[1]}".lower())
+                    if subscription_node_id is None:
+                        continue
+                    self.graph.add_node(rg_id, segments[3], "ResourceGroup", RESOURCE_COLORS.get("ResourceGroup"))
+                    self.graph.add_edge(subscription_node_id, rg_id, "Contains", color="#7f7f7f")
+                    node_ids[rg_id.lower()] = rg_id
+
+                for resource in current.values():
+                    # add_node keeps an existing node as is; a renamed resource needs its new label
+                    self.graph.update_node_label(resource["id"], resource["name"])
+                    self.process_resource(resource, resource["subscriptionId"])
+
+                # Scopes whose assignments changed but that were not re-processed above;
+                # scopes we never graphed (e.g. management groups) are skipped
+                for scope in iam_scopes - updated:
+                    if scope in node_ids:
+                        self.schedule(self.process_iam_for_scope, node_ids[scope])
+                for rg_id in created_rgs:
+                    self.schedule(self.process_iam_for_scope, rg_id)
+                scheduler.wait()
+            finally:
+                self.scheduler = None
+
+        self.prune_orphan_principals()
+        self.resolve_pending_principals()
+
+    def prune_orphan_principals(self):
+        """
+        Drops Principal nodes that lost all of their edges.
+        """
+        with self.graph.lock:
+            connected = {e["source"] for e in self.graph.edges} | {e["target"] for e in self.graph.edges}
+            orphans = {
+                n["id"] for n in self.graph.nodes
+                if n["type"] == "Principal" and n["id"] not in connected
+            }
+        if orphans:
+            self.graph.remove(lambda node_id: node_id in orphans, lambda *edge: False)
 
 
 # --------------------------- MAIN EXECUTION --------------------------
 if __name__ == "__main__":
-    RESOURCE_TYPES = [
-        "Microsoft.Compute/virtualMachines",
-        "Microsoft.Compute/virtualMachineScaleSets",
-        "Microsoft.Storage/storageAccounts",
-        "Microsoft.KeyVault/vaults",
-        "Microsoft.Web/sites",
-        "Microsoft.ManagedIdentity/userAssignedIdentities",
-        "Microsoft.ContainerService/managedClusters",
-        "Microsoft.Automation/automationAccounts"
-    ]
-
-    graph = AzureResourceGraph()
-    cli = AzureCLI()
-    processor = AzureResourceProcessor(graph, cli)
-
-    # Gather all resources and build the graph
-    processor.process_all_subscriptions(RESOURCE_TYPES)
-
-    # OPTIONAL: link Principals & UAMIs by same display label
-    processor.link_principals_uamis_by_name()
-
-    # DEFINITIVE: link UAMI -> Principal by principalId from 'az identity show'
-    processor.link_uami_principals_by_id()
-
-    # Write final JSON
-    processor.graph.write_to_file("output_azure_resource_data.json")
+    parser = argparse.ArgumentParser(description="Azure Resource Graph (ARG) collector")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR,
+                        help="Directory of the persistent principal/identity cache")
+    parser.add_argument("--cache-mode", choices=PersistentCache.MODES, default="use",
+                        help="'use' the cache, 'refresh' it with fresh lookups, or 'bypass' it entirely")
+    parser.add_argument("--cache-max-entries", type=int, default=DEFAULT_CACHE_MAX_ENTRIES,
+                        help="Maximum number of cache entries kept on disk")
+    parser.add_argument("--iam-source", choices=AzureResourceProcessor.IAM_SOURCES, default="scope",
+                        help="'scope' lists role assignments per scope, "
+                             "'arg' pulls them all with one Resource Graph query")
+    parser.add_argument("--backend", choices=AzureCLI.BACKENDS, default="subprocess",
+                        help="How az commands are executed: spawn 'az', call the REST APIs "
+                             "in-process, or replay recorded responses")
+    parser.add_argument("--replay-dir", default="az_recordings",
+                        help="Directory of recorded responses used by '--backend replay'")
+    parser.add_argument("--record", action="store_true",
+                        help="Save every response into --replay-dir for later offline replay")
+    parser.add_argument("--arg-page-size", type=int, default=ARG_PAGE_SIZE_MAX,
+                        help=f"Rows per Resource Graph page (1-{ARG_PAGE_SIZE_MAX})")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_WORKERS,
+                        help="Maximum number of subscription/RG/resource tasks run in parallel")
+    parser.add_argument("--output", default="output_azure_resource_data.json",
+                        help="Graph JSON file to write (and to patch with --incremental)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Load the previous --output snapshot and only re-process what changed since")
+    parser.add_argument("--output-format", choices=(*GraphWriter.FORMATS, SQLiteGraphWriter.FORMAT), default="json",
+                        help="'json' (indented), 'compact' (no whitespace), 'ndjson' (streamed to disk while "
+                             "collecting) or 'sqlite' (indexed database, streamed while collecting)")
+    parser.add_argument("--compress", choices=GraphWriter.COMPRESSIONS,
+                        help="Compress the output file (zstd needs the 'zstandard' package)")
+    parser.add_argument("--string-table", action="store_true",
+                        help="Store repeated types, colors and edge labels once and reference them by index")
+    parser.add_argument("--parquet", metavar="DIRECTORY",
+                        help="Also export nodes.parquet and edges.parquet to this directory (needs pyarrow)")
+    parser.add_argument("--arm-batch", action="store_true",
+                        help="Send per-UAMI ARM reads (federated credentials, identity show) "
+                             "as ARM /batch requests")
+    parser.add_argument("--rate-limits", default="",
+                        help="Override per-family request rates as family=rate[:burst], e.g. 'arm=10,arg=2:10' "
+                             f"(families: {', '.join(RATE_LIMITS)})")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help="Retries for a throttled az call before its result is given up")
+    parser.add_argument("--no-rate-governor", action="store_true",
+                        help="Send az calls without per-family rate limits and without retrying "
+                             "throttled calls (throttled ARM /batch requests are still retried)")
+    parser.add_argument("--checkpoint", nargs="?", const="", metavar="JOURNAL",
+                        help="Journal finished scopes and the partial graph to JOURNAL "
+                             "(default: <output>.journal) so a failed run can be resumed")
+    parser.add_argument("--checkpoint-interval", type=float, default=DEFAULT_CHECKPOINT_INTERVAL,
+                        help="Seconds between checkpoint journal flushes to disk")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue a failed run from its checkpoint journal, skipping finished work")
+    parser.add_argument("--shard", type=parse_shard, metavar="INDEX/COUNT",
+                        help="Only collect shard INDEX of COUNT (e.g. 0/4) of the subscriptions; "
+                             "the global linking passes are left to --merge")
+    parser.add_argument("--shard-by", choices=SHARD_METHODS, default="hash",
+                        help="Assign subscriptions to shards by a stable 'hash' of their ID, "
+                             "or deal them out by 'index' in ID order")
+    parser.add_argument("--merge", nargs="+", metavar="SHARD_OUTPUT",
+                        help="Merge shard outputs into --output and run the global linking passes once")
+    parser.add_argument("--layout", action="store_true",
+                        help="Compute a ForceAtlas2 layout (needs numpy) and store x/y on every node, "
+                             "so the viewer skips its own layout")
+    parser.add_argument("--layout-iterations", type=int, default=DEFAULT_LAYOUT_ITERATIONS,
+                        help="ForceAtlas2 iterations for --layout")
+    parser.add_argument("--profile", nargs="?", const="arg_profile", metavar="PREFIX",
+                        help="Record timings; writes PREFIX.json and PREFIX.trace.json (Chrome trace) "
+                             "and prints a summary (default prefix: arg_profile)")
+    args = parser.parse_args()
+    if args.incremental and (args.resume or args.checkpoint is not None):
+        parser.error("--checkpoint and --resume only apply to full collections, not --incremental")
+    if args.merge and (args.shard or args.incremental or args.resume or args.checkpoint is not None):
+        parser.error("--merge cannot be combined with --shard, --incremental, --checkpoint or --resume")
+    if args.shard and args.incremental:
+        parser.error("--shard only applies to full collections; --incremental the merged output instead")
+    if args.output_format == SQLiteGraphWriter.FORMAT and (args.compress or args.string_table):
+        parser.error("--compress and --string-table do not apply to --output-format sqlite")
+
+    profiler = Profiler(enabled=bool(args.profile))
+    try:
+        rate_limits = RateGovernor.parse_limits(args.rate_limits)
+    except ValueError as e:
+        parser.error(str(e))
+    governor = None
+    if not args.no_rate_governor:
+        governor = RateGovernor(rate_limits, max_retries=args.max_retries,
+                                initial_concurrency=min(args.concurrency, 8),
+                                max_concurrency=max(args.concurrency, 8))
+
+    if args.backend == "rest":
+        backend = RestBackend()
+    elif args.backend == "replay":
+        backend = ReplayBackend(args.replay_dir)
+    else:
+        backend = SubprocessBackend()
+    if args.record and args.backend != "replay":
+        backend = RecordingBackend(backend, args.replay_dir)
+
+    started_at = utc_timestamp()
+    since = None
+    journal = None
+    journal_path = args.checkpoint or f"{args.output}.journal"
+    if args.resume and os.path.exists(journal_path):
+        graph, journal = CheckpointJournal.resume(journal_path, args.checkpoint_interval)
+    elif args.resume or args.checkpoint is not None:
+        if args.resume:
+            print(f"[WARNING] No checkpoint journal at {journal_path}; starting a new run.")
+        graph = AzureResourceGraph()
+        journal = CheckpointJournal(journal_path, args.checkpoint_interval)
+    elif args.incremental and os.path.exists(args.output):
+        graph = AzureResourceGraph.load_from_file(args.output)
+        since = graph.metadata.get("collected_at")
+        if not within_change_retention(since):
+            print(f"[WARNING] Snapshot is missing or older than the change history ({since}); "
+                  f"running a full collection.")
+            graph = AzureResourceGraph()
+            since = None
+    else:
+        graph = AzureResourceGraph()
+    cli = AzureCLI(backend, profiler, governor)
+    if args.output_format == SQLiteGraphWriter.FORMAT:
+        writer = SQLiteGraphWriter(args.output)
+    else:
+        writer = GraphWriter(args.output, args.output_format, args.compress, args.string_table)
+    if writer.streaming:
+        writer.attach(graph)
+    if journal is not None:
+        journal.attach(graph)
+    cache = PersistentCache(args.cache_dir, args.cache_mode, args.cache_max_entries, profiler)
+    processor = AzureResourceProcessor(graph, cli, cache, iam_source=args.iam_source,
+                                       arg_page_size=args.arg_page_size,
+                                       max_workers=args.concurrency,
+                                       arm_batch=args.arm_batch,
+                                       profiler=profiler,
+                                       journal=journal,
+                                       shard=args.shard and (*args.shard, args.shard_by))
+    try:
+        if journal is not None and journal.resumed:
+            processor.queue_unresolved_principals()
+
+        # Gather all resources and build the graph, only patch what changed, or merge shards
+        if args.merge:
+            shard_metadata = [graph.merge_from_file(filename) for filename in args.merge]
+            shards = {meta["shard"] for meta in shard_metadata if meta.get("shard")}
+            counts = {int(shard.split("/")[1]) for shard in shards}
+            if len(counts) > 1 or any(f"{i}/{count}" not in shards for count in counts for i in range(count)):
+                print(f"[WARNING] Merging an incomplete or mixed set of shards: {sorted(shards)}")
+            # The oldest shard bounds what a later --incremental run has to catch up on
+            collected = [meta["collected_at"] for meta in shard_metadata if meta.get("collected_at")]
+            started_at = min(collected, default=started_at)
+        elif since:
+            processor.process_incremental(since, RESOURCE_TYPES)
+        else:
+            processor.process_all_subscriptions(RESOURCE_TYPES)
+
+        if args.shard:
+            # Principals and UAMIs span subscriptions; they are linked once, after --merge
+            processor.graph.metadata["shard"] = f"{args.shard[0]}/{args.shard[1]}"
+        else:
+            # OPTIONAL: link Principals & UAMIs by same display label
+            processor.link_principals_uamis_by_name()
+
+            # DEFINITIVE: link UAMI -> Principal by principalId from 'az identity show'
+            processor.link_uami_principals_by_id()
+
+            # Shards are laid out once, after --merge
+            if args.layout:
+                try:
+                    forceatlas2_layout(processor.graph, args.layout_iterations)
+                except RuntimeError as e:
+                    print(f"[WARNING] Skipping the layout: {e}")
+
+        # Write final JSON
+        processor.graph.metadata["collected_at"] = started_at
+        writer.write(processor.graph)
+        if args.parquet:
+            try:
+                write_parquet(processor.graph, args.parquet)
+            except RuntimeError as e:
+                print(f"[WARNING] Skipping the Parquet export: {e}")
+        if journal is not None:
+            journal.discard()
+    finally:
+        # Flushes and trims the persistent cache even when the collection fails
+        processor.close()
+        cache.close()
+        cli.close()
+    if governor is not None:
+        governor.print_summary()
+
+    if args.profile:
+        Profiler.print_summary(profiler.write(args.profile))
@@ -0,0 +1,152 @@
+"""
+Offline scale benchmark for the collector.
+
+Runs process_all_subscriptions (plus the final linking passes and the output
+write) against synthetic tenants of increasing size, served by the fake az
+backend in synthetic_tenant.py, and reports wall time, az calls, throttled
+calls, peak RSS and output size per scale. Each scale runs in its own process
+so peak RSS is not shared between scales.
+
+    python3 benchmarks/collector_scale.py --scales small,medium --latency-ms 20 --throttle-rate 0.01
+    python3 benchmarks/collector_scale.py --scales large --concurrency 32 --arm-batch --results results.json
+    python3 benchmarks/collector_scale.py --scales medium --throttle-rate 0.02 --governor
+"""
+import argparse
+import contextlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from az_cli import AzureCLI  # noqa: E402
+from azure_resource_graph_collector import RESOURCE_TYPES, AzureResourceProcessor  # noqa: E402
+from graph_model import AzureResourceGraph  # noqa: E402
+from rate_governor import RateGovernor  # noqa: E402
+from synthetic_tenant import FakeAzBackend, SyntheticTenant  # noqa: E402
+from work_scheduler import DEFAULT_MAX_WORKERS  # noqa: E402
+
+# SyntheticTenant parameters per scale
+SCALES = {
+    "small": dict(subscriptions=1, resource_groups=10, resources_per_type=20, uamis=10,
+                  principals=200, role_assignments=1000, vault_policies=5),
+    "medium": dict(subscriptions=5, resource_groups=20, resources_per_type=100, uamis=50,
+                   principals=2000, role_assignments=10000, vault_policies=10),
+    "large": dict(subscriptions=20, resource_groups=50, resources_per_type=500, uamis=200,
+                  principals=20000, role_assignments=100000, vault_policies=20),
+}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_one(spec: dict) -> dict:
+    """
+    Collects one synthetic tenant and returns its measurements.
+    """
+    tenant = SyntheticTenant(seed=spec["seed"], **SCALES[spec["scale"]])
+    backend = FakeAzBackend(tenant, latency_ms=spec["latency_ms"], jitter=spec["jitter"],
+                            throttle_rate=spec["throttle_rate"], retry_after=spec["retry_after"],
+                            seed=spec["seed"])
+    baseline_rss = peak_rss_mb()
+    output = os.path.join(tempfile.mkdtemp(prefix="arg_bench_"), "graph.json")
+
+    governor = RateGovernor(max_concurrency=max(spec["concurrency"], 8)) if spec["governor"] else None
+    cli = AzureCLI(backend, governor=governor)
+    graph = AzureResourceGraph()
+    processor = AzureResourceProcessor(graph, cli, iam_source=spec["iam_source"],
+                                       max_workers=spec["concurrency"], arm_batch=spec["arm_batch"])
+    started = time.perf_counter()
+    # The collector logs every step; keep the benchmark output readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        processor.process_all_subscriptions(RESOURCE_TYPES)
+        processor.link_principals_uamis_by_name()
+        processor.link_uami_principals_by_id()
+        collected = time.perf_counter()
+        graph.write_to_file(output, fmt=spec["output_format"])
+        processor.close()
+    finished = time.perf_counter()
+
+    output_size = os.path.getsize(output)
+    os.remove(output)
+    os.rmdir(os.path.dirname(output))
+    return {
+        "scale": spec["scale"],
+        "tenant": tenant.summary(),
+        "nodes": graph.node_count,
+        "edges": graph.edge_count,
+        "wall_seconds": round(finished - started, 3),
+        "collect_seconds": round(collected - started, 3),
+        "az_calls": sum(backend.calls.values()),
+        "az_calls_by_family": dict(backend.calls.most_common()),
+        "throttled_calls": backend.throttled,
+        "retries": governor.retries if governor else 0,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "output_bytes": output_size,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the collector against synthetic tenants.")
+    parser.add_argument("--scales", default="small,medium",
+                        help=f"Comma-separated scales to run ({', '.join(SCALES)})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Mean latency of every fake az call")
+    parser.add_argument("--jitter", type=float, default=0.25, help="Latency jitter as a fraction of the mean")
+    parser.add_argument("--throttle-rate", type=float, default=0.0,
+                        help="Share of az calls that fail with an injected 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds of injected 429s")
+    parser.add_argument("--governor", action="store_true",
+                        help="Run az calls through the collector's rate governor (retries throttled calls)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--iam-source", choices=("scope", "arg"), default="scope")
+    parser.add_argument("--arm-batch", action="store_true")
+    parser.add_argument("--output-format", choices=("json", "compact", "ndjson"), default="json")
+    parser.add_argument("--results", help="Also write the measurements to this JSON file")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(json.loads(args.run_one))))
+        return
+
+    results = []
+    print(f"{'scale':<8} {'resources':>9} {'nodes':>8} {'edges':>9} {'wall s':>8} {'az calls':>9} "
+          f"{'429s':>6} {'peak RSS MB':>11} {'output MB':>9}")
+    for scale in args.scales.split(","):
+        if scale not in SCALES:
+            parser.error(f"Unknown scale '{scale}', expected one of {', '.join(SCALES)}")
+        spec = {
+            "scale": scale, "seed": args.seed, "latency_ms": args.latency_ms, "jitter": args.jitter,
+            "throttle_rate": args.throttle_rate, "retry_after": args.retry_after,
+            "governor": args.governor, "concurrency": args.concurrency,
+            "iam_source": args.iam_source, "arm_batch": args.arm_batch, "output_format": args.output_format,
+        }
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", json.dumps(spec)],
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print(f"[ERROR] Scale '{scale}' failed:\n{child.stderr}")
+            continue
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{scale:<8} {result['tenant']['resources']:>9} {result['nodes']:>8} {result['edges']:>9} "
+              f"{result['wall_seconds']:>8.2f} {result['az_calls']:>9} {result['throttled_calls']:>6} "
+              f"{result['peak_rss_mb']:>11.1f} {result['output_bytes'] / 1e6:>9.2f}")
+
+    if args.results:
+        with open(args.results, "w") as file:
+            json.dump({"settings": vars(args), "results": results}, file, indent=2)
+        print(f"[INFO] Results written to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Memory benchmark for AzureResourceGraph storage.
+
+Builds the same synthetic graph (resources, principals, role-assignment edges)
+with the compact interned storage and with the original dict/set storage, and
+reports traced memory and build time for each.
+
+    python3 benchmarks/graph_memory.py --resources 100000 --principals 20000 --edges-per-resource 10
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from azure_resource_graph_collector import RESOURCE_TYPES  # noqa: E402
+from graph_model import AzureResourceGraph, RESOURCE_COLORS  # noqa: E402
+
+
+class LegacyDictGraph:
+    """
+    The storage AzureResourceGraph used before interning: one dict per node and
+    edge, plus a set of node IDs and a set of (source, target, label) tuples.
+    """
+    def __init__(self):
+        self.nodes = []
+        self.edges = []
+        self.node_set = set()
+        self.edge_set = set()
+
+    def add_node(self, node_id, name, node_type, color=None):
+        if node_id not in self.node_set:
+            self.node_set.add(node_id)
+            color = color or RESOURCE_COLORS.get(node_type, "#1f77b4")
+            self.nodes.append({"id": node_id, "label": name, "type": node_type, "color": color})
+
+    def add_edge(self, source, target, label, color="black"):
+        edge_key = (source, target, label)
+        if edge_key not in self.edge_set:
+            self.edge_set.add(edge_key)
+            self.edges.append({"source": source, "target": target, "label": label, "color": color})
+
+
+ROLES = ["Owner", "Contributor", "Reader", "User Access Administrator", "Key Vault Secrets User"]
+
+
+def synthetic_records(resources: int, principals: int, edges_per_resource: int, seed: int = 7):
+    """
+    Yields ("node", args) / ("edge", args) tuples. Strings are rebuilt for every
+    record, as they are when parsed from az output, so interning has real work to do.
+    """
+    rng = random.Random(seed)
+    for p in range(principals):
+        yield "node", (f"{p:08d}-0000-4000-8000-{p:012d}", f"principal-{p}", "Principal")
+    for r in range(resources):
+        resource_type = RESOURCE_TYPES[r % len(RESOURCE_TYPES)]
+        sub, rg = r % 50, r % 2000
+        resource_id = (f"/subscriptions/{sub:08d}-1111-4111-8111-{sub:012d}/resourceGroups/rg-{rg}"
+                       f"/providers/{resource_type}/res-{r}")
+        yield "node", (resource_id, f"res-{r}", resource_type)
+        for _ in range(edges_per_resource):
+            p = rng.randrange(principals)
+            yield "edge", (f"{p:08d}-0000-4000-8000-{p:012d}", resource_id, rng.choice(ROLES), "#d62728")
+
+
+def measure(graph_cls, args):
+    tracemalloc.start()
+    started = time.perf_counter()
+    graph = graph_cls()
+    for kind, record in synthetic_records(args.resources, args.principals, args.edges_per_resource):
+        if kind == "node":
+            graph.add_node(*record)
+        else:
+            graph.add_edge(*record)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return graph, elapsed, current, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=50000)
+    parser.add_argument("--principals", type=int, default=10000)
+    parser.add_argument("--edges-per-resource", type=int, default=8)
+    args = parser.parse_args()
+
+    mib = 1024 * 1024
+    results = {}
+    for name, graph_cls in (("legacy dicts", LegacyDictGraph), ("compact", AzureResourceGraph)):
+        graph, elapsed, current, peak = measure(graph_cls, args)
+        results[name] = current
+        print(f"{name:>12}: {len(graph.nodes):>9} nodes {len(graph.edges):>10} edges  "
+              f"retained {current / mib:8.1f} MiB  peak {peak / mib:8.1f} MiB  build {elapsed:6.2f}s")
+        del graph
+    print(f"Compact storage retains {results['compact'] / results['legacy dicts']:.0%} of the legacy memory.")
+
+
+if __name__ == "__main__":
+    main()
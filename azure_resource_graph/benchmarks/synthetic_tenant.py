@@ -0,0 +1,343 @@
+"""
+Synthetic Azure tenant and a fake 'az' backend serving it.
+
+SyntheticTenant generates subscriptions, resource groups, resources by type
+(with system- and user-assigned identities), UAMIs with federated credentials,
+directory principals, role assignments and Key Vault access policies from a
+seed. FakeAzBackend plugs in behind AzureCLI and answers every command the
+collector issues from that tenant, with configurable latency and injected
+429 throttling, so collector runs can be measured without a live tenant.
+
+    from synthetic_tenant import SyntheticTenant, FakeAzBackend
+    tenant = SyntheticTenant(subscriptions=2, resource_groups=10, resources_per_type=50)
+    cli = AzureCLI(FakeAzBackend(tenant, latency_ms=20, throttle_rate=0.01))
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from az_cli import AzureCLIBackend, RestBackend  # noqa: E402
+from az_command import CALL_INFO, command_family, flatten_arm_resource, parse_az_command  # noqa: E402
+from azure_resource_graph_collector import (  # noqa: E402
+    ARG_RESOURCE_GROUPS_QUERY, ARG_ROLE_ASSIGNMENTS_QUERY, ARG_ROLE_DEFINITIONS_QUERY, RESOURCE_TYPES, utc_timestamp,
+)
+from graph_model import normalize_resource_type  # noqa: E402
+
+UAMI_TYPE = "Microsoft.ManagedIdentity/userAssignedIdentities"
+VAULT_TYPE = "Microsoft.KeyVault/vaults"
+ROLE_NAMES = ["Owner", "Contributor", "Reader", "User Access Administrator", "Key Vault Secrets User",
+              "Storage Blob Data Reader", "Website Contributor", "Virtual Machine Contributor"]
+PRINCIPAL_TYPES = ["user", "servicePrincipal", "group"]
+
+
+class SyntheticTenant:
+    """
+    A deterministic, in-memory tenant generated from "seed":
+      subscriptions          number of subscriptions
+      resource_groups        resource groups per subscription
+      resources_per_type     resources of each type in RESOURCE_TYPES, per subscription
+                             (an int, or a {type: count} dict)
+      uamis                  user-assigned identities per subscription
+      principals             users/service principals/groups in the directory (managed
+                             identities add their own service principals)
+      role_assignments       total assignments spread over subscription, RG and resource scopes
+      vault_policies         access policies per Key Vault
+      identity_ratio         share of other resources (not vaults or UAMIs) with a managed identity
+    """
+    def __init__(self, subscriptions: int = 1, resource_groups: int = 5, resources_per_type=10,
+                 uamis: int = 5, principals: int = 100, role_assignments: int = 500,
+                 vault_policies: int = 5, identity_ratio: float = 0.5, seed: int = 0):
+        self.rng = random.Random(seed)
+        if isinstance(resources_per_type, int):
+            resources_per_type = {t: resources_per_type for t in RESOURCE_TYPES if t != UAMI_TYPE}
+
+        self.subscriptions = [{"id": self._guid(), "name": f"sub-{i:03d}"} for i in range(subscriptions)]
+        self.resource_groups = {
+            sub["id"]: [f"rg-{i:04d}" for i in range(resource_groups)] for sub in self.subscriptions
+        }
+        self.principals = {}
+        for i in range(principals):
+            self._new_principal(PRINCIPAL_TYPES[i % len(PRINCIPAL_TYPES)])
+        directory = list(self.principals)
+
+        self.resources = {}            # subscription -> [ARG row]
+        self.federated_credentials = {}  # lowercased UAMI id -> [credential]
+        self.uami_principals = {}        # lowercased UAMI id -> principalId
+        self.access_policies = {}        # lowercased vault id -> [policy]
+        for sub in self.subscriptions:
+            rows = self.resources[sub["id"]] = []
+            uami_ids = []
+            for i in range(uamis):
+                row = self._resource(sub["id"], UAMI_TYPE, f"uami-{i:05d}")
+                principal_id = self._new_principal("servicePrincipal", row["name"])
+                self.uami_principals[row["id"].lower()] = principal_id
+                self.federated_credentials[row["id"].lower()] = [
+                    {"name": f"fc-{j}", "issuer": "https://token.actions.githubusercontent.com",
+                     "subject": f"repo:org/{row['name']}:ref:refs/heads/main", "audiences": ["api://AzureADTokenExchange"]}
+                    for j in range(self.rng.randint(0, 2))
+                ]
+                rows.append(row)
+                uami_ids.append((row["id"], principal_id))
+            for resource_type, count in resources_per_type.items():
+                for i in range(count):
+                    row = self._resource(sub["id"], resource_type, f"{resource_type.split('/')[-1].lower()}-{i:05d}")
+                    if resource_type == VAULT_TYPE:
+                        row["enableRbacAuthorization"] = self.rng.random() < 0.2
+                        policies = [
+                            {"objectId": pid, "tenantId": self.tenant_id,
+                             "permissions": {"secrets": ["get", "list"], "keys": [], "certificates": []}}
+                            for pid in self.rng.sample(directory, min(vault_policies, len(directory)))
+                        ]
+                        self.access_policies[row["id"].lower()] = policies
+                        row["accessPolicies"] = None if row["enableRbacAuthorization"] else policies
+                    elif self.rng.random() < identity_ratio:
+                        row["identity"] = self._identity(row["name"], uami_ids)
+                    rows.append(row)
+
+        scopes = []
+        for sub in self.subscriptions:
+            scopes.append(f"/subscriptions/{sub['id']}")
+            scopes.extend(f"/subscriptions/{sub['id']}/resourceGroups/{rg}" for rg in self.resource_groups[sub["id"]])
+            scopes.extend(row["id"] for row in self.resources[sub["id"]])
+        self.role_definitions = {name: self._guid() for name in ROLE_NAMES}
+        self.role_assignments = {}     # lowercased scope -> [assignment]
+        assignees = list(self.principals)
+        for _ in range(role_assignments):
+            scope = self.rng.choice(scopes)
+            self.role_assignments.setdefault(scope.lower(), []).append({
+                "principalId": self.rng.choice(assignees),
+                "roleDefinitionName": self.rng.choice(ROLE_NAMES),
+                "scope": scope,
+            })
+        # Change history served to change queries; see record_change()
+        self.changes = []
+
+    @property
+    def tenant_id(self):
+        return "00000000-0000-0000-0000-000000000000"
+
+    def _guid(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def _new_principal(self, principal_type: str, name: str = None) -> str:
+        principal_id = self._guid()
+        self.principals[principal_id] = {
+            "id": principal_id,
+            "@odata.type": f"#microsoft.graph.{principal_type}",
+            "displayName": name or f"{principal_type}-{len(self.principals):06d}",
+        }
+        return principal_id
+
+    def _resource(self, subscription_id: str, resource_type: str, name: str):
+        rg = self.rng.choice(self.resource_groups[subscription_id])
+        return {
+            "id": f"/subscriptions/{subscription_id}/resourceGroups/{rg}/providers/{resource_type}/{name}",
+            "name": name,
+            "type": resource_type.lower(),
+            "resourceGroup": rg,
+            "subscriptionId": subscription_id,
+            "identity": None,
+        }
+
+    def _identity(self, name: str, uami_ids):
+        identity = {"type": "SystemAssigned", "principalId": self._new_principal("servicePrincipal", name),
+                    "tenantId": self.tenant_id}
+        if uami_ids and self.rng.random() < 0.5:
+            assigned = self.rng.sample(uami_ids, min(len(uami_ids), self.rng.randint(1, 2)))
+            identity["type"] = "SystemAssigned, UserAssigned"
+            identity["userAssignedIdentities"] = {
+                uami_id: {"principalId": principal_id, "clientId": self._guid()} for uami_id, principal_id in assigned
+            }
+        return identity
+
+    def record_change(self, target_id: str, change_type: str, change_time: str = None):
+        """
+        Adds an entry to the change history, for tests that mutate the tenant.
+        """
+        self.changes.append({"targetResourceId": target_id, "changeType": change_type,
+                             "changeTime": change_time or utc_timestamp()})
+
+    def summary(self):
+        return {
+            "subscriptions": len(self.subscriptions),
+            "resource_groups": sum(len(rgs) for rgs in self.resource_groups.values()),
+            "resources": sum(len(rows) for rows in self.resources.values()),
+            "uamis": len(self.uami_principals),
+            "principals": len(self.principals),
+            "role_assignments": sum(len(a) for a in self.role_assignments.values()),
+            "vault_policies": sum(len(p) for p in self.access_policies.values()),
+        }
+
+
+class FakeAzBackend(AzureCLIBackend):
+    """
+    Answers collector commands from a SyntheticTenant. Every call sleeps for
+    'latency_ms' (+/- 'jitter' as a fraction), and a 'throttle_rate' share of
+    calls fail the way the real az CLI does on HTTP 429, asking to retry
+    after 'retry_after' seconds.
+    Results go through a JSON round trip, like parsing az output.
+    """
+    name = "fake"
+
+    def __init__(self, tenant: SyntheticTenant, latency_ms: float = 0, jitter: float = 0.25,
+                 throttle_rate: float = 0, retry_after: int = 1, seed: int = 0):
+        self.tenant = tenant
+        self.latency = latency_ms / 1000
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.throttled = 0
+        self.handlers = {
+            "account list": self._account_list,
+            "graph query": self._graph_query,
+            "role assignment list": self._role_assignment_list,
+            "identity show": self._identity_show,
+            "identity federated-credential list": self._federated_credential_list,
+            "ad user show": self._principal_show,
+            "ad sp show": self._principal_show,
+            "ad group show": self._principal_show,
+            "rest": self._rest,
+        }
+
+    def run(self, command: str):
+        group, options = parse_az_command(command)
+        with self.lock:
+            self.calls[command_family(command)] += 1
+            throttle = self.rng.random() < self.throttle_rate
+            delay = self.latency * (1 + self.jitter * (2 * self.rng.random() - 1))
+        if delay > 0:
+            time.sleep(delay)
+        if throttle:
+            with self.lock:
+                self.throttled += 1
+            CALL_INFO.failed = True
+            CALL_INFO.throttled = True
+            CALL_INFO.retry_after = self.retry_after
+            print(f"[ERROR] Command failed (1): {command}\n"
+                  f"ERROR: (TooManyRequests) Too many requests. Retry after {self.retry_after} second(s).")
+            return []
+        handler = self.handlers.get(group)
+        if handler is None:
+            CALL_INFO.failed = True
+            print(f"[ERROR] Fake az has no handler for: {command}")
+            return []
+        output = json.dumps(handler(options))
+        CALL_INFO.bytes = len(output)
+        return RestBackend._format(json.loads(output), options)
+
+    ##########################################################################
+    #  Command handlers
+    ##########################################################################
+    def _account_list(self, options):
+        return [dict(sub, state="Enabled", tenantId=self.tenant.tenant_id) for sub in self.tenant.subscriptions]
+
+    def _graph_query(self, options):
+        query = options.get("q", "")
+        subscriptions = options.get("subscriptions")
+        subscriptions = subscriptions.split() if isinstance(subscriptions, str) else list(self.tenant.resources)
+        if query == ARG_RESOURCE_GROUPS_QUERY:
+            rows = [{"resourceGroup": rg} for sub in subscriptions for rg in self.tenant.resource_groups.get(sub, [])]
+        elif query == ARG_ROLE_DEFINITIONS_QUERY:
+            rows = [
+                {"id": f"/providers/Microsoft.Authorization/roleDefinitions/{guid}", "roleName": name}
+                for name, guid in self.tenant.role_definitions.items()
+            ]
+        elif query == ARG_ROLE_ASSIGNMENTS_QUERY:
+            rows = [
+                {"scope": a["scope"], "principalId": a["principalId"],
+                 "roleDefinitionId": f"/subscriptions/{a['scope'].split('/')[2]}/providers/"
+                                     f"Microsoft.Authorization/roleDefinitions/"
+                                     f"{self.tenant.role_definitions[a['roleDefinitionName']]}"}
+                for assignments in self.tenant.role_assignments.values() for a in assignments
+            ]
+        elif "type in~" in query:
+            types = {normalize_resource_type(t) for t in re.findall(r"'([^']+/[^']+)'", query.split("| where id")[0])}
+            ids = None
+            if "where id in~" in query:
+                ids = {i.lower() for i in re.findall(r"'(/subscriptions/[^']+)'", query)}
+            rows = [
+                row for sub in subscriptions for row in self.tenant.resources.get(sub, [])
+                if normalize_resource_type(row["type"]) in types and (ids is None or row["id"].lower() in ids)
+            ]
+        elif query.startswith("union resourcechanges"):
+            since = re.search(r"> datetime\(([^)]+)\)", query).group(1)
+            rows = [change for change in self.tenant.changes if change["changeTime"] > since]
+        else:
+            rows = []
+        first = int(options.get("first", 100))
+        offset = int(options["skip-token"]) if isinstance(options.get("skip-token"), str) else 0
+        page = rows[offset:offset + first]
+        next_offset = offset + first
+        return {
+            "count": len(page),
+            "data": page,
+            "skip_token": str(next_offset) if next_offset < len(rows) else None,
+            "total_records": len(rows),
+        }
+
+    def _role_assignment_list(self, options):
+        return self.tenant.role_assignments.get(options["scope"].rstrip("/").lower(), [])
+
+    def _identity(self, uami_id):
+        principal_id = self.tenant.uami_principals.get(uami_id.lower())
+        if principal_id is None:
+            return None
+        return {"id": uami_id, "name": uami_id.rsplit("/", 1)[-1], "type": UAMI_TYPE,
+                "properties": {"principalId": principal_id, "tenantId": self.tenant.tenant_id}}
+
+    def _identity_show(self, options):
+        identity = self._identity(options["ids"])
+        return flatten_arm_resource(identity) if identity else None
+
+    def _federated_credential_list(self, options):
+        uami_id = (f"/subscriptions/{options['subscription']}/resourceGroups/{options['resource-group']}"
+                   f"/providers/{UAMI_TYPE}/{options['identity-name']}")
+        return self.tenant.federated_credentials.get(uami_id.lower(), [])
+
+    def _principal_show(self, options):
+        return self.tenant.principals.get(options.get("id") or options.get("group"))
+
+    def _rest(self, options):
+        body = options.get("body")
+        if isinstance(body, str) and body.startswith("@"):
+            with open(body[1:]) as file:
+                body = file.read()
+        body = json.loads(body) if isinstance(body, str) else {}
+        path = urlsplit(options["url"]).path.rstrip("/")
+        if path.endswith("/getByIds"):
+            return {"value": [self.tenant.principals[p] for p in body.get("ids", []) if p in self.tenant.principals]}
+        if path.endswith("/batch"):
+            return {"responses": [
+                dict(self._arm_get(request["url"]), name=request.get("name")) for request in body.get("requests", [])
+            ]}
+        return self._arm_get(options["url"]).get("content")
+
+    def _arm_get(self, url):
+        path = urlsplit(url).path.rstrip("/")
+        if path.lower().endswith("/federatedidentitycredentials"):
+            uami_id = path.rsplit("/", 1)[0]
+            credentials = self.tenant.federated_credentials.get(uami_id.lower())
+            if credentials is not None:
+                content = {"value": [
+                    {"id": f"{uami_id}/federatedIdentityCredentials/{fc['name']}", "name": fc["name"],
+                     "properties": {k: v for k, v in fc.items() if k != "name"}}
+                    for fc in credentials
+                ]}
+                return {"httpStatusCode": 200, "content": content}
+        else:
+            identity = self._identity(path)
+            if identity is not None:
+                return {"httpStatusCode": 200, "content": identity}
+        return {"httpStatusCode": 404, "content": {"error": {"code": "ResourceNotFound"}}}
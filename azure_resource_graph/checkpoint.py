@@ -0,0 +1,96 @@
+"""
+Checkpoint journal (--checkpoint / --resume): the graph as it is built plus the
+finished subscriptions, so a failed collection resumes where it stopped.
+"""
+import json
+import os
+import time
+
+from graph_model import AzureResourceGraph
+from graph_output import GraphWriter
+
+# Seconds between checkpoint journal flushes (--checkpoint / --resume)
+DEFAULT_CHECKPOINT_INTERVAL = 30
+
+
+class CheckpointJournal(GraphWriter):
+    """
+    Append-only journal of a collection run, read back by --resume.
+    Graph changes are stored as ndjson graph records, interleaved with
+    {"done": unit} records for every finished unit of work, e.g.
+    "process_iam_for_scope:<scope>" or "subscription:<id>". A unit's done
+    record always follows its graph records. The file is fsync'ed at most
+    every 'flush_interval' seconds, which bounds the work a crash can lose.
+    """
+    def __init__(self, filename: str, flush_interval: float = DEFAULT_CHECKPOINT_INTERVAL):
+        super().__init__(filename, "ndjson")
+        self.flush_interval = flush_interval
+        self.completed = set()
+        self.resumed = False
+        self.graph = None
+        self.last_flush = time.monotonic()
+
+    @classmethod
+    def resume(cls, filename: str, flush_interval: float = DEFAULT_CHECKPOINT_INTERVAL):
+        """
+        Returns (partial graph, journal) rebuilt from an existing journal.
+        A last line cut off by a crash is dropped.
+        """
+        with open(filename, "rb+") as file:
+            size = file.seek(0, os.SEEK_END)
+            start = file.seek(max(0, size - (1 << 20)))
+            end = start + file.read().rfind(b"\n") + 1
+            if end < size:
+                file.truncate(end)
+        graph = AzureResourceGraph.load_from_file(filename)
+        journal = cls(filename, flush_interval)
+        journal.resumed = True
+        with open(filename, encoding="utf-8") as file:
+            for line in file:
+                if line.startswith('{"done":'):
+                    journal.completed.add(json.loads(line)["done"])
+        print(f"[INFO] Resuming from {filename}: {len(journal.completed)} unit(s) already done.")
+        return graph, journal
+
+    def attach(self, graph):
+        """
+        Starts journaling changes to 'graph'. A resumed journal already holds the graph.
+        """
+        self.graph = graph
+        if not self.resumed:
+            super().attach(graph)
+            return
+        self.file = open(self.filename, "a", encoding="utf-8")
+        graph.sinks.append(self)
+
+    def is_done(self, unit: str) -> bool:
+        return unit in self.completed
+
+    def mark_done(self, unit: str):
+        with self.graph.lock:
+            if self.file is None:
+                return
+            self.completed.add(unit)
+            self._line({"done": unit})
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.graph.lock:
+            if self.file is not None:
+                self._flush()
+
+    def discard(self):
+        """
+        Stops journaling and deletes the journal, once the final output is written.
+        """
+        with self.graph.lock:
+            self.graph.sinks.remove(self)
+            self.close()
+        os.remove(self.filename)
+        print(f"[INFO] Removed checkpoint journal {self.filename}")
@@ -0,0 +1,197 @@
+"""
+ForceAtlas2 layout (--layout) of a graph, precomputed in numpy so the viewer
+starts from final node positions.
+"""
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional, only needed for --layout
+    np = None
+
+from graph_model import AzureResourceGraph
+
+# ForceAtlas2 layout (--layout): iterations, and the Barnes-Hut descent of a node stops
+# once the grid cells within LAYOUT_SEPARATION cells of its own hold at most
+# LAYOUT_NEAR_FIELD_MAX nodes. Cells further away act through their centre of mass,
+# so a larger separation is more accurate (and slower).
+DEFAULT_LAYOUT_ITERATIONS = 100
+LAYOUT_SEPARATION = 2
+LAYOUT_NEAR_FIELD_MAX = 128
+LAYOUT_MAX_DEPTH = 20
+LAYOUT_DENSE_GRID = 1024
+
+
+def _repulsion(x, y, mass, scaling_ratio, max_pairs=1 << 22, separation=LAYOUT_SEPARATION):
+    """
+    Barnes-Hut approximation of ForceAtlas2's repulsion, vectorized over a
+    quadtree laid out as grids of increasing depth. At each level a node is
+    repelled by the centre of mass of every cell that is a child of a cell
+    within 'separation' cells of its parent cell, but is itself more than
+    'separation' cells away from the node's own cell. Once the cells within
+    'separation' of its own hold at most LAYOUT_NEAR_FIELD_MAX nodes, those
+    are handled pair by pair and the node leaves the descent; every other
+    node is thus accounted for exactly once.
+
+    Against exact repulsion on clustered layouts of 3000 nodes, a separation
+    of 2 errs by at most ~8% (1% at the 99th percentile); a separation of 1
+    reached 25-75% (4%), for about 2.5 times less work.
+    """
+    n = len(x)
+    fx, fy = np.zeros(n), np.zeros(n)
+    x0, y0 = x.min(), y.min()
+    size = max(x.max() - x0, y.max() - y0) or 1.0
+    ux, uy = (x - x0) / size, (y - y0) / size
+    active = np.arange(n)
+    for level in range(2, LAYOUT_MAX_DEPTH + 1):
+        grid = 1 << level
+        cx = np.minimum((ux * grid).astype(np.int64), grid - 1)
+        cy = np.minimum((uy * grid).astype(np.int64), grid - 1)
+        cells, inverse, cell_count = np.unique(cx * grid + cy, return_inverse=True, return_counts=True)
+        cell_mass = np.bincount(inverse, weights=mass)
+        cell_x = np.bincount(inverse, weights=mass * x) / cell_mass
+        cell_y = np.bincount(inverse, weights=mass * y) / cell_mass
+
+        # Shallow grids index cells through a dense table, deeper ones by binary search
+        table = None
+        if grid <= LAYOUT_DENSE_GRID:
+            table = np.full(grid * grid, -1, dtype=np.int64)
+            table[cells] = np.arange(len(cells))
+
+        def lookup(nx, ny):
+            # Index of cell (nx, ny) in 'cells', and whether it exists (holds nodes)
+            valid = (nx >= 0) & (nx < grid) & (ny >= 0) & (ny < grid)
+            key = np.where(valid, nx * grid + ny, 0)
+            if table is not None:
+                position = table[key]
+                return np.maximum(position, 0), valid & (position >= 0)
+            position = np.minimum(np.searchsorted(cells, key), len(cells) - 1)
+            return position, valid & (cells[position] == key)
+
+        ax, ay = cx[active], cy[active]
+        px, py = ax >> 1, ay >> 1
+        children = range(-2 * separation, 2 * separation + 2)
+        for a in children:
+            nx = 2 * px + a
+            far_x = np.abs(nx - ax) > separation
+            for b in children:
+                ny = 2 * py + b
+                position, hit = lookup(nx, ny)
+                hit &= far_x | (np.abs(ny - ay) > separation)
+                if not hit.any():
+                    continue
+                idx, target = active[hit], position[hit]
+                dx, dy = x[idx] - cell_x[target], y[idx] - cell_y[target]
+                factor = scaling_ratio * mass[idx] * cell_mass[target] / np.maximum(dx * dx + dy * dy, 1e-9)
+                fx[idx] += dx * factor
+                fy[idx] += dy * factor
+
+        # Nodes with few enough neighbours nearby finish with exact pairwise repulsion
+        offsets = range(-separation, separation + 1)
+        neighbours = [lookup(ax + ox, ay + oy) for ox in offsets for oy in offsets]
+        crowd = sum(np.where(hit, cell_count[position], 0) for position, hit in neighbours)
+        done = crowd <= LAYOUT_NEAR_FIELD_MAX if level < LAYOUT_MAX_DEPTH else np.ones(len(active), bool)
+        order = np.argsort(inverse, kind="stable")
+        cell_start = np.cumsum(cell_count) - cell_count
+        for position, hit in neighbours:
+            near = done & hit
+            if not near.any():
+                continue
+            nodes, start, counts = active[near], cell_start[position[near]], cell_count[position[near]]
+            # Batches of at most ~max_pairs pairs bound the memory used
+            cumulative = np.cumsum(counts)
+            splits = np.searchsorted(cumulative, np.arange(max_pairs, cumulative[-1], max_pairs), side="right")
+            for batch in np.split(np.arange(len(nodes)), splits):
+                batch_counts = counts[batch]
+                total = int(batch_counts.sum())
+                if not total:
+                    continue
+                i = np.repeat(nodes[batch], batch_counts)
+                first = np.repeat(start[batch] - (np.cumsum(batch_counts) - batch_counts), batch_counts)
+                j = order[first + np.arange(total)]
+                other = i != j
+                i, j = i[other], j[other]
+                dx, dy = x[i] - x[j], y[i] - y[j]
+                factor = scaling_ratio * mass[i] * mass[j] / np.maximum(dx * dx + dy * dy, 1e-9)
+                fx += np.bincount(i, weights=dx * factor, minlength=n)
+                fy += np.bincount(i, weights=dy * factor, minlength=n)
+        active = active[~done]
+        if not len(active):
+            break
+    return fx, fy
+
+
+def forceatlas2_layout(graph: AzureResourceGraph, iterations: int = DEFAULT_LAYOUT_ITERATIONS,
+                       scaling_ratio: float = 10.0, gravity: float = 1.0, jitter_tolerance: float = 1.0,
+                       seed: int = 0):
+    """
+    Computes a ForceAtlas2 layout (linear attraction, degree-weighted repulsion
+    with Barnes-Hut, gravity, adaptive speed) with NumPy and stores x/y on every
+    node, so the viewer can skip its own layout. Repulsion dominates the cost:
+    2000 nodes take about 6 s for 100 iterations, 20000 nodes about 0.6 s per
+    iteration.
+    """
+    if np is None:
+        raise RuntimeError("The layout requires the 'numpy' package (pip install numpy)")
+    with graph.lock:
+        slot_count = len(graph.node_alive)
+        node_slots = np.flatnonzero(np.frombuffer(bytes(graph.node_alive), dtype=np.uint8))
+        node_ids = np.array(graph.node_ids, dtype=np.int64)[node_slots]
+        edge_slots = np.flatnonzero(np.frombuffer(bytes(graph.edge_alive), dtype=np.uint8))
+        sources = np.array(graph.edge_sources, dtype=np.int64)[edge_slots]
+        targets = np.array(graph.edge_targets, dtype=np.int64)[edge_slots]
+        string_count = len(graph.strings.values)
+    n = len(node_slots)
+    if n == 0:
+        return
+    print(f"[INFO] Computing ForceAtlas2 layout for {n} nodes, {len(sources)} edges ({iterations} iterations) ...")
+    index = np.full(string_count, -1, dtype=np.int64)
+    index[node_ids] = np.arange(n)
+    sources, targets = index[sources], index[targets]
+    keep = (sources >= 0) & (targets >= 0) & (sources != targets)
+    sources, targets = sources[keep], targets[keep]
+    mass = 1.0 + np.bincount(sources, minlength=n) + np.bincount(targets, minlength=n)
+
+    rng = np.random.default_rng(seed)
+    spread = np.sqrt(n) * 10
+    x, y = rng.uniform(-spread, spread, n), rng.uniform(-spread, spread, n)
+    previous_fx, previous_fy = np.zeros(n), np.zeros(n)
+    speed, speed_efficiency = 1.0, 1.0
+    for _ in range(iterations):
+        fx, fy = _repulsion(x, y, mass, scaling_ratio)
+        # Linear attraction along edges
+        dx, dy = x[sources] - x[targets], y[sources] - y[targets]
+        fx -= np.bincount(sources, weights=dx, minlength=n) - np.bincount(targets, weights=dx, minlength=n)
+        fy -= np.bincount(sources, weights=dy, minlength=n) - np.bincount(targets, weights=dy, minlength=n)
+        # Gravity towards the origin
+        distance = np.maximum(np.hypot(x, y), 1e-9)
+        fx -= gravity * mass * x / distance
+        fy -= gravity * mass * y / distance
+
+        # Adaptive speed (Jacomy et al. 2014): slow down oscillating nodes
+        swinging = mass * np.hypot(fx - previous_fx, fy - previous_fy)
+        traction = mass * np.hypot(fx + previous_fx, fy + previous_fy) / 2
+        total_swinging, total_traction = swinging.sum(), traction.sum() or 1e-9
+        estimated_jitter = 0.05 * np.sqrt(n)
+        jitter = jitter_tolerance * max(np.sqrt(estimated_jitter),
+                                        min(10.0, estimated_jitter * total_traction / n ** 2))
+        if total_swinging / total_traction > 2.0:
+            if speed_efficiency > 0.05:
+                speed_efficiency *= 0.5
+            jitter = max(jitter, jitter_tolerance)
+        target_speed = jitter * speed_efficiency * total_traction / max(total_swinging, 1e-9)
+        if total_swinging > jitter * total_traction:
+            if speed_efficiency > 0.05:
+                speed_efficiency *= 0.7
+        elif speed < 1000:
+            speed_efficiency *= 1.3
+        speed += min(target_speed - speed, 0.5 * speed)
+        factor = speed / (1.0 + np.sqrt(speed * swinging))
+        x += fx * factor
+        y += fy * factor
+        previous_fx, previous_fy = fx, fy
+
+    positions = np.zeros(2 * slot_count, dtype=np.float32)
+    positions[2 * node_slots] = x
+    positions[2 * node_slots + 1] = y
+    graph.set_positions(array("f", positions.tobytes()))
@@ -0,0 +1,414 @@
+"""
+AzureResourceGraph: the in-memory node/edge store the processor fills, with
+its node palette.
+"""
+import threading
+from array import array
+from typing import Dict, Tuple
+
+from graph_output import GraphWriter, read_graph_records
+
+# The color palette (unchanged)
+RESOURCE_COLORS = {
+    "Microsoft.Compute/virtualMachines": "#1f77b4",
+    "Microsoft.Compute/virtualMachineScaleSets": "#aec7e8",
+    "Microsoft.Storage/storageAccounts": "#2ca02c",
+    "Microsoft.KeyVault/vaults": "#9467bd",
+    "Microsoft.Web/sites": "#e377c2",
+    "Microsoft.ManagedIdentity/userAssignedIdentities": "#ff7f0e",
+    "Microsoft.ContainerService/managedClusters": "#17becf",
+    "Microsoft.Automation/automationAccounts": "#8c564b",
+    "ResourceGroup": "#7f7f7f",
+    "Subscription": "#bcbd22",
+    "SystemAssignedManagedIdentity": "#98df8a",
+    "UserAssignedManagedIdentity": "#ff7f0e",
+    "Principal": "#d62728",
+    "FederatedCredential": "#9edae5"
+}
+
+# Edges owned by a scope's role assignments / a vault's access policies
+IAM_EDGE_COLOR = "#d62728"
+KEY_VAULT_POLICY_LABELS = {"Secrets", "Keys", "Certificates"}
+
+# Lowercased type -> canonical RESOURCE_COLORS key, ARG returns types in any case
+RESOURCE_TYPE_INDEX = {k.lower(): k for k in RESOURCE_COLORS}
+
+
+def normalize_resource_type(resource_type: str) -> str:
+    return RESOURCE_TYPE_INDEX.get(resource_type.lower(), resource_type)
+
+
+class StringInterner:
+    """
+    Maps strings to dense integers and back, so each distinct string is stored once.
+    """
+    __slots__ = ("index", "values")
+
+    def __init__(self):
+        self.index = {}
+        self.values = []
+
+    def intern(self, value: str) -> int:
+        idx = self.index.get(value)
+        if idx is None:
+            idx = self.index[value] = len(self.values)
+            self.values.append(value)
+        return idx
+
+    def get(self, value: str):
+        return self.index.get(value)
+
+    def __getitem__(self, idx: int) -> str:
+        return self.values[idx]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class GraphView:
+    """
+    Read-only sequence of node or edge dicts built on the fly from the compact storage.
+    """
+    __slots__ = ("graph", "kind")
+
+    def __init__(self, graph, kind: str):
+        self.graph = graph
+        self.kind = kind
+
+    def __len__(self):
+        return self.graph.node_count if self.kind == "nodes" else self.graph.edge_count
+
+    def __iter__(self):
+        graph = self.graph
+        # Iterate over a copy of the columns: remove() rewrites them in place or
+        # swaps them for compacted ones while other threads insert
+        with graph.lock:
+            if self.kind == "nodes":
+                alive, columns, make = bytes(graph.node_alive), graph._node_columns(copy=True), graph._node_dict
+            else:
+                alive, columns, make = bytes(graph.edge_alive), graph._edge_columns(copy=True), graph._edge_dict
+        for slot in range(len(alive)):
+            if alive[slot]:
+                yield make(slot, columns)
+
+    def __bool__(self):
+        return len(self) > 0
+
+
+class NodeIdView:
+    """
+    Set-like view of node IDs (the former 'node_set').
+    """
+    __slots__ = ("graph",)
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def __contains__(self, node_id):
+        return self.graph.has_node(node_id)
+
+    def __len__(self):
+        return self.graph.node_count
+
+    def __iter__(self):
+        return (node["id"] for node in self.graph.nodes)
+
+
+class AzureResourceGraph:
+    """
+    Nodes and edges are stored column-wise in typed arrays of interned string
+    indexes, and edges are deduplicated with integer keys built from their
+    (source, target, label) indexes. 'nodes' and 'edges' expose the familiar
+    dict records as read-only views.
+    """
+    def __init__(self):
+        self.strings = StringInterner()  # IDs, labels, types, colors, edge labels
+        self.node_slots = {}             # interned node id -> slot in the node arrays
+        self.node_ids = array("i")
+        self.node_labels = array("i")
+        self.node_types = array("i")
+        self.node_colors = array("i")
+        self.node_alive = bytearray()
+        self.edge_sources = array("i")
+        self.edge_targets = array("i")
+        self.edge_labels = array("i")
+        self.edge_colors = array("i")
+        self.edge_alive = bytearray()
+        self.edge_keys = set()           # packed (source, target, label) indexes
+        self.node_count = 0
+        self.edge_count = 0
+        # Inserts come from many worker threads; re-entrant so that callers holding it
+        # can still iterate the nodes/edges views, which take it for their snapshot
+        self.lock = threading.RLock()
+        self.metadata = {}  # Written alongside nodes/edges, e.g. the collection timestamp
+        self.sinks = []  # Streaming GraphWriters/journals notified of every change
+        self.node_positions = None  # array("f") of x, y per node slot, once a layout ran
+
+    @property
+    def nodes(self) -> GraphView:
+        return GraphView(self, "nodes")
+
+    @property
+    def edges(self) -> GraphView:
+        return GraphView(self, "edges")
+
+    @property
+    def node_set(self) -> NodeIdView:
+        return NodeIdView(self)
+
+    @staticmethod
+    def _edge_key(source: int, target: int, label: int) -> int:
+        return (source << 64) | (target << 32) | label
+
+    def _node_columns(self, copy: bool = False) -> Tuple:
+        columns = (self.node_ids, self.node_labels, self.node_types, self.node_colors, self.node_positions)
+        return tuple(column[:] if copy and column is not None else column for column in columns)
+
+    def _edge_columns(self, copy: bool = False) -> Tuple:
+        columns = (self.edge_sources, self.edge_targets, self.edge_labels, self.edge_colors)
+        return tuple(column[:] for column in columns) if copy else columns
+
+    def _node_dict(self, slot: int, columns: Tuple = None) -> Dict:
+        ids, labels, types, colors, positions = columns or self._node_columns()
+        # Interned strings are only ever appended, so indexes stay valid without the lock
+        strings = self.strings
+        node = {
+            "id": strings[ids[slot]],
+            "label": strings[labels[slot]],
+            "type": strings[types[slot]],
+            "color": strings[colors[slot]]
+        }
+        if positions is not None and 2 * slot + 1 < len(positions):
+            node["x"] = round(positions[2 * slot], 2)
+            node["y"] = round(positions[2 * slot + 1], 2)
+        return node
+
+    def _edge_dict(self, slot: int, columns: Tuple = None) -> Dict:
+        sources, targets, labels, colors = columns or self._edge_columns()
+        strings = self.strings
+        return {
+            "source": strings[sources[slot]],
+            "target": strings[targets[slot]],
+            "label": strings[labels[slot]],
+            "color": strings[colors[slot]]
+        }
+
+    def has_node(self, node_id) -> bool:
+        idx = self.strings.get(node_id)
+        return idx is not None and idx in self.node_slots
+
+    def get_node(self, node_id):
+        with self.lock:
+            idx = self.strings.get(node_id)
+            slot = self.node_slots.get(idx) if idx is not None else None
+            return self._node_dict(slot) if slot is not None else None
+
+    def add_node(self, node_id, name, node_type, color=None):
+        with self.lock:
+            idx = self.strings.intern(node_id)
+            if idx not in self.node_slots:
+                color = color or RESOURCE_COLORS.get(node_type, "#1f77b4")
+                slot = len(self.node_alive)
+                self.node_slots[idx] = slot
+                self.node_ids.append(idx)
+                self.node_labels.append(self.strings.intern(name))
+                self.node_types.append(self.strings.intern(node_type))
+                self.node_colors.append(self.strings.intern(color))
+                self.node_alive.append(1)
+                self.node_count += 1
+                for sink in self.sinks:
+                    sink.node_added(self._node_dict(slot))
+
+    def set_positions(self, positions: array):
+        """
+        Sets the layout: x, y for every node slot, interleaved.
+        """
+        with self.lock:
+            self.node_positions = positions
+
+    def set_node_position(self, node_id, x: float, y: float):
+        with self.lock:
+            idx = self.strings.get(node_id)
+            slot = self.node_slots.get(idx) if idx is not None else None
+            if slot is None:
+                return
+            if self.node_positions is None:
+                self.node_positions = array("f")
+            missing = 2 * len(self.node_alive) - len(self.node_positions)
+            if missing > 0:
+                self.node_positions.extend([0.0] * missing)
+            self.node_positions[2 * slot] = x
+            self.node_positions[2 * slot + 1] = y
+
+    def update_node_label(self, node_id, name):
+        with self.lock:
+            idx = self.strings.get(node_id)
+            slot = self.node_slots.get(idx) if idx is not None else None
+            if slot is None:
+                return
+            label = self.strings.intern(name)
+            if self.node_labels[slot] != label:
+                self.node_labels[slot] = label
+                for sink in self.sinks:
+                    sink.label_updated(self._node_dict(slot))
+
+    def add_edge(self, source, target, label, color="black"):
+        with self.lock:
+            s, t, l = self.strings.intern(source), self.strings.intern(target), self.strings.intern(label)
+            edge_key = self._edge_key(s, t, l)
+            if edge_key not in self.edge_keys:
+                self.edge_keys.add(edge_key)
+                slot = len(self.edge_alive)
+                self.edge_sources.append(s)
+                self.edge_targets.append(t)
+                self.edge_labels.append(l)
+                self.edge_colors.append(self.strings.intern(color))
+                self.edge_alive.append(1)
+                self.edge_count += 1
+                for sink in self.sinks:
+                    sink.edge_added(self._edge_dict(slot))
+
+    def remove(self, node_predicate, edge_predicate):
+        """
+        Drops every node matching node_predicate(node_id), every edge touching a
+        dropped node and every edge matching edge_predicate(source, target, label, color),
+        in a single pass over the graph.
+        """
+        with self.lock:
+            strings = self.strings
+            removed_nodes = set()
+            for slot in range(len(self.node_alive)):
+                if self.node_alive[slot] and node_predicate(strings[self.node_ids[slot]]):
+                    idx = self.node_ids[slot]
+                    removed_nodes.add(idx)
+                    del self.node_slots[idx]
+                    self.node_alive[slot] = 0
+                    self.node_count -= 1
+                    for sink in self.sinks:
+                        sink.node_removed(strings[idx])
+            removed_edges = 0
+            for slot in range(len(self.edge_alive)):
+                if not self.edge_alive[slot]:
+                    continue
+                s, t, l = self.edge_sources[slot], self.edge_targets[slot], self.edge_labels[slot]
+                incident = s in removed_nodes or t in removed_nodes
+                if incident or edge_predicate(strings[s], strings[t], strings[l], strings[self.edge_colors[slot]]):
+                    self.edge_keys.discard(self._edge_key(s, t, l))
+                    self.edge_alive[slot] = 0
+                    self.edge_count -= 1
+                    removed_edges += 1
+                    # Readers drop edges of removed nodes themselves
+                    if not incident:
+                        for sink in self.sinks:
+                            sink.edge_removed(self._edge_dict(slot))
+            self._compact()
+        print(f"[INFO] Removed {len(removed_nodes)} node(s) and {removed_edges} edge(s).")
+
+    def _compact(self):
+        """
+        Rewrites the arrays without removed slots once they make up half of them.
+        Interned strings are kept, they are cheap and may be reused.
+        """
+        if len(self.node_alive) > 2 * self.node_count:
+            keep = [slot for slot in range(len(self.node_alive)) if self.node_alive[slot]]
+            for name in ("node_ids", "node_labels", "node_types", "node_colors"):
+                column = getattr(self, name)
+                setattr(self, name, array("i", (column[slot] for slot in keep)))
+            if self.node_positions is not None:
+                positions = self.node_positions
+                self.node_positions = array("f", (
+                    positions[2 * slot + i] if 2 * slot + 1 < len(positions) else 0.0
+                    for slot in keep for i in (0, 1)
+                ))
+            self.node_alive = bytearray(b"\x01" * len(keep))
+            self.node_slots = {idx: slot for slot, idx in enumerate(self.node_ids)}
+        if len(self.edge_alive) > 2 * self.edge_count:
+            keep = [slot for slot in range(len(self.edge_alive)) if self.edge_alive[slot]]
+            for name in ("edge_sources", "edge_targets", "edge_labels", "edge_colors"):
+                column = getattr(self, name)
+                setattr(self, name, array("i", (column[slot] for slot in keep)))
+            self.edge_alive = bytearray(b"\x01" * len(keep))
+
+    @staticmethod
+    def _removals(filename: str):
+        """
+        First pass over a graph file: the position of the last removal of every
+        removed node ID and edge key, and the file's metadata. Only removals are
+        kept, so this stays small however large the file is.
+        """
+        removed_nodes = {}
+        removed_edges = {}
+        metadata = {}
+        for position, (kind, record) in enumerate(read_graph_records(filename)):
+            if kind == "remove_node":
+                removed_nodes[record] = position
+            elif kind == "remove_edge":
+                removed_edges[tuple(record)] = position
+            elif kind == "metadata":
+                metadata.update(record)
+        return removed_nodes, removed_edges, metadata
+
+    def _stream_file(self, filename: str, positions: bool):
+        """
+        Applies the records of one graph file to this graph one by one, so the
+        file never has to fit in memory. A first pass collects its removals, and
+        records that the file removes later on are skipped: the removals only
+        touch the file's own nodes and edges, never what other files contributed.
+        A resolved label wins over a principalId placeholder. Returns the number
+        of new nodes and edges and the file's metadata.
+        """
+        removed_nodes, removed_edges, metadata = self._removals(filename)
+
+        def live(node_id, position):
+            return removed_nodes.get(node_id, -1) < position
+
+        nodes_before, edges_before = self.node_count, self.edge_count
+        for position, (kind, record) in enumerate(read_graph_records(filename)):
+            if kind == "node":
+                node_id, label = record["id"], record["label"]
+                if not live(node_id, position):
+                    continue
+                current = self.get_node(node_id)
+                if current is None:
+                    self.add_node(node_id, label, record["type"], record.get("color"))
+                elif current["label"] == node_id and label != node_id:
+                    self.update_node_label(node_id, label)
+                if positions and "x" in record:
+                    self.set_node_position(node_id, record["x"], record["y"])
+            elif kind == "edge":
+                key = (record["source"], record["target"], record["label"])
+                if (removed_edges.get(key, -1) < position
+                        and live(key[0], position) and live(key[1], position)):
+                    self.add_edge(*key, record.get("color", "black"))
+            elif kind == "update":
+                node_id, label = record
+                if live(node_id, position):
+                    self.update_node_label(node_id, label)
+            elif kind == "position" and positions:
+                node_id, x, y = record
+                if live(node_id, position):
+                    self.set_node_position(node_id, x, y)
+        return self.node_count - nodes_before, self.edge_count - edges_before, metadata
+
+    @classmethod
+    def load_from_file(cls, filename="output_azure_resource_data.json"):
+        """
+        Rebuilds a graph from any file written by GraphWriter (json, compact, ndjson, compressed).
+        """
+        graph = cls()
+        _, _, graph.metadata = graph._stream_file(filename, positions=True)
+        print(f"[INFO] Loaded {len(graph.nodes)} nodes and {len(graph.edges)} edges from {filename}")
+        return graph
+
+    def merge_from_file(self, filename: str) -> Dict:
+        """
+        Merges the nodes and edges of another graph file (e.g. a shard) into this
+        graph, skipping duplicates. Returns the file's metadata.
+        """
+        added_nodes, added_edges, metadata = self._stream_file(filename, positions=False)
+        print(f"[INFO] Merged {filename}: {added_nodes} new node(s), {added_edges} new edge(s)")
+        return metadata
+
+    def write_to_file(self, filename="output_azure_resource_data.json", fmt="json",
+                      compression=None, string_table=False):
+        GraphWriter(filename, fmt, compression, string_table).write(self)
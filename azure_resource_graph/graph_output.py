@@ -0,0 +1,490 @@
+"""
+Graph output formats: json, compact and ndjson files (optionally gzip or zstd
+compressed), the indexed SQLite store and Parquet tables, and their readers.
+"""
+import gzip
+import io
+import itertools
+import json
+import os
+import sqlite3
+from typing import Dict
+from urllib.parse import quote
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for --compress zstd
+    zstandard = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, only needed for --parquet
+    pyarrow = None
+
+# Changes buffered by the SQLite output before they are written in one transaction
+DEFAULT_SQLITE_BATCH_SIZE = 5000
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+
+def open_graph_output(filename: str, compression: str = None):
+    if compression == "gzip":
+        return gzip.open(filename, "wt", encoding="utf-8")
+    if compression == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstd output requires the 'zstandard' package (pip install zstandard)")
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(filename, "wb")), encoding="utf-8")
+    return open(filename, "w", encoding="utf-8")
+
+
+def open_graph_input(filename: str):
+    """
+    Opens a graph file for reading, transparently decompressing gzip/zstd.
+    """
+    with open(filename, "rb") as file:
+        magic = file.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(filename, "rt", encoding="utf-8")
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise RuntimeError("Reading zstd graphs requires the 'zstandard' package (pip install zstandard)")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(filename, "rb")), encoding="utf-8")
+    return open(filename, encoding="utf-8")
+
+
+class GraphWriter:
+    """
+    Writes an AzureResourceGraph to disk.
+
+    Formats:
+      json    - {"nodes": [...], "edges": [...]} indented (the original format)
+      compact - the same document without whitespace, written record by record
+      ndjson  - one record per line, streamed while the graph is being built:
+                {"n": [id, label, type, color]}   node
+                {"e": [source, target, label, color]}   edge
+                {"u": [id, label]}   label update
+                {"p": [id, x, y]}   layout position
+                {"rn": id} / {"re": [source, target, label]}   removals
+                {"meta": {...}}   graph metadata
+    With string_table=True, types, colors and edge labels are stored once and
+    referenced by index: a top-level "strings" list (json/compact) or
+    {"s": index, "v": value} records (ndjson).
+    """
+    FORMATS = ("json", "compact", "ndjson")
+    COMPRESSIONS = ("gzip", "zstd")
+
+    def __init__(self, filename: str, fmt: str = "json", compression: str = None, string_table: bool = False):
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Unknown output format '{fmt}', expected one of {self.FORMATS}")
+        self.filename = filename
+        self.fmt = fmt
+        self.compression = compression
+        self.string_table = string_table
+        self.strings = {}
+        self.file = None
+
+    @property
+    def streaming(self) -> bool:
+        return self.fmt == "ndjson"
+
+    def _ref(self, value):
+        """
+        Returns the value itself, or its string-table index (emitting the
+        definition record first when streaming).
+        """
+        if not self.string_table:
+            return value
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+            if self.streaming:
+                self._line({"s": index, "v": value})
+        return index
+
+    def _line(self, record: Dict):
+        self.file.write(json.dumps(record, separators=(",", ":")))
+        self.file.write("\n")
+
+    def _open(self):
+        if self.file is None:
+            self.file = open_graph_output(self.filename, self.compression)
+
+    # Streaming (ndjson) sink interface, called by AzureResourceGraph under its lock
+    def attach(self, graph):
+        """
+        Starts streaming: writes what the graph already holds, then every later change.
+        """
+        self._open()
+        for node in graph.nodes:
+            self.node_added(node)
+        for edge in graph.edges:
+            self.edge_added(edge)
+        graph.sinks.append(self)
+
+    def node_added(self, node: Dict):
+        node_type, color = self._ref(node["type"]), self._ref(node["color"])
+        self._line({"n": [node["id"], node["label"], node_type, color]})
+
+    def edge_added(self, edge: Dict):
+        label, color = self._ref(edge["label"]), self._ref(edge["color"])
+        self._line({"e": [edge["source"], edge["target"], label, color]})
+
+    def label_updated(self, node: Dict):
+        self._line({"u": [node["id"], node["label"]]})
+
+    def node_removed(self, node_id: str):
+        self._line({"rn": node_id})
+
+    def edge_removed(self, edge: Dict):
+        self._line({"re": [edge["source"], edge["target"], edge["label"]]})
+
+    def _write_document(self, graph):
+        """
+        Writes the document record by record instead of building it in memory.
+        The indented 'json' format is byte-identical to json.dump(..., indent=2).
+        """
+        indent = "  " if self.fmt == "json" else ""
+        newline = "\n" if indent else ""
+        separators = (",", ": ") if indent else (",", ":")
+
+        def dump(value, level):
+            text = json.dumps(value, indent=2 if indent else None, separators=separators)
+            return text.replace("\n", "\n" + indent * level) if indent else text
+
+        ref = self._ref
+        sections = [
+            ("nodes", True, (
+                dict(n, type=ref(n["type"]), color=ref(n["color"]))
+                for n in graph.nodes
+            )),
+            ("edges", True, (
+                {"source": e["source"], "target": e["target"], "label": ref(e["label"]), "color": ref(e["color"])}
+                for e in graph.edges
+            )),
+        ]
+        if self.string_table:
+            # Evaluated lazily, once nodes and edges have filled the table
+            sections.append(("strings", False, lambda: list(self.strings)))
+        if graph.metadata:
+            sections.append(("metadata", False, lambda: graph.metadata))
+
+        self.file.write("{")
+        for i, (key, is_array, value) in enumerate(sections):
+            if i:
+                self.file.write(",")
+            self.file.write(f'{newline}{indent}"{key}"{separators[1]}')
+            if not is_array:
+                self.file.write(dump(value(), 1))
+                continue
+            self.file.write("[")
+            empty = True
+            for record in value:
+                self.file.write(("" if empty else ",") + newline + indent * 2 + dump(record, 2))
+                empty = False
+            if not empty:
+                self.file.write(newline + indent)
+            self.file.write("]")
+        self.file.write(newline + "}")
+
+    def write(self, graph):
+        """
+        Finishes the output: closes a streaming file, or writes the whole graph.
+        """
+        if self.streaming:
+            if self not in graph.sinks:
+                self.attach(graph)
+            graph.sinks.remove(self)
+            if graph.node_positions is not None:
+                for node in graph.nodes:
+                    if "x" in node:
+                        self._line({"p": [node["id"], node["x"], node["y"]]})
+            if graph.metadata:
+                self._line({"meta": graph.metadata})
+        else:
+            self._open()
+            self._write_document(graph)
+        self.close()
+        print(f"[INFO] Data written to {self.filename}")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class SQLiteGraphWriter:
+    """
+    Writes an AzureResourceGraph into an indexed SQLite database, streamed
+    while the graph is being built (same sink interface as GraphWriter):
+
+      nodes(id PRIMARY KEY, label, type, color, x, y)
+      edges(source, target, label, color, PRIMARY KEY (source, target, label))
+      metadata(key PRIMARY KEY, value)   values are JSON
+
+    Changes are buffered and applied with executemany in one transaction per
+    'batch_size' changes. The primary keys index node id and edge source;
+    the type, label, target and edge label indexes are built once, in write(),
+    after the bulk load. Node labels compare case-insensitively, so label
+    prefix searches can use their index; substring searches use nodes_fts, a
+    trigram full-text index over node labels and IDs (FTS5, SQLite 3.34+).
+    """
+    FORMAT = "sqlite"
+    SCHEMA = (
+        "CREATE TABLE nodes ("
+        " id TEXT PRIMARY KEY,"
+        " label TEXT NOT NULL COLLATE NOCASE,"
+        " type TEXT NOT NULL,"
+        " color TEXT,"
+        " x REAL,"
+        " y REAL)",
+        "CREATE TABLE edges ("
+        " source TEXT NOT NULL,"
+        " target TEXT NOT NULL,"
+        " label TEXT NOT NULL,"
+        " color TEXT,"
+        " PRIMARY KEY (source, target, label))",
+        "CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    )
+    INDEXES = (
+        "CREATE INDEX IF NOT EXISTS idx_nodes_type ON nodes (type)",
+        "CREATE INDEX IF NOT EXISTS idx_nodes_label ON nodes (label)",
+        "CREATE INDEX IF NOT EXISTS idx_edges_target ON edges (target)",
+        "CREATE INDEX IF NOT EXISTS idx_edges_label ON edges (label)",
+    )
+    SEARCH_INDEX = (
+        "CREATE VIRTUAL TABLE nodes_fts USING fts5(label, id, content='nodes', tokenize='trigram')",
+        "INSERT INTO nodes_fts (nodes_fts) VALUES ('rebuild')",
+    )
+    INSERT_NODE = "INSERT OR IGNORE INTO nodes (id, label, type, color) VALUES (?, ?, ?, ?)"
+    INSERT_EDGE = "INSERT OR IGNORE INTO edges VALUES (?, ?, ?, ?)"
+    UPDATE_LABEL = "UPDATE nodes SET label = ? WHERE id = ?"
+    DELETE_NODE = "DELETE FROM nodes WHERE id = ?"
+    DELETE_INCIDENT_EDGES = "DELETE FROM edges WHERE source = ?1 OR target = ?1"
+    DELETE_EDGE = "DELETE FROM edges WHERE source = ? AND target = ? AND label = ?"
+
+    def __init__(self, filename: str, batch_size: int = DEFAULT_SQLITE_BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.pending = []  # (statement, parameters) in the order the changes happened
+        self.conn = None
+
+    @property
+    def streaming(self) -> bool:
+        return True
+
+    def _open(self):
+        if self.conn is not None:
+            return
+        # The database is rebuilt from scratch, like the other formats overwrite their file
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(self.filename + suffix):
+                os.remove(self.filename + suffix)
+        self.conn = sqlite3.connect(self.filename, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        for statement in self.SCHEMA:
+            self.conn.execute(statement)
+        self.conn.commit()
+
+    def _queue(self, statement: str, parameters: tuple):
+        self.pending.append((statement, parameters))
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        """
+        Applies the buffered changes in one transaction, one executemany per
+        run of identical statements.
+        """
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        with self.conn:
+            for statement, group in itertools.groupby(pending, key=lambda change: change[0]):
+                self.conn.executemany(statement, [parameters for _, parameters in group])
+
+    # Streaming sink interface, called by AzureResourceGraph under its lock
+    def attach(self, graph):
+        """
+        Starts streaming: writes what the graph already holds, then every later change.
+        """
+        self._open()
+        for node in graph.nodes:
+            self.node_added(node)
+        for edge in graph.edges:
+            self.edge_added(edge)
+        graph.sinks.append(self)
+
+    def node_added(self, node: Dict):
+        self._queue(self.INSERT_NODE, (node["id"], node["label"], node["type"], node["color"]))
+
+    def edge_added(self, edge: Dict):
+        self._queue(self.INSERT_EDGE, (edge["source"], edge["target"], edge["label"], edge["color"]))
+
+    def label_updated(self, node: Dict):
+        self._queue(self.UPDATE_LABEL, (node["label"], node["id"]))
+
+    def node_removed(self, node_id: str):
+        self._queue(self.DELETE_NODE, (node_id,))
+        self._queue(self.DELETE_INCIDENT_EDGES, (node_id,))
+
+    def edge_removed(self, edge: Dict):
+        self._queue(self.DELETE_EDGE, (edge["source"], edge["target"], edge["label"]))
+
+    def write(self, graph):
+        """
+        Finishes the database: applies what is buffered, stores positions and
+        metadata, builds the secondary indexes and closes it.
+        """
+        with graph.lock:
+            if self not in graph.sinks:
+                self.attach(graph)
+            graph.sinks.remove(self)
+            self._flush()
+        with self.conn:
+            if graph.node_positions is not None:
+                self.conn.executemany(
+                    "UPDATE nodes SET x = ?, y = ? WHERE id = ?",
+                    ((node["x"], node["y"], node["id"]) for node in graph.nodes if "x" in node)
+                )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?)",
+                ((key, json.dumps(value)) for key, value in graph.metadata.items())
+            )
+            for statement in self.INDEXES:
+                self.conn.execute(statement)
+        self.build_search_index(self.conn)
+        self.conn.execute("ANALYZE")
+        # A single self-contained file for readers
+        self.conn.execute("PRAGMA journal_mode = DELETE")
+        self.close()
+        print(f"[INFO] Data written to {self.filename}")
+
+    @classmethod
+    def build_search_index(cls, conn: sqlite3.Connection) -> bool:
+        """
+        Builds the trigram index over node labels and IDs. Returns False when
+        this SQLite lacks FTS5 or the trigram tokenizer.
+        """
+        try:
+            with conn:
+                conn.execute("DROP TABLE IF EXISTS nodes_fts")
+                for statement in cls.SEARCH_INDEX:
+                    conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            print(f"[WARNING] No trigram search index ({e}); searches will only match label prefixes.")
+            return False
+        return True
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def is_sqlite_graph(filename: str) -> bool:
+    with open(filename, "rb") as file:
+        return file.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+def write_parquet(graph, directory: str):
+    """
+    Exports the graph as columnar nodes.parquet and edges.parquet files in
+    'directory', with the graph metadata in the schema metadata.
+    """
+    if pyarrow is None:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package (pip install pyarrow)")
+    os.makedirs(directory, exist_ok=True)
+    nodes = list(graph.nodes)
+    edges = list(graph.edges)
+    metadata = {"metadata": json.dumps(graph.metadata)}
+    node_columns = {key: [node[key] for node in nodes] for key in ("id", "label", "type", "color")}
+    if graph.node_positions is not None:
+        node_columns["x"] = [node.get("x") for node in nodes]
+        node_columns["y"] = [node.get("y") for node in nodes]
+    edge_columns = {key: [edge[key] for edge in edges] for key in ("source", "target", "label", "color")}
+    for name, columns in (("nodes", node_columns), ("edges", edge_columns)):
+        table = pyarrow.table(columns).replace_schema_metadata(metadata)
+        pyarrow.parquet.write_table(table, os.path.join(directory, f"{name}.parquet"))
+    print(f"[INFO] Parquet export written to {directory} ({len(nodes)} nodes, {len(edges)} edges)")
+
+
+def read_graph_records(filename: str):
+    """
+    Yields ("node", dict), ("edge", dict), ("update", (id, label)),
+    ("remove_node", id), ("remove_edge", (source, target, label)),
+    ("position", (id, x, y)) and ("metadata", dict) from any format written by
+    GraphWriter or SQLiteGraphWriter.
+    """
+    if is_sqlite_graph(filename):
+        yield from read_sqlite_graph_records(filename)
+        return
+    with open_graph_input(filename) as file:
+        first_line = file.readline()
+        try:
+            first = json.loads(first_line)
+        except json.JSONDecodeError:
+            first = None
+        if isinstance(first, dict) and "nodes" not in first:
+            strings = []
+
+            def deref(value):
+                return strings[value] if isinstance(value, int) else value
+
+            for line in itertools.chain([first_line], file):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "s" in record:
+                    strings.append(record["v"])
+                elif "n" in record:
+                    node_id, label, node_type, color = record["n"]
+                    yield "node", {"id": node_id, "label": label, "type": deref(node_type), "color": deref(color)}
+                elif "e" in record:
+                    source, target, label, color = record["e"]
+                    yield "edge", {"source": source, "target": target, "label": deref(label), "color": deref(color)}
+                elif "u" in record:
+                    yield "update", tuple(record["u"])
+                elif "p" in record:
+                    yield "position", tuple(record["p"])
+                elif "rn" in record:
+                    yield "remove_node", record["rn"]
+                elif "re" in record:
+                    yield "remove_edge", tuple(record["re"])
+                elif "meta" in record:
+                    yield "metadata", record["meta"]
+            return
+
+        data = json.loads(first_line + file.read())
+    strings = data.get("strings", [])
+
+    def deref(value):
+        return strings[value] if isinstance(value, int) else value
+
+    for node in data.get("nodes", []):
+        yield "node", dict(node, type=deref(node["type"]), color=deref(node.get("color")))
+    for edge in data.get("edges", []):
+        yield "edge", dict(edge, label=deref(edge["label"]), color=deref(edge.get("color", "black")))
+    if data.get("metadata"):
+        yield "metadata", data["metadata"]
+
+
+def read_sqlite_graph_records(filename: str):
+    conn = sqlite3.connect(f"file:{quote(os.path.abspath(filename))}?mode=ro", uri=True)
+    try:
+        for node_id, label, node_type, color, x, y in conn.execute(
+                "SELECT id, label, type, color, x, y FROM nodes ORDER BY rowid"):
+            yield "node", {"id": node_id, "label": label, "type": node_type, "color": color}
+            if x is not None:
+                yield "position", (node_id, x, y)
+        for source, target, label, color in conn.execute(
+                "SELECT source, target, label, color FROM edges ORDER BY rowid"):
+            yield "edge", {"source": source, "target": target, "label": label, "color": color}
+        metadata = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM metadata")}
+        if metadata:
+            yield "metadata", metadata
+    finally:
+        conn.close()
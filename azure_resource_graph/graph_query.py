@@ -0,0 +1,371 @@
+"""
+Attack-path / reachability queries over a collected graph.
+
+GraphQueryEngine indexes an AzureResourceGraph as CSR adjacency arrays (one
+sorted by source, one by target) in the direction control flows: a principal
+controls the scopes it holds a role on and the vaults it has access policies
+on, a scope controls what it contains, a resource controls its managed
+identities, an identity and its principal are the same actor, and a federated
+credential can act as its UAMI. Every role is treated as control, so results
+over-approximate (a Reader assignment counts too). Queries are vectorized
+breadth-first searches and need numpy.
+
+    engine = GraphQueryEngine.from_file("output_azure_resource_data.json")
+    engine.reachable("<principalId>", max_depth=4)
+    engine.shortest_path("<principalId>", "<vault id>")
+    engine.principals_reaching(["/subscriptions/<id>/resourceGroups/prod"])
+
+    python3 graph_query.py reach <principalId> --type Microsoft.KeyVault/vaults
+    python3 graph_query.py path <principalId> "<vault id>"
+    python3 graph_query.py principals /subscriptions/<id>/resourceGroups/prod --paths
+"""
+import argparse
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional, GraphQueryEngine raises without it
+    np = None
+
+from graph_model import IAM_EDGE_COLOR, KEY_VAULT_POLICY_LABELS, AzureResourceGraph
+
+# Edge label -> kind; role assignment edges are recognised by IAM_EDGE_COLOR, their label is the role
+EDGE_LABEL_KINDS = {
+    "Contains": "contains",
+    "SystemAssignedMI": "identity",
+    "Uses UAMI": "identity",
+    "Linked": "linked",
+    "Federated Credentials": "federation",
+    **{label: "policy" for label in KEY_VAULT_POLICY_LABELS},
+}
+EDGE_KINDS = ("role", "policy", "contains", "identity", "linked", "federation", "other")
+# How control flows along an edge of each kind, relative to its source -> target direction
+EDGE_KIND_FLOW = {
+    "role": "forward",
+    "policy": "forward",
+    "contains": "forward",
+    "identity": "forward",
+    "linked": "both",
+    "federation": "reverse",
+    "other": "forward",
+}
+# Kinds followed unless a query asks for others
+PRIVILEGE_EDGE_KINDS = ("role", "policy", "contains", "identity", "linked", "federation")
+
+
+def parse_edge_kinds(value: str):
+    kinds = tuple(kind.strip() for kind in value.split(",") if kind.strip())
+    unknown = [kind for kind in kinds if kind not in EDGE_KINDS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown edge kind(s) {', '.join(unknown)}, "
+                                         f"expected {', '.join(EDGE_KINDS)}")
+    return kinds
+
+
+class GraphQueryEngine:
+    """
+    Typed CSR adjacency indexes over a graph snapshot. Nodes are numbered
+    densely; every index entry carries its edge kind and the graph's edge slot,
+    so queries can filter by kind and report the original edges.
+    """
+    def __init__(self, graph: AzureResourceGraph):
+        if np is None:
+            raise RuntimeError("Graph queries require the 'numpy' package (pip install numpy)")
+        with graph.lock:
+            node_slots = np.flatnonzero(np.frombuffer(bytes(graph.node_alive), dtype=np.uint8))
+            edge_slots = np.flatnonzero(np.frombuffer(bytes(graph.edge_alive), dtype=np.uint8))
+            string_ids = np.frombuffer(graph.node_ids, dtype=np.intc)[node_slots].astype(np.int64)
+            node_types = np.frombuffer(graph.node_types, dtype=np.intc)[node_slots]
+            node_labels = np.frombuffer(graph.node_labels, dtype=np.intc)[node_slots].astype(np.int64)
+            sources = np.frombuffer(graph.edge_sources, dtype=np.intc)[edge_slots]
+            targets = np.frombuffer(graph.edge_targets, dtype=np.intc)[edge_slots]
+            labels = np.frombuffer(graph.edge_labels, dtype=np.intc)[edge_slots]
+            colors = np.frombuffer(graph.edge_colors, dtype=np.intc)[edge_slots]
+            strings = list(graph.strings.values)
+        self.graph = graph
+        self.strings = strings
+        self.string_ids = string_ids
+        self.node_types = node_types
+        self.node_labels = node_labels
+        self.node_count = n = len(node_slots)
+        self.edge_slots = edge_slots
+
+        # Interned string -> dense node number; edges to nodes that were never added are dropped
+        dense = np.full(len(strings), -1, dtype=np.int64)
+        dense[string_ids] = np.arange(n)
+        self.dense = dense
+        sources, targets = dense[sources], dense[targets]
+
+        # Kind of every edge, from its label (and color, for role assignments)
+        label_kind = np.full(len(strings), EDGE_KINDS.index("other"), dtype=np.int8)
+        for label, kind in EDGE_LABEL_KINDS.items():
+            idx = graph.strings.get(label)
+            if idx is not None:
+                label_kind[idx] = EDGE_KINDS.index(kind)
+        kinds = label_kind[labels]
+        iam_color = graph.strings.get(IAM_EDGE_COLOR)
+        if iam_color is not None:
+            kinds[colors == iam_color] = EDGE_KINDS.index("role")
+
+        # Orient every edge the way control flows; "both" kinds are indexed in both directions
+        valid = (sources >= 0) & (targets >= 0)
+        flow = np.array([EDGE_KIND_FLOW[kind] for kind in EDGE_KINDS])[kinds]
+        edge_index = np.arange(len(sources))
+        forward = valid & (flow != "reverse")
+        backward = valid & (flow != "forward")
+        self.sources = np.concatenate([sources[forward], targets[backward]])
+        self.targets = np.concatenate([targets[forward], sources[backward]])
+        self.kinds = np.concatenate([kinds[forward], kinds[backward]])
+        self.edges = np.concatenate([edge_index[forward], edge_index[backward]])
+
+        self.out_indptr, self.out_order = self._csr(self.sources, n)
+        self.in_indptr, self.in_order = self._csr(self.targets, n)
+        self.out_targets, self.out_kinds = self.targets[self.out_order], self.kinds[self.out_order]
+        self.in_sources, self.in_kinds = self.sources[self.in_order], self.kinds[self.in_order]
+        # Case-insensitive lookups, built on first use by _lowercase_keys()
+        self._lower_index = None
+        self._lower_ids = None
+        self._lower_labels = None
+
+    @classmethod
+    def from_file(cls, filename: str) -> "GraphQueryEngine":
+        return cls(AzureResourceGraph.load_from_file(filename))
+
+    @staticmethod
+    def _csr(rows, n: int):
+        order = np.argsort(rows, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return indptr, order
+
+    #########################################################################
+    #  NODE LOOKUP
+    #########################################################################
+    def node_id(self, node: int) -> str:
+        return self.strings[self.string_ids[node]]
+
+    def node_type(self, node: int) -> str:
+        return self.strings[self.node_types[node]]
+
+    def _lowercase_keys(self):
+        """
+        Numbers every distinct lowercased string of the snapshot, and gives
+        each node the numbers of its lowercased ID and label.
+        """
+        if self._lower_index is None:
+            lower_index = {}
+            lower = np.fromiter((lower_index.setdefault(text.lower(), len(lower_index)) for text in self.strings),
+                                dtype=np.int64, count=len(self.strings))
+            self._lower_ids = lower[self.string_ids]
+            self._lower_labels = lower[self.node_labels]
+            self._lower_index = lower_index
+        return self._lower_index
+
+    def resolve(self, node) -> int:
+        """
+        Dense node number of a node given by ID (exact, then case-insensitive)
+        or by its label, when that is unique.
+        """
+        idx = self.graph.strings.get(node)
+        if idx is not None and idx < len(self.dense) and self.dense[idx] >= 0:
+            return int(self.dense[idx])
+        key = self._lowercase_keys().get(str(node).lower())
+        if key is not None:
+            matches = np.flatnonzero(self._lower_ids == key)
+            if len(matches):
+                return int(matches[0])
+            matches = np.flatnonzero(self._lower_labels == key)
+            if len(matches) == 1:
+                return int(matches[0])
+            if len(matches):
+                raise KeyError(f"'{node}' matches {len(matches)} nodes by label, use an ID: "
+                               f"{', '.join(self.node_id(i) for i in matches[:5])}")
+        raise KeyError(f"No node with ID or label '{node}'")
+
+    def _type_mask(self, node_types):
+        wanted = [self.graph.strings.get(t) for t in node_types]
+        return np.isin(self.node_types, [t for t in wanted if t is not None])
+
+    #########################################################################
+    #  TRAVERSAL
+    #########################################################################
+    def _bfs(self, starts, reverse=False, max_depth=None, kinds=PRIVILEGE_EDGE_KINDS, stop=None):
+        """
+        Level-synchronous BFS from the 'starts' node numbers over the forward
+        (or reverse) index. Returns the depth of every node (-1 if unreached) and
+        the index entry each reached node was first reached through (-1 for the
+        starts). Stops early once node 'stop' is reached.
+        """
+        if reverse:
+            indptr, order, neighbours, edge_kinds = self.in_indptr, self.in_order, self.in_sources, self.in_kinds
+        else:
+            indptr, order, neighbours, edge_kinds = self.out_indptr, self.out_order, self.out_targets, self.out_kinds
+        allowed = np.isin(np.arange(len(EDGE_KINDS)), [EDGE_KINDS.index(kind) for kind in kinds])
+        depth = np.full(self.node_count, -1, dtype=np.int32)
+        parent = np.full(self.node_count, -1, dtype=np.int64)
+        frontier = np.unique(np.asarray(starts, dtype=np.int64))
+        depth[frontier] = 0
+        level = 0
+        while frontier.size and (max_depth is None or level < max_depth):
+            begin = indptr[frontier]
+            counts = indptr[frontier + 1] - begin
+            total = int(counts.sum())
+            if not total:
+                break
+            # Positions of every neighbour of the frontier in the sorted index
+            positions = np.repeat(begin - (np.cumsum(counts) - counts), counts) + np.arange(total)
+            positions = positions[allowed[edge_kinds[positions]]]
+            reached = neighbours[positions]
+            fresh = depth[reached] < 0
+            reached, first = np.unique(reached[fresh], return_index=True)
+            level += 1
+            depth[reached] = level
+            parent[reached] = order[positions[fresh][first]]
+            if stop is not None and depth[stop] >= 0:
+                break
+            frontier = reached
+        return depth, parent
+
+    def _hop(self, entry: int) -> Dict:
+        edge = self.graph._edge_dict(self.edge_slots[self.edges[entry]])
+        return {
+            "source": self.node_id(self.sources[entry]),
+            "target": self.node_id(self.targets[entry]),
+            "label": edge["label"],
+            "kind": EDGE_KINDS[self.kinds[entry]],
+        }
+
+    def _path(self, parent, node: int, reverse=False) -> List[Dict]:
+        # Walks the BFS tree back to a start; hops always read in the direction control flows
+        hops = []
+        entry = parent[node]
+        while entry >= 0:
+            hops.append(self._hop(entry))
+            node = self.targets[entry] if reverse else self.sources[entry]
+            entry = parent[node]
+        return hops if reverse else hops[::-1]
+
+    #########################################################################
+    #  QUERIES
+    #########################################################################
+    def reachable(self, sources, max_depth=None, kinds=PRIVILEGE_EDGE_KINDS, node_types=None) -> Dict[str, int]:
+        """
+        Every node that one of 'sources' (IDs or labels) controls within
+        max_depth hops, with its distance, optionally limited to node_types.
+        """
+        sources = [sources] if isinstance(sources, str) else sources
+        depth, _ = self._bfs([self.resolve(node) for node in sources], max_depth=max_depth, kinds=kinds)
+        mask = depth > 0
+        if node_types:
+            mask &= self._type_mask(node_types)
+        return {self.node_id(i): int(depth[i]) for i in np.flatnonzero(mask)}
+
+    def shortest_path(self, source, target, kinds=PRIVILEGE_EDGE_KINDS) -> Optional[List[Dict]]:
+        """
+        Fewest-hop privilege path from source to target as a list of hops
+        ({"source", "target", "label", "kind"}), or None if there is none.
+        """
+        start, goal = self.resolve(source), self.resolve(target)
+        if start == goal:
+            return []
+        depth, parent = self._bfs([start], kinds=kinds, stop=goal)
+        return self._path(parent, goal) if depth[goal] >= 0 else None
+
+    def principals_reaching(self, scopes, max_depth=None, kinds=PRIVILEGE_EDGE_KINDS,
+                            paths=False) -> Dict[str, Dict]:
+        """
+        For each scope (ID or label), every Principal that controls it within
+        max_depth hops, with its distance, or with its shortest path if 'paths'.
+        One reverse BFS per scope.
+        """
+        scopes = [scopes] if isinstance(scopes, str) else scopes
+        principal = self._type_mask(["Principal"])
+        results = {}
+        for scope in scopes:
+            node = self.resolve(scope)
+            depth, parent = self._bfs([node], reverse=True, max_depth=max_depth, kinds=kinds)
+            found = np.flatnonzero((depth > 0) & principal)
+            results[self.node_id(node)] = {
+                self.node_id(i): self._path(parent, i, reverse=True) if paths else int(depth[i])
+                for i in found
+            }
+        return results
+
+
+def print_path(hops: List[Dict]):
+    for hop in hops:
+        print(f"  {hop['source']}\n    --[{hop['label']} ({hop['kind']})]--> {hop['target']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reachability and privilege path queries over a collected graph.")
+    parser.add_argument("--input", default="output_azure_resource_data.json",
+                        help="Graph written by azure_resource_graph_collector.py (any output format)")
+    parser.add_argument("--edges", type=parse_edge_kinds, default=PRIVILEGE_EDGE_KINDS,
+                        help=f"Comma-separated edge kinds to follow ({', '.join(EDGE_KINDS)}); "
+                             f"default: {','.join(PRIVILEGE_EDGE_KINDS)}")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+    reach = commands.add_parser("reach", help="What the given nodes can reach")
+    reach.add_argument("nodes", nargs="+", help="Node IDs or labels")
+    reach.add_argument("--max-depth", type=int)
+    reach.add_argument("--type", action="append", dest="types", help="Only list nodes of this type (repeatable)")
+    path = commands.add_parser("path", help="Shortest privilege path between two nodes")
+    path.add_argument("source")
+    path.add_argument("target")
+    principals = commands.add_parser("principals", help="All principals reaching the given scopes")
+    principals.add_argument("scopes", nargs="+", help="Scope IDs or labels")
+    principals.add_argument("--max-depth", type=int)
+    principals.add_argument("--paths", action="store_true", help="Include the shortest path of each principal")
+    args = parser.parse_args()
+
+    try:
+        engine = GraphQueryEngine.from_file(args.input)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    started = time.perf_counter()
+    try:
+        if args.command == "reach":
+            result = engine.reachable(args.nodes, args.max_depth, args.edges, args.types)
+        elif args.command == "path":
+            result = engine.shortest_path(args.source, args.target, args.edges)
+        else:
+            result = engine.principals_reaching(args.scopes, args.max_depth, args.edges, args.paths)
+    except KeyError as e:
+        print(f"[ERROR] {e.args[0]}")
+        sys.exit(1)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    if args.command == "reach":
+        for node_id, depth in sorted(result.items(), key=lambda item: (item[1], item[0])):
+            print(f"{depth}\t{engine.node_type(engine.resolve(node_id))}\t{node_id}")
+        print(f"[INFO] {len(result)} node(s) reachable ({elapsed_ms:.1f} ms)")
+    elif args.command == "path":
+        if result is None:
+            print(f"[INFO] No path from {args.source} to {args.target} ({elapsed_ms:.1f} ms)")
+        else:
+            print_path(result)
+            print(f"[INFO] {len(result)} hop(s) ({elapsed_ms:.1f} ms)")
+    else:
+        for scope, found in result.items():
+            print(f"{scope}: {len(found)} principal(s)")
+            distance = (lambda value: len(value)) if args.paths else (lambda value: value)
+            for principal_id, value in sorted(found.items(), key=lambda item: (distance(item[1]), item[0])):
+                if args.paths:
+                    print(f"- {principal_id} ({len(value)} hop(s))")
+                    print_path(value)
+                else:
+                    print(f"  {value}\t{principal_id}")
+        print(f"[INFO] Done ({elapsed_ms:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Local graph server for the viewer.
+
+Serves a collected graph from the indexed SQLite store (--output-format sqlite)
+so the viewer only loads the part of a large tenant it shows: search results,
+one category, or the neighborhood of a clicked (frozen) node. Other output
+formats are converted into "<file>.sqlite" once, and stores written before
+the trigram search index existed get it added.
+
+    python3 graph_server.py output_azure_resource_data.sqlite --port 8000
+    python3 graph_server.py output_azure_resource_data.json --static build
+
+Endpoints (GET, JSON):
+  /api/summary                                   node/edge counts, node types with counts, metadata
+  /api/search?q=&type=&offset=&limit=            nodes whose label or ID contains q (labels starting
+                                                 with q, for 1-2 characters), optionally of one type
+  /api/category?type=&offset=&limit=             nodes of one type
+  /api/neighborhood?id=&hops=&limit=             nodes within 'hops' edges of a node, in both directions
+Node lists are returned as {"nodes", "edges", "total", "offset", "limit"} and
+carry the edges between the returned nodes. The server binds to localhost and
+sends no CORS headers: the npm dev server proxies /api to it (package.json
+"proxy"), or --static serves the built viewer from the same origin.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, quote, urlsplit
+
+from az_command import chunk_list
+from graph_model import AzureResourceGraph
+from graph_output import SQLiteGraphWriter, is_sqlite_graph
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+MAX_HOPS = 4
+# Node IDs bound per SQLite query
+QUERY_CHUNK_SIZE = 500
+
+
+def open_graph_store(filename: str) -> str:
+    """
+    Returns the SQLite store for a graph file, converting json/ndjson
+    outputs into "<file>.sqlite" when it is missing or older than the file.
+    """
+    if is_sqlite_graph(filename):
+        store = filename
+    else:
+        store = f"{filename}.sqlite"
+        if not os.path.exists(store) or os.path.getmtime(store) < os.path.getmtime(filename):
+            print(f"[INFO] Converting {filename} into the SQLite store {store} ...")
+            SQLiteGraphWriter(store).write(AzureResourceGraph.load_from_file(filename))
+    conn = sqlite3.connect(store)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'nodes_fts'").fetchone():
+            print(f"[INFO] Adding the trigram search index to {store} ...")
+            SQLiteGraphWriter.build_search_index(conn)
+    finally:
+        conn.close()
+    return store
+
+
+class GraphStore:
+    """
+    Read-only queries over a SQLite graph store, with one connection per thread.
+    """
+    NODE_COLUMNS = "id, label, type, color, x, y"
+
+    def __init__(self, filename: str):
+        self.uri = f"file:{quote(os.path.abspath(filename))}?mode=ro"
+        self.local = threading.local()
+        # Trigram index over labels and IDs, missing when SQLite lacks FTS5/trigram
+        self.fts = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'nodes_fts'").fetchone() is not None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlite3.connect(self.uri, uri=True)
+        return conn
+
+    @staticmethod
+    def _node(row) -> Dict:
+        node_id, label, node_type, color, x, y = row
+        node = {"id": node_id, "label": label, "type": node_type, "color": color}
+        if x is not None:
+            node["x"], node["y"] = x, y
+        return node
+
+    def summary(self) -> Dict:
+        conn = self.conn
+        (nodes,) = conn.execute("SELECT COUNT(*) FROM nodes").fetchone()
+        (edges,) = conn.execute("SELECT COUNT(*) FROM edges").fetchone()
+        types = dict(conn.execute("SELECT type, COUNT(*) FROM nodes GROUP BY type ORDER BY type"))
+        metadata = {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM metadata")}
+        return {"nodes": nodes, "edges": edges, "types": types, "metadata": metadata}
+
+    def nodes_by_id(self, node_ids) -> List[Dict]:
+        nodes = []
+        for chunk in chunk_list(list(node_ids), QUERY_CHUNK_SIZE):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(f"SELECT {self.NODE_COLUMNS} FROM nodes WHERE id IN ({placeholders})", chunk)
+            nodes.extend(self._node(row) for row in rows)
+        return nodes
+
+    def edges_between(self, node_ids) -> List[Dict]:
+        """
+        Edges whose source and target are both in node_ids, looked up by source.
+        """
+        node_ids = set(node_ids)
+        edges = []
+        for chunk in chunk_list(list(node_ids), QUERY_CHUNK_SIZE):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(
+                f"SELECT source, target, label, color FROM edges WHERE source IN ({placeholders})", chunk
+            )
+            edges.extend({"source": source, "target": target, "label": label, "color": color}
+                         for source, target, label, color in rows if target in node_ids)
+        return edges
+
+    def _page(self, where: str, parameters: tuple, offset: int, limit: int) -> Dict:
+        (total,) = self.conn.execute(f"SELECT COUNT(*) FROM nodes WHERE {where}", parameters).fetchone()
+        rows = self.conn.execute(
+            f"SELECT {self.NODE_COLUMNS} FROM nodes WHERE {where} ORDER BY label, id LIMIT ? OFFSET ?",
+            (*parameters, limit, offset)
+        )
+        nodes = [self._node(row) for row in rows]
+        return {"nodes": nodes, "edges": self.edges_between(node["id"] for node in nodes),
+                "total": total, "offset": offset, "limit": limit}
+
+    def search(self, query: str, node_type: str = None, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Dict:
+        """
+        Nodes whose label or ID contains 'query', through the trigram index.
+        Queries shorter than a trigram match label prefixes instead, through
+        the label index, as do all queries when the store has no trigram index.
+        """
+        if self.fts and len(query) >= 3:
+            where = "rowid IN (SELECT rowid FROM nodes_fts WHERE nodes_fts MATCH ?)"
+            # A quoted phrase matches as a case-insensitive substring
+            parameters = ('"' + query.replace('"', '""') + '"',)
+        else:
+            where = "label LIKE ? ESCAPE '\\'"
+            parameters = (query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",)
+        if node_type:
+            where += " AND type = ?"
+            parameters += (node_type,)
+        return self._page(where, parameters, offset, limit)
+
+    def category(self, node_type: str, offset: int = 0, limit: int = DEFAULT_PAGE_SIZE) -> Dict:
+        return self._page("type = ?", (node_type,), offset, limit)
+
+    def neighborhood(self, node_id: str, hops: int = 1, limit: int = DEFAULT_PAGE_SIZE) -> Dict:
+        """
+        Breadth-first over edges in both directions, through the source
+        (primary key) and target indexes, until 'hops' or 'limit' nodes.
+        """
+        if not self.conn.execute("SELECT 1 FROM nodes WHERE id = ?", (node_id,)).fetchone():
+            raise KeyError(node_id)
+        seen = {node_id: None}  # insertion-ordered, nearest first
+        frontier = [node_id]
+        truncated = False
+        for _ in range(hops):
+            reached = []
+            for chunk in chunk_list(frontier, QUERY_CHUNK_SIZE):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT target FROM edges WHERE source IN ({placeholders}) "
+                    f"UNION SELECT source FROM edges WHERE target IN ({placeholders})",
+                    chunk + chunk
+                )
+                for (neighbor,) in rows:
+                    if neighbor not in seen:
+                        seen[neighbor] = None
+                        reached.append(neighbor)
+            if len(seen) > limit:
+                truncated = True
+                break
+            frontier = reached
+            if not frontier:
+                break
+        node_ids = list(seen)[:limit]
+        nodes = self.nodes_by_id(node_ids)
+        return {"nodes": nodes, "edges": self.edges_between(node["id"] for node in nodes),
+                "total": len(seen), "offset": 0, "limit": limit, "truncated": truncated}
+
+
+class GraphRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Answers /api/* from the graph store; other paths are static files from
+    the --static directory, if one was given.
+    """
+    store: GraphStore = None
+    static_dir: str = None
+    # Log every request (--verbose)
+    verbose: bool = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=self.static_dir or os.getcwd(), **kwargs)
+
+    def _json(self, payload, status=HTTPStatus.OK):
+        body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if not url.path.startswith("/api/"):
+            if self.static_dir:
+                return super().do_GET()
+            return self.send_error(HTTPStatus.NOT_FOUND)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            offset = max(0, int(params.get("offset", 0)))
+            limit = min(max(1, int(params.get("limit", DEFAULT_PAGE_SIZE))), MAX_PAGE_SIZE)
+            endpoint = url.path[len("/api/"):]
+            if endpoint == "summary":
+                return self._json(self.store.summary())
+            if endpoint == "search":
+                return self._json(self.store.search(params.get("q", ""), params.get("type"), offset, limit))
+            if endpoint == "category" and params.get("type"):
+                return self._json(self.store.category(params["type"], offset, limit))
+            if endpoint == "neighborhood" and params.get("id"):
+                hops = min(max(1, int(params.get("hops", 1))), MAX_HOPS)
+                return self._json(self.store.neighborhood(params["id"], hops, limit))
+        except ValueError as e:
+            return self._json({"error": str(e)}, HTTPStatus.BAD_REQUEST)
+        except KeyError as e:
+            return self._json({"error": f"No node with ID '{e.args[0]}'"}, HTTPStatus.NOT_FOUND)
+        self._json({"error": f"Unknown endpoint or missing parameter: {url.path}"}, HTTPStatus.NOT_FOUND)
+
+    def log_request(self, code="-", size="-"):
+        if self.verbose:
+            super().log_request(code, size)
+
+    def log_message(self, format, *args):
+        print(f"[DEBUG] {self.address_string()} {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a collected graph to the viewer on demand.")
+    parser.add_argument("input", nargs="?", default="output_azure_resource_data.sqlite",
+                        help="Graph written by azure_resource_graph_collector.py (sqlite, or any other "
+                             "format, converted once)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--static", metavar="DIRECTORY",
+                        help="Also serve the built viewer (npm run build) from this directory")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    GraphRequestHandler.store = store = GraphStore(open_graph_store(args.input))
+    GraphRequestHandler.static_dir = args.static and os.path.abspath(args.static)
+    GraphRequestHandler.verbose = args.verbose
+    summary = store.summary()
+    server = ThreadingHTTPServer((args.host, args.port), GraphRequestHandler)
+    print(f"[INFO] Serving {summary['nodes']} nodes and {summary['edges']} edges on "
+          f"http://{args.host}:{args.port}/api/summary")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+SQLite-backed cache of principal names, UAMI principal IDs and federated
+credentials, shared across collector runs (--cache-dir / --cache-mode).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List
+
+from az_command import chunk_list
+from profiler import Profiler
+
+# Persistent cache defaults (TTL in seconds per namespace)
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "azure_resource_graph")
+DEFAULT_CACHE_MAX_ENTRIES = 200000
+CACHE_TTLS = {
+    "principal_name": 7 * 24 * 3600,
+    "uami_principal": 7 * 24 * 3600,
+    "federated_credentials": 24 * 3600,
+}
+
+
+class PersistentCache:
+    """
+    SQLite-backed key/value cache shared across collector runs.
+    Entries live in a namespace, expire after a per-entry TTL and the table is
+    trimmed back to 'max_entries' (least recently used first) on close.
+
+    mode:
+      "use"     - read and write the cache (default)
+      "refresh" - ignore existing entries but store fresh results
+      "bypass"  - never read nor write
+    """
+    MODES = ("use", "refresh", "bypass")
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, mode: str = "use",
+                 max_entries: int = DEFAULT_CACHE_MAX_ENTRIES, profiler: Profiler = None):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        self.profiler = profiler or Profiler()
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.conn = None
+        if mode == "bypass":
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, "cache.sqlite3")
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache (accessed_at)")
+        self.conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        self.conn.commit()
+        print(f"[INFO] Using persistent cache at {self.path} (mode={mode})")
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict:
+        """
+        Returns {key: value} for every key that has a live entry.
+        """
+        if self.mode != "use" or not keys:
+            return {}
+        now = time.time()
+        found = {}
+        with self.lock:
+            # SQLite limits the number of bound parameters, query in chunks
+            for chunk in chunk_list(list(keys), 500):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(
+                    f"SELECT key, value FROM cache WHERE namespace = ? AND key IN ({placeholders}) "
+                    f"AND expires_at >= ?",
+                    (namespace, *chunk, now)
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value)
+            if found:
+                for chunk in chunk_list(list(found), 500):
+                    placeholders = ",".join("?" * len(chunk))
+                    self.conn.execute(
+                        f"UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key IN ({placeholders})",
+                        (now, namespace, *chunk)
+                    )
+                self.conn.commit()
+        self.profiler.count_cache(f"persistent:{namespace}", len(found), len(keys) - len(found))
+        return found
+
+    def get(self, namespace: str, key: str):
+        return self.get_many(namespace, [key]).get(key)
+
+    def set_many(self, namespace: str, items: Dict, ttl: float = None):
+        if self.mode == "bypass" or not items:
+            return
+        ttl = CACHE_TTLS.get(namespace, 24 * 3600) if ttl is None else ttl
+        now = time.time()
+        rows = [(namespace, key, json.dumps(value), now + ttl, now) for key, value in items.items()]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", rows)
+            self.conn.commit()
+
+    def set(self, namespace: str, key: str, value, ttl: float = None):
+        self.set_many(namespace, {key: value}, ttl)
+
+    def delete_many(self, namespace: str, keys):
+        """
+        Drops the entries of 'keys', e.g. for resources known to have changed.
+        """
+        if self.mode == "bypass" or not keys:
+            return
+        with self.lock:
+            for chunk in chunk_list(list(keys), 500):
+                placeholders = ",".join("?" * len(chunk))
+                self.conn.execute(f"DELETE FROM cache WHERE namespace = ? AND key IN ({placeholders})",
+                                  (namespace, *chunk))
+            self.conn.commit()
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used ones above 'max_entries'.
+        """
+        if self.conn is None:
+            return
+        with self.lock:
+            self.conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+            (count,) = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                print(f"[INFO] Evicting {overflow} least recently used cache entries ...")
+                self.conn.execute(
+                    "DELETE FROM cache WHERE rowid IN "
+                    "(SELECT rowid FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,)
+                )
+            self.conn.commit()
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.evict()
+        with self.lock:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,184 @@
+"""
+Profiler (--profile): per command family latency and failures, cache hit rates,
+and timed spans of the processor phases, with a Chrome trace of both.
+"""
+import functools
+import heapq
+import json
+import threading
+import time
+from typing import Dict
+
+from az_command import command_family
+
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+PROFILE_MAX_TRACE_EVENTS = 1000000
+
+
+class Profiler:
+    """
+    Collects per command family counts, latency histograms, bytes parsed and
+    failures, cache hit/miss counters, and timed spans for processor phases.
+    A disabled profiler costs a single attribute check per call.
+    """
+    def __init__(self, enabled: bool = False, top_scopes: int = 25):
+        self.enabled = enabled
+        self.top_scopes = top_scopes
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.commands = {}   # family -> stats dict
+        self.phases = {}     # phase name -> {"count", "total"}
+        self.caches = {}     # cache name -> {"hits", "misses"}
+        self.slowest = []    # min-heap of (duration, phase, scope)
+        self.events = []     # Chrome trace events
+        self.thread_ids = {}
+
+    def _tid(self) -> int:
+        ident = threading.get_ident()
+        tid = self.thread_ids.get(ident)
+        if tid is None:
+            tid = self.thread_ids[ident] = len(self.thread_ids) + 1
+            self.events.append({
+                "ph": "M", "name": "thread_name", "pid": 1, "tid": tid,
+                "args": {"name": threading.current_thread().name}
+            })
+        return tid
+
+    def _event(self, name: str, category: str, start: float, duration: float, args: Dict):
+        if len(self.events) < PROFILE_MAX_TRACE_EVENTS:
+            self.events.append({
+                "ph": "X", "name": name, "cat": category, "pid": 1, "tid": self._tid(),
+                "ts": round((start - self.started) * 1e6), "dur": round(duration * 1e6), "args": args
+            })
+
+    def record_command(self, command: str, start: float, duration: float, size: int, failed: bool):
+        if not self.enabled:
+            return
+        family = command_family(command)
+        bucket = next((i for i, limit in enumerate(LATENCY_BUCKETS_MS) if duration * 1000 <= limit),
+                      len(LATENCY_BUCKETS_MS))
+        with self.lock:
+            stats = self.commands.get(family)
+            if stats is None:
+                stats = self.commands[family] = {
+                    "count": 0, "failures": 0, "total": 0.0, "max": 0.0, "bytes": 0,
+                    "histogram": [0] * (len(LATENCY_BUCKETS_MS) + 1)
+                }
+            stats["count"] += 1
+            stats["failures"] += int(failed)
+            stats["total"] += duration
+            stats["max"] = max(stats["max"], duration)
+            stats["bytes"] += size
+            stats["histogram"][bucket] += 1
+            self._event(family, "az", start, duration, {"command": command[:300], "failed": failed})
+
+    def count_cache(self, name: str, hits: int, misses: int):
+        if not self.enabled or not (hits or misses):
+            return
+        with self.lock:
+            stats = self.caches.setdefault(name, {"hits": 0, "misses": 0})
+            stats["hits"] += hits
+            stats["misses"] += misses
+
+    def record_span(self, phase: str, scope, start: float, duration: float):
+        with self.lock:
+            stats = self.phases.setdefault(phase, {"count": 0, "total": 0.0})
+            stats["count"] += 1
+            stats["total"] += duration
+            if scope:
+                entry = (duration, phase, scope)
+                if len(self.slowest) < self.top_scopes:
+                    heapq.heappush(self.slowest, entry)
+                elif entry > self.slowest[0]:
+                    heapq.heapreplace(self.slowest, entry)
+            self._event(phase, "phase", start, duration, {"scope": scope} if scope else {})
+
+    def report(self) -> Dict:
+        with self.lock:
+            commands = {}
+            for family, stats in sorted(self.commands.items(), key=lambda item: -item[1]["total"]):
+                commands[family] = {
+                    "count": stats["count"],
+                    "failures": stats["failures"],
+                    "total_seconds": round(stats["total"], 3),
+                    "mean_ms": round(stats["total"] / stats["count"] * 1000, 1),
+                    "max_ms": round(stats["max"] * 1000, 1),
+                    "bytes_parsed": stats["bytes"],
+                    "latency_histogram_ms": {
+                        (f"<={limit}" if i < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}"): n
+                        for i, (limit, n) in enumerate(zip(LATENCY_BUCKETS_MS + [None], stats["histogram"]))
+                    },
+                }
+            caches = {
+                name: dict(stats, hit_rate=round(stats["hits"] / (stats["hits"] + stats["misses"]), 3))
+                for name, stats in self.caches.items()
+            }
+            phases = {
+                name: {"count": stats["count"], "total_seconds": round(stats["total"], 3)}
+                for name, stats in sorted(self.phases.items(), key=lambda item: -item[1]["total"])
+            }
+            slowest = [
+                {"phase": phase, "scope": scope, "seconds": round(duration, 3)}
+                for duration, phase, scope in sorted(self.slowest, reverse=True)
+            ]
+        return {
+            "wall_seconds": round(time.perf_counter() - self.started, 3),
+            "commands": commands,
+            "phases": phases,
+            "caches": caches,
+            "slowest_scopes": slowest,
+        }
+
+    def write(self, prefix: str):
+        """
+        Writes <prefix>.json (report) and <prefix>.trace.json (chrome://tracing / Perfetto).
+        """
+        report = self.report()
+        with open(f"{prefix}.json", "w") as file:
+            json.dump(report, file, indent=2)
+        with self.lock:
+            with open(f"{prefix}.trace.json", "w") as file:
+                json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, file)
+        print(f"[INFO] Profile written to {prefix}.json and {prefix}.trace.json")
+        return report
+
+    @staticmethod
+    def print_summary(report: Dict, top: int = 10):
+        print(f"\n[PROFILE] Wall time: {report['wall_seconds']:.1f}s")
+        print("[PROFILE] Command families by total time:")
+        for family, stats in list(report["commands"].items())[:top]:
+            print(f"    {family:<40} {stats['count']:>7} calls {stats['total_seconds']:>9.1f}s "
+                  f"mean {stats['mean_ms']:>8.1f}ms max {stats['max_ms']:>8.1f}ms "
+                  f"failures {stats['failures']}")
+        if report["caches"]:
+            print("[PROFILE] Cache hit rates:")
+            for name, stats in report["caches"].items():
+                print(f"    {name:<40} {stats['hit_rate']:>6.1%} ({stats['hits']} hits, {stats['misses']} misses)")
+        print("[PROFILE] Slowest scopes:")
+        for entry in report["slowest_scopes"][:top]:
+            print(f"    {entry['seconds']:>8.2f}s {entry['phase']:<32} {entry['scope']}")
+
+
+def profiled(phase: str):
+    """
+    Times an AzureResourceProcessor method as a profiler span. The first
+    argument (a scope ID, or a resource dict's "id") is reported as the scope.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            profiler = self.profiler
+            if not profiler.enabled:
+                return method(self, *args, **kwargs)
+            scope = args[0] if args else None
+            if isinstance(scope, dict):
+                scope = scope.get("id")
+            elif not isinstance(scope, str):
+                scope = None
+            start = time.perf_counter()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                profiler.record_span(phase, scope, start, time.perf_counter() - start)
+        return wrapper
+    return decorator
@@ -0,0 +1,211 @@
+"""
+Rate governor: per API family token buckets with adaptive concurrency, and
+retries of throttled az calls with jittered exponential backoff.
+"""
+import random
+import re
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlsplit
+
+from az_command import CALL_INFO, GRAPH_ENDPOINT, parse_az_command
+
+# Rate governor defaults per API family: (requests per second, burst)
+RATE_LIMITS = {
+    "arm": (20.0, 250),    # ARM reads, per subscription and principal
+    "arg": (3.0, 15),      # Resource Graph: 15 queries per 5 seconds per user
+    "graph": (50.0, 100),  # Microsoft Graph directory reads
+}
+DEFAULT_MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+# Below this many remaining ARM requests (x-ms-ratelimit-remaining-*), stop raising concurrency
+RATELIMIT_REMAINING_LOW = 50
+# Throttling in az stderr: the HTTP status (reason phrase, or 429 next to "status"/"HTTP")
+# or a throttling error code of ARM, Resource Graph or Microsoft Graph. A bare "429"
+# (e.g. in a resource name) or the word "throttle" in a message does not count.
+THROTTLE_ERROR_CODES = ("TooManyRequests", "SubscriptionRequestsThrottled", "TenantRequestsThrottled",
+                        "RateLimiting", "Request_ThrottledTemporarily")
+THROTTLE_PATTERN = re.compile(
+    r"\b(?:" + "|".join(THROTTLE_ERROR_CODES) + r")\b|Too Many Requests|"
+    r"(?i:\bstatus(?: code)?|\bHTTP(?:/[\d.]+)?)\W{0,3}429\b"
+)
+RETRY_AFTER_PATTERN = re.compile(r"retry[- ]after\D{0,10}?(\d+)", re.IGNORECASE)
+
+
+class TokenBucket:
+    """
+    Allows 'rate' acquisitions per second on average, with bursts up to 'capacity'.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    Rate and concurrency limit of one API family. Concurrency follows AIMD:
+    +1 per window of successful calls, halved (at most once a second) on
+    throttling. A Retry-After pauses the whole family.
+    """
+    def __init__(self, name: str, rate: float, burst: float, initial_concurrency: int = 8,
+                 max_concurrency: int = 64):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.limit = float(initial_concurrency)
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.calls = 0
+        self.throttles = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                wait = self.blocked_until - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                elif self.in_flight >= int(self.limit):
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+        self.bucket.acquire()
+
+    def release(self, throttled: bool, retry_after: float = None, remaining: int = None):
+        with self.condition:
+            self.in_flight -= 1
+            self.calls += 1
+            now = time.monotonic()
+            if throttled:
+                self._throttled(now, retry_after)
+            elif remaining is None or remaining > RATELIMIT_REMAINING_LOW:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+    def report_throttle(self, retry_after: float = None):
+        """
+        Throttling seen outside of an acquire/release pair, e.g. in an ARM /batch sub-response.
+        """
+        with self.condition:
+            self._throttled(time.monotonic(), retry_after)
+            self.condition.notify_all()
+
+    def _throttled(self, now: float, retry_after: float = None):
+        self.throttles += 1
+        if now - self.last_decrease >= 1.0:
+            self.limit = max(1.0, self.limit / 2)
+            self.last_decrease = now
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+class RateGovernor:
+    """
+    Runs az commands through a per-family AdaptiveLimiter ("arm", "arg",
+    "graph") and retries throttled calls with jittered exponential backoff,
+    waiting at least as long as Retry-After. Backends report throttling in
+    CALL_INFO.throttled / CALL_INFO.retry_after / CALL_INFO.remaining.
+    """
+    def __init__(self, limits: Dict = None, max_retries: int = DEFAULT_MAX_RETRIES,
+                 initial_concurrency: int = 8, max_concurrency: int = 64):
+        limits = dict(RATE_LIMITS, **(limits or {}))
+        self.limiters = {
+            family: AdaptiveLimiter(family, rate, burst, initial_concurrency, max_concurrency)
+            for family, (rate, burst) in limits.items()
+        }
+        self.max_retries = max_retries
+        self.retries = 0
+        self.gave_up = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def family(command: str) -> str:
+        try:
+            group, options = parse_az_command(command)
+        except ValueError:
+            return "arm"
+        if group == "graph query":
+            return "arg"
+        if group and group.startswith("ad "):
+            return "graph"
+        if group == "rest" and isinstance(options.get("url"), str):
+            parts = urlsplit(options["url"])
+            if parts.netloc.lower() == urlsplit(GRAPH_ENDPOINT).netloc:
+                return "graph"
+            if "/microsoft.resourcegraph/" in parts.path.lower():
+                return "arg"
+        return "arm"
+
+    @staticmethod
+    def parse_limits(spec: str) -> Dict:
+        """
+        Parses "arm=10,arg=2:10" (family=rate[:burst]) into RATE_LIMITS overrides.
+        """
+        limits = {}
+        for item in filter(None, (part.strip() for part in spec.split(","))):
+            family, _, value = item.partition("=")
+            if family not in RATE_LIMITS:
+                raise ValueError(f"Unknown API family '{family}', expected one of {tuple(RATE_LIMITS)}")
+            rate, _, burst = value.partition(":")
+            limits[family] = (float(rate), float(burst) if burst else RATE_LIMITS[family][1])
+            if limits[family][0] <= 0 or limits[family][1] < 1:
+                raise ValueError(f"Invalid rate limit '{item}': rate must be > 0 and burst >= 1")
+        return limits
+
+    def call(self, command: str, run):
+        """
+        Returns run(command), retrying while the backend reports throttling.
+        """
+        family = self.family(command)
+        limiter = self.limiters[family]
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            throttled = False
+            try:
+                result = run(command)
+                throttled = CALL_INFO.throttled
+            finally:
+                limiter.release(throttled, CALL_INFO.retry_after, CALL_INFO.remaining)
+            if not throttled:
+                return result
+            if attempt == self.max_retries:
+                with self.lock:
+                    self.gave_up += 1
+                print(f"[ERROR] Still throttled after {self.max_retries} retries, giving up: {command}")
+                return result
+            # Full jitter, but never sooner than the server asked for
+            delay = max(CALL_INFO.retry_after or 0,
+                        random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt)))
+            with self.lock:
+                self.retries += 1
+            print(f"[WARNING] Throttled ({family}), retry {attempt + 1}/{self.max_retries} "
+                  f"in {delay:.1f}s: {command[:200]}")
+            time.sleep(delay)
+
+    def print_summary(self):
+        throttles = {name: limiter.throttles for name, limiter in self.limiters.items() if limiter.throttles}
+        if not throttles:
+            return
+        print(f"[INFO] Throttled calls per API family: {throttles}; "
+              f"{self.retries} retries, {self.gave_up} call(s) gave up.")
+        for name, limiter in self.limiters.items():
+            print(f"    {name:<6} {limiter.calls} calls, final concurrency limit {int(limiter.limit)}")
@@ -0,0 +1,37 @@
+"""
+Splits the tenant's subscriptions into shards (--shard INDEX/COUNT), so separate
+processes or hosts can each collect one and --merge combines their outputs.
+"""
+import argparse
+import hashlib
+from typing import Dict, List
+
+SHARD_METHODS = ("hash", "index")
+
+
+def parse_shard(value: str):
+    """
+    Parses an "--shard I/N" argument into (I, N).
+    """
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected a shard as INDEX/COUNT (e.g. 0/4), got '{value}'")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be in 0..{count - 1}, got '{value}'")
+    return index, count
+
+
+def shard_subscriptions(subscriptions: List[Dict], index: int, count: int, method: str = "hash") -> List[Dict]:
+    """
+    Returns the subscriptions of shard 'index' out of 'count'.
+    "index" deals the subscriptions out in ID order; "hash" assigns each one by a
+    stable hash of its ID, so adding a subscription does not move the others.
+    """
+    if method == "index":
+        return sorted(subscriptions, key=lambda sub: sub["id"].lower())[index::count]
+    return [
+        sub for sub in subscriptions
+        if int(hashlib.sha256(sub["id"].lower().encode()).hexdigest(), 16) % count == index
+    ]
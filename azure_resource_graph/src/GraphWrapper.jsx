@@ -1,13 +1,21 @@
-import React, { useEffect, useRef, useState } from "react";
+import React, { useCallback, useEffect, useRef, useState } from "react";
 import { SigmaContainer, useSigma } from "@react-sigma/core";
-import forceAtlas2 from "graphology-layout-forceatlas2"; // New layout package
 import { MultiGraph } from "graphology";
 import { debounce } from "lodash";
-import {
-  indexParallelEdgesIndex,
-  EdgeCurvedArrowProgram,
-} from "@sigma/edge-curve";
+import { EdgeCurvedArrowProgram } from "@sigma/edge-curve";
 import { EdgeArrowProgram } from "sigma/rendering";
+import {
+  addToSearchIndex,
+  buildSearchIndex,
+  matchNodes,
+  nodesOfType,
+  removeFromSearchIndex,
+} from "./searchIndex";
+
+const LAYOUT_ITERATIONS = 100;
+
+// Graph server mode: expanded neighborhoods kept on screen; expanding more evicts the oldest.
+const MAX_EXPANSIONS = 8;
 
 const DEFAULT_EDGE_CURVATURE = 0.25;
 
@@ -20,11 +28,111 @@ function getCurvature(index, maxIndex) {
   return (maxCurvature * index) / maxIndex;
 }
 
-const GraphComponent = ({ searchQuery, selectedCategory, graphData }) => {
+// Curves the edges between the same two nodes apart, looking only at the given
+// edges' node pairs; an edge alone between its nodes stays straight.
+function curveParallelEdges(graph, edges) {
+  const done = new Set();
+  edges.forEach((edge) => {
+    if (done.has(edge)) return;
+    const [source, target] = graph.extremities(edge);
+    const forward = graph.outEdges(source, target);
+    const backward = source === target ? [] : graph.outEdges(target, source);
+    const maxIndex = Math.max(forward.length, backward.length);
+    // Opposite directions get the same indexes: relative to their direction they bend to opposite sides.
+    [forward, backward].forEach((group) =>
+      group.forEach((parallel, i) => {
+        done.add(parallel);
+        const curvature =
+          forward.length + backward.length > 1 ? getCurvature(i + 1, maxIndex) : 0;
+        graph.mergeEdgeAttributes(parallel, {
+          type: curvature ? "curved" : "straight",
+          curvature,
+        });
+      })
+    );
+  });
+}
+
+const nodeAttributes = (node, x, y) => ({
+  label: node.label,
+  size: 5,
+  color: node.color,
+  resourceType: node.type,
+  x,
+  y,
+});
+
+const edgeAttributes = (edge) => ({
+  label: edge.label,
+  color: edge.color,
+  type: "arrow",
+  size: 2,
+});
+
+const hasPosition = (node) => typeof node.x === "number" && typeof node.y === "number";
+
+// Adds the nodes and edges of `addition` that the graph lacks, in place. New nodes
+// keep their precomputed position in a positioned graph, otherwise they go next to
+// a neighbor already on screen, or `anchor`. Returns the IDs of the added nodes.
+function addToGraph(graph, { nodes, edges }, { anchor = null, positioned = false, index = null }) {
+  const linked = new Map();
+  const link = (node, other) => {
+    if (!linked.has(node)) linked.set(node, []);
+    linked.get(node).push(other);
+  };
+  edges.forEach(({ source, target }) => {
+    link(source, target);
+    link(target, source);
+  });
+  const spread = Math.sqrt(graph.order) || 1;
+  const origin = anchor && graph.hasNode(anchor) ? graph.getNodeAttributes(anchor) : { x: 0, y: 0 };
+
+  const added = [];
+  nodes.forEach((node) => {
+    if (graph.hasNode(node.id)) return;
+    let { x, y } = node;
+    if (!positioned || !hasPosition(node)) {
+      const neighbor = (linked.get(node.id) || []).find((other) => graph.hasNode(other));
+      const center = neighbor ? graph.getNodeAttributes(neighbor) : origin;
+      x = center.x + (Math.random() - 0.5) * spread;
+      y = center.y + (Math.random() - 0.5) * spread;
+    }
+    graph.addNode(node.id, nodeAttributes(node, x, y));
+    if (index) addToSearchIndex(index, node.id, graph.getNodeAttributes(node.id));
+    added.push(node.id);
+  });
+
+  const addedEdges = [];
+  edges.forEach((edge) => {
+    if (!graph.hasNode(edge.source) || !graph.hasNode(edge.target)) return;
+    const duplicate = graph
+      .outEdges(edge.source, edge.target)
+      .some((other) => graph.getEdgeAttribute(other, "label") === edge.label);
+    if (!duplicate) addedEdges.push(graph.addEdge(edge.source, edge.target, edgeAttributes(edge)));
+  });
+  curveParallelEdges(graph, addedEdges);
+  return added;
+}
+
+const GraphComponent = ({ searchQuery, selectedCategory, graphData, additions, onExpandNode }) => {
   const sigma = useSigma();
   const [hoveredNode, setHoveredNode] = useState(null);
   const [frozenNode, setFrozenNode] = useState(null);
   const containerRef = useRef(null);
+  // Search/category indexes and neighbor sets of the current graph.
+  const indexRef = useRef(null);
+  const neighborsRef = useRef(new Map());
+  // Bumped when nodes are added to or dropped from the current graph in place.
+  const [graphVersion, setGraphVersion] = useState(0);
+  // Whether the current graph uses the collector's precomputed positions.
+  const positionedRef = useRef(false);
+  // How many of `additions` the current graph holds.
+  const appliedRef = useRef(0);
+  // Graph server mode: expanded node -> nodes its neighborhood added, oldest first,
+  // requests in flight, and the AbortController of the current graph's requests.
+  const expansionsRef = useRef(new Map());
+  const expandingRef = useRef(new Set());
+  const controllerRef = useRef(null);
 
   // Setup graph and initial layout.
   useEffect(() => {
@@ -32,91 +140,174 @@ const GraphComponent = ({ searchQuery, selectedCategory, graphData }) => {
 
     const graph = new MultiGraph({ multi: true });
     const { nodes, edges } = graphData;
+    // Graphs collected with --layout carry positions; only lay out the others here.
+    const positioned = nodes.length > 0 && nodes.every(hasPosition);
 
     nodes.forEach((node) => {
       if (!graph.hasNode(node.id)) {
-        // Optionally, add default positions:
-        graph.addNode(node.id, {
-          label: node.label,
-          size: 5,
-          color: node.color,
-          resourceType: node.type,
-          x: Math.random(),
-          y: Math.random(),
-        });
+        graph.addNode(
+          node.id,
+          nodeAttributes(node, positioned ? node.x : Math.random(), positioned ? node.y : Math.random())
+        );
       }
     });
 
     edges.forEach((edge) => {
-      graph.addEdge(edge.source, edge.target, {
-        label: edge.label,
-        color: edge.color,
-        type: "arrow",
-        size: 2,
-      });
+      graph.addEdge(edge.source, edge.target, edgeAttributes(edge));
     });
 
-    // Index parallel edges to assign curvature.
-    indexParallelEdgesIndex(graph, {
-      edgeIndexAttribute: "parallelIndex",
-      edgeMinIndexAttribute: "parallelMinIndex",
-      edgeMaxIndexAttribute: "parallelMaxIndex",
-    });
+    // Assign curvature to parallel edges.
+    curveParallelEdges(graph, graph.edges());
 
-    // Assign curvature to edges.
-    graph.forEachEdge((edge, { parallelIndex, parallelMaxIndex }) => {
-      const curvature =
-        typeof parallelIndex === "number"
-          ? getCurvature(parallelIndex, parallelMaxIndex)
-          : 0;
-      graph.mergeEdgeAttributes(edge, {
-        type: curvature ? "curved" : "straight",
-        curvature,
-      });
-    });
+    indexRef.current = buildSearchIndex(graph);
+    neighborsRef.current = new Map();
+    positionedRef.current = positioned;
+    appliedRef.current = 0;
+    expansionsRef.current = new Map();
+    expandingRef.current = new Set();
+    const controller = new AbortController();
+    controllerRef.current = controller;
 
-    // Use a force-directed layout instead of a random layout.
-    forceAtlas2.assign(graph, { iterations: 100 });
+    // Use a force-directed layout instead of a random layout, computed in a Web Worker.
+    let worker = null;
+    if (!positioned) {
+      worker = new Worker(new URL("./layout.worker.js", import.meta.url));
+      worker.onmessage = ({ data: positions }) => {
+        graph.updateEachNodeAttributes((node, attributes) => ({ ...attributes, ...positions[node] }));
+        // Nodes added while the layout ran ("Load more", neighborhoods) were placed next to
+        // pre-layout positions; move them next to a laid-out neighbor.
+        const spread = Math.sqrt(graph.order) || 1;
+        graph.forEachNode((node) => {
+          if (positions[node]) return;
+          const neighbor = graph.neighbors(node).find((other) => positions[other]);
+          const center = positions[neighbor] || { x: 0, y: 0 };
+          graph.mergeNodeAttributes(node, {
+            x: center.x + (Math.random() - 0.5) * spread,
+            y: center.y + (Math.random() - 0.5) * spread,
+          });
+        });
+        sigma.refresh();
+        worker.terminate();
+      };
+      worker.postMessage({
+        nodes: graph.mapNodes((node, { x, y }) => [node, x, y]),
+        edges: graph.mapEdges((edge, attributes, source, target) => [source, target]),
+        iterations: LAYOUT_ITERATIONS,
+      });
+    }
 
     sigma.setGraph(graph);
     sigma.refresh();
 
-    return () => graph.clear();
+    return () => {
+      if (worker) worker.terminate();
+      controller.abort();
+      graph.clear();
+    };
   }, [graphData, sigma]);
 
+  // Graph server mode: further pages of the current results ("Load more") are added in place.
+  useEffect(() => {
+    if (!additions || appliedRef.current >= additions.length) return;
+    const graph = sigma.getGraph();
+    additions.slice(appliedRef.current).forEach((addition) => {
+      addToGraph(graph, addition, { positioned: positionedRef.current, index: indexRef.current });
+      // Result nodes that a neighborhood brought in first are no longer evicted with it
+      const results = new Set(addition.nodes.map((node) => node.id));
+      expansionsRef.current.forEach((nodes, expanded, expansions) => {
+        expansions.set(expanded, nodes.filter((node) => !results.has(node)));
+      });
+    });
+    appliedRef.current = additions.length;
+    neighborsRef.current = new Map();
+    setGraphVersion((version) => version + 1);
+  }, [additions, sigma]);
+
+  // Graph server mode: loads a node's neighborhood into the current graph, once, and
+  // evicts the nodes of the oldest neighborhoods beyond MAX_EXPANSIONS.
+  const expandNode = useCallback(
+    (node) => {
+      const expansions = expansionsRef.current;
+      if (expansions.has(node)) {
+        // Most recently used again
+        const added = expansions.get(node);
+        expansions.delete(node);
+        expansions.set(node, added);
+        return;
+      }
+      if (expandingRef.current.has(node)) return;
+      const controller = controllerRef.current;
+      const expanding = expandingRef.current;
+      expanding.add(node);
+      onExpandNode(node, controller.signal)
+        .then((result) => {
+          // The graph was replaced while the request was in flight
+          if (controller.signal.aborted) return;
+          const graph = sigma.getGraph();
+          if (!graph.hasNode(node)) return;
+          const added = addToGraph(graph, result, {
+            anchor: node,
+            positioned: positionedRef.current,
+            index: indexRef.current,
+          });
+          expansions.set(node, added);
+          while (expansions.size > MAX_EXPANSIONS) {
+            const [oldest, nodes] = expansions.entries().next().value;
+            expansions.delete(oldest);
+            // Nodes other neighborhoods were expanded from stay
+            nodes.forEach((evicted) => {
+              if (!graph.hasNode(evicted) || expansions.has(evicted)) return;
+              removeFromSearchIndex(indexRef.current, evicted, graph.getNodeAttributes(evicted));
+              graph.dropNode(evicted);
+            });
+          }
+          neighborsRef.current = new Map();
+          setGraphVersion((version) => version + 1);
+        })
+        .catch((error) => {
+          if (error.name !== "AbortError") console.error("Error querying the graph server:", error);
+        })
+        .finally(() => expanding.delete(node));
+    },
+    [sigma, onExpandNode]
+  );
+
   // Control node/edge visibility based on search/hover/frozen states.
   useEffect(() => {
-    if (!sigma || !graphData) return;
+    if (!sigma || !graphData || !indexRef.current) return;
 
     const graph = sigma.getGraph();
     const debouncedRefresh = debounce(() => sigma.refresh(), 300);
 
+    // Matches and neighbors are computed once per change here; the reducers only look them up.
+    const index = indexRef.current;
+    const searchMatches = searchQuery ? matchNodes(index, searchQuery) : null;
+    const categoryMatches = selectedCategory ? nodesOfType(index, selectedCategory) : null;
+    const focusNode = frozenNode || hoveredNode;
+    let focusNeighbors = new Set();
+    if (focusNode && graph.hasNode(focusNode)) {
+      if (!neighborsRef.current.has(focusNode)) {
+        neighborsRef.current.set(focusNode, new Set(graph.neighbors(focusNode)));
+      }
+      focusNeighbors = neighborsRef.current.get(focusNode);
+    }
+    const inFocus = (node) => node === focusNode || focusNeighbors.has(node);
+
     sigma.setSetting("nodeReducer", (node, data) => {
       const res = { ...data };
 
       if (frozenNode) {
-        res.hidden =
-          node !== frozenNode && !graph.areNeighbors(frozenNode, node);
-        res.label =
-          node === frozenNode || graph.areNeighbors(frozenNode, node)
-            ? data.label
-            : "";
+        res.hidden = !inFocus(node);
+        res.label = inFocus(node) ? data.label : "";
       } else {
-        if (
-          searchQuery &&
-          !data.label.toLowerCase().includes(searchQuery.toLowerCase())
-        ) {
+        if (searchMatches && !searchMatches.has(node)) {
           res.hidden = true;
-        } else if (selectedCategory && data.resourceType !== selectedCategory) {
+        } else if (categoryMatches && !categoryMatches.has(node)) {
           res.hidden = true;
         } else if (hoveredNode) {
           // Show node and its neighbors’ labels when hovered.
-          res.hidden =
-            hoveredNode !== node && !graph.areNeighbors(hoveredNode, node);
-          res.label =
-            hoveredNode === node || graph.areNeighbors(hoveredNode, node)
-              ? data.label
-              : "";
+          res.hidden = !inFocus(node);
+          res.label = inFocus(node) ? data.label : "";
         } else {
           res.hidden = false;
         }
@@ -133,18 +324,8 @@ const GraphComponent = ({ searchQuery, selectedCategory, graphData }) => {
         res.hidden = source !== frozenNode && target !== frozenNode;
       } else {
         if (
-          (searchQuery &&
-            (!graph
-              .getNodeAttribute(source, "label")
-              .toLowerCase()
-              .includes(searchQuery.toLowerCase()) &&
-              !graph
-                .getNodeAttribute(target, "label")
-                .toLowerCase()
-                .includes(searchQuery.toLowerCase()))) ||
-          (selectedCategory &&
-            (graph.getNodeAttribute(source, "resourceType") !== selectedCategory &&
-              graph.getNodeAttribute(target, "resourceType") !== selectedCategory))
+          (searchMatches && !searchMatches.has(source) && !searchMatches.has(target)) ||
+          (categoryMatches && !categoryMatches.has(source) && !categoryMatches.has(target))
         ) {
           res.hidden = true;
         } else if (hoveredNode && source !== hoveredNode && target !== hoveredNode) {
@@ -158,7 +339,7 @@ const GraphComponent = ({ searchQuery, selectedCategory, graphData }) => {
     });
 
     debouncedRefresh();
-  }, [searchQuery, selectedCategory, hoveredNode, frozenNode, sigma, graphData]);
+  }, [searchQuery, selectedCategory, hoveredNode, frozenNode, sigma, graphData, graphVersion]);
 
   // Event listeners for hover and click interactions.
   useEffect(() => {
@@ -172,6 +353,8 @@ const GraphComponent = ({ searchQuery, selectedCategory, graphData }) => {
     };
     const handleNodeClick = ({ node }) => {
       setFrozenNode((prevFrozen) => (prevFrozen === node ? null : node));
+      // Freezing a node (not hovering it) loads its neighbors from the graph server
+      if (onExpandNode && frozenNode !== node) expandNode(node);
     };
 
     sigma.on("enterNode", handleNodeHover);
@@ -183,12 +366,19 @@ const GraphComponent = ({ searchQuery, selectedCategory, graphData }) => {
       sigma.off("leaveNode", handleNodeOut);
       sigma.off("clickNode", handleNodeClick);
     };
-  }, [sigma, frozenNode]);
+  }, [sigma, frozenNode, onExpandNode, expandNode]);
 
   return <div ref={containerRef} />;
 };
 
-const GraphWrapper = ({ searchQuery, selectedCategory, graphData }) => {
+const GraphWrapper = ({
+  searchQuery,
+  selectedCategory,
+  graphData,
+  additions = null,
+  onExpandNode = null,
+  emptyMessage = "Please upload a JSON file to visualize the graph.",
+}) => {
   return (
     <div style={{ display: "flex", flexDirection: "column", gap: "1rem" }}>
       {graphData ? (
@@ -205,10 +395,12 @@ const GraphWrapper = ({ searchQuery, selectedCategory, graphData }) => {
             searchQuery={searchQuery}
             selectedCategory={selectedCategory}
             graphData={graphData}
+            additions={additions}
+            onExpandNode={onExpandNode}
           />
         </SigmaContainer>
       ) : (
-        <p>Please upload a JSON file to visualize the graph.</p>
+        <p>{emptyMessage}</p>
       )}
     </div>
   );
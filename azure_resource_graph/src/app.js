@@ -1,12 +1,36 @@
-import React, { useState } from "react";
+import React, { useCallback, useEffect, useRef, useState } from "react";
+import { debounce } from "lodash";
 import GraphWrapper from "./GraphWrapper";
 import Legend from "./Legend";
+import { loadGraphFile } from "./graphLoader";
+import {
+  fetchCategory,
+  fetchNeighborhood,
+  fetchSummary,
+  isAbortError,
+  searchNodes,
+} from "./graphServer";
 import "./app.css";
 
+const reportError = (error) => {
+  if (!isAbortError(error)) console.error("Error querying the graph server:", error);
+};
+
 function App() {
   const [searchQuery, setSearchQuery] = useState("");
   const [selectedCategory, setSelectedCategory] = useState("");
   const [graphData, setGraphData] = useState(null);
+  // Server mode: further pages of the current results, added to the graph in place.
+  const [additions, setAdditions] = useState([]);
+  // Summary of graph_server.py when it is running; the viewer then loads subgraphs on demand.
+  const [server, setServer] = useState(null);
+  const [page, setPage] = useState(null);
+  // Server mode: the page request in flight, aborted when a newer one replaces it.
+  const pageRequestRef = useRef(null);
+
+  useEffect(() => {
+    fetchSummary().then(setServer);
+  }, []);
 
   const handleSearchChange = (event) => {
     setSearchQuery(event.target.value);
@@ -19,26 +43,79 @@ function App() {
   const handleFileUpload = (event) => {
     const file = event.target.files[0];
     if (file) {
-      const reader = new FileReader();
-      reader.onload = (e) => {
-        try {
-          const jsonData = JSON.parse(e.target.result);
-          setGraphData(jsonData);
-        } catch (error) {
-          console.error("Error parsing JSON:", error);
-          alert("Invalid JSON file.");
-        }
-      };
-      reader.readAsText(file);
+      loadGraphFile(file)
+        .then((data) => {
+          setServer(null);
+          setAdditions([]);
+          setGraphData(data);
+        })
+        .catch((error) => {
+          console.error("Error loading graph file:", error);
+          alert(`Invalid graph file: ${error.message}`);
+        });
     }
   };
 
+  // Server mode: each search/category change replaces the graph with the first page of matches.
+  // Only the latest request is applied; older ones are aborted.
+  const loadPage = useCallback((query, category, offset) => {
+    if (pageRequestRef.current) pageRequestRef.current.abort();
+    const controller = new AbortController();
+    pageRequestRef.current = controller;
+    const request = query
+      ? searchNodes(query, category, offset, controller.signal)
+      : fetchCategory(category, offset, controller.signal);
+    return request.then((result) => {
+      if (controller.signal.aborted) return null;
+      setPage({ query, category, offset: result.offset + result.nodes.length, total: result.total });
+      return result;
+    });
+  }, []);
+
+  const debouncedLoad = useRef(
+    debounce((query, category) => {
+      if (!query && !category) {
+        if (pageRequestRef.current) pageRequestRef.current.abort();
+        setPage(null);
+        setGraphData(null);
+        return;
+      }
+      loadPage(query, category, 0)
+        .then((result) => {
+          if (!result) return;
+          setAdditions([]);
+          setGraphData(result);
+        })
+        .catch(reportError);
+    }, 300)
+  ).current;
+
+  useEffect(() => {
+    if (server) debouncedLoad(searchQuery, selectedCategory);
+  }, [server, searchQuery, selectedCategory, debouncedLoad]);
+
+  const handleLoadMore = () => {
+    loadPage(page.query, page.category, page.offset)
+      .then((result) => {
+        if (result) setAdditions((current) => [...current, result]);
+      })
+      .catch(reportError);
+  };
+
+  // Server mode: freezing a node loads its neighbors; GraphWrapper adds them in place
+  // and aborts the request if the graph is replaced first.
+  const handleExpandNode = useCallback((node, signal) => fetchNeighborhood(node, 1, signal), []);
+
+  // The server already filtered the nodes; the viewer only filters uploaded files.
+  const viewerQuery = server ? "" : searchQuery;
+  const viewerCategory = server ? "" : selectedCategory;
+
   return (
     <div className="App">
       <div className="header-row">
         <h1>🏴‍☠️ Azure Resource Graph (ARG) 🏴‍☠️</h1>
         <div className="controls">
-          <input type="file" accept=".json" onChange={handleFileUpload} />
+          <input type="file" accept=".json,.ndjson,.gz" onChange={handleFileUpload} />
           <select className="category-dropdown" value={selectedCategory} onChange={handleCategoryChange}>
             <option value="">Select Category</option>
             <option value="Microsoft.ContainerService/managedClusters">AKS</option>
@@ -56,11 +133,24 @@ function App() {
             <option value="Microsoft.Compute/virtualMachineScaleSets">VirtualMachineScaleSet</option>
           </select>
           <input type="text" className="search-box" placeholder="Search..." value={searchQuery} onChange={handleSearchChange} />
+          {server && (
+            <span className="server-status">
+              {page ? `${page.offset} of ${page.total} matches` : `${server.nodes} nodes on the graph server`}
+              {page && page.offset < page.total && <button onClick={handleLoadMore}>Load more</button>}
+            </span>
+          )}
           <Legend />
         </div>
       </div>
       <div className="main-container">
-        <GraphWrapper searchQuery={searchQuery} selectedCategory={selectedCategory} graphData={graphData} />
+        <GraphWrapper
+          searchQuery={viewerQuery}
+          selectedCategory={viewerCategory}
+          graphData={graphData}
+          additions={additions}
+          onExpandNode={server ? handleExpandNode : null}
+          emptyMessage={server ? "Search or select a category to load nodes from the graph server." : undefined}
+        />
       </div>
     </div>
   );
@@ -0,0 +1,102 @@
+// Loads graph files written by azure_resource_graph_collector.py:
+//   - {"nodes": [...], "edges": [...]} (indented or compact)
+//   - the same document with a "strings" table (types/colors/labels by index)
+//   - NDJSON records ({"n": ...}, {"e": ...}, {"u": ...}, {"p": ...}, {"rn": ...}, {"re": ...}, {"s": ...})
+//   - any of the above gzip-compressed
+// Returns { nodes, edges } in the original JSON shape expected by GraphWrapper; nodes carry
+// x/y when the collector precomputed a layout (--layout).
+
+const GZIP_MAGIC = [0x1f, 0x8b];
+const ZSTD_MAGIC = [0x28, 0xb5, 0x2f, 0xfd];
+
+const startsWith = (bytes, magic) => magic.every((byte, i) => bytes[i] === byte);
+
+async function readText(file) {
+  const head = new Uint8Array(await file.slice(0, 4).arrayBuffer());
+  if (startsWith(head, ZSTD_MAGIC)) {
+    throw new Error("zstd-compressed graphs are not supported in the browser, use --compress gzip.");
+  }
+  if (startsWith(head, GZIP_MAGIC)) {
+    const stream = file.stream().pipeThrough(new DecompressionStream("gzip"));
+    return new Response(stream).text();
+  }
+  return file.text();
+}
+
+function parseDocument(data) {
+  const strings = data.strings || [];
+  const deref = (value) => (typeof value === "number" ? strings[value] : value);
+  return {
+    nodes: (data.nodes || []).map((node) => ({
+      ...node,
+      type: deref(node.type),
+      color: deref(node.color),
+    })),
+    edges: (data.edges || []).map((edge) => ({
+      ...edge,
+      label: deref(edge.label),
+      color: deref(edge.color),
+    })),
+  };
+}
+
+function parseNdjson(text) {
+  const strings = [];
+  const deref = (value) => (typeof value === "number" ? strings[value] : value);
+  const nodes = new Map();
+  const edges = new Map();
+  const incident = new Map();
+  const edgeKey = (source, target, label) => JSON.stringify([source, target, label]);
+  const link = (nodeId, key) => {
+    if (!incident.has(nodeId)) incident.set(nodeId, new Set());
+    incident.get(nodeId).add(key);
+  };
+
+  for (const line of text.split("\n")) {
+    if (!line.trim()) continue;
+    const record = JSON.parse(line);
+    if ("s" in record) {
+      strings[record.s] = record.v;
+    } else if ("n" in record) {
+      const [id, label, type, color] = record.n;
+      if (!nodes.has(id)) nodes.set(id, { id, label, type: deref(type), color: deref(color) });
+    } else if ("e" in record) {
+      const [source, target, label, color] = record.e;
+      const resolvedLabel = deref(label);
+      const key = edgeKey(source, target, resolvedLabel);
+      if (!edges.has(key)) {
+        edges.set(key, { source, target, label: resolvedLabel, color: deref(color) });
+        link(source, key);
+        link(target, key);
+      }
+    } else if ("u" in record) {
+      const [id, label] = record.u;
+      if (nodes.has(id)) nodes.get(id).label = label;
+    } else if ("p" in record) {
+      const [id, x, y] = record.p;
+      if (nodes.has(id)) Object.assign(nodes.get(id), { x, y });
+    } else if ("rn" in record) {
+      nodes.delete(record.rn);
+      (incident.get(record.rn) || []).forEach((key) => edges.delete(key));
+      incident.delete(record.rn);
+    } else if ("re" in record) {
+      edges.delete(edgeKey(...record.re));
+    }
+  }
+  return { nodes: [...nodes.values()], edges: [...edges.values()] };
+}
+
+export async function loadGraphFile(file) {
+  const text = await readText(file);
+  const firstLine = text.slice(0, text.indexOf("\n") === -1 ? text.length : text.indexOf("\n"));
+  let first = null;
+  try {
+    first = JSON.parse(firstLine);
+  } catch (error) {
+    // Indented JSON document, the first line is just "{"
+  }
+  if (first && !("nodes" in first)) {
+    return parseNdjson(text);
+  }
+  return parseDocument(JSON.parse(text));
+}
@@ -0,0 +1,41 @@
+// Client for graph_server.py, which serves the collected graph on demand:
+// search results, one category, or the neighborhood of a node, page by page.
+// The npm dev server proxies /api to it (see "proxy" in package.json).
+// Every response is { nodes, edges, total, offset, limit } in the GraphWrapper shape.
+
+export const PAGE_SIZE = 500;
+
+// Requests take an optional AbortSignal, so callers can drop responses they no longer need.
+async function get(path, params = {}, signal = undefined) {
+  const query = new URLSearchParams(
+    Object.entries(params).filter(([, value]) => value !== undefined && value !== "")
+  );
+  const response = await fetch(`/api/${path}?${query}`, { signal });
+  if (!response.ok) {
+    throw new Error(`Graph server returned ${response.status} for /api/${path}`);
+  }
+  return response.json();
+}
+
+// Resolves to the graph summary, or null when no graph server is running.
+export async function fetchSummary() {
+  try {
+    return await get("summary");
+  } catch (error) {
+    return null;
+  }
+}
+
+export function searchNodes(query, type, offset = 0, signal = undefined) {
+  return get("search", { q: query, type, offset, limit: PAGE_SIZE }, signal);
+}
+
+export function fetchCategory(type, offset = 0, signal = undefined) {
+  return get("category", { type, offset, limit: PAGE_SIZE }, signal);
+}
+
+export function fetchNeighborhood(id, hops = 1, signal = undefined) {
+  return get("neighborhood", { id, hops, limit: PAGE_SIZE }, signal);
+}
+
+export const isAbortError = (error) => error.name === "AbortError";
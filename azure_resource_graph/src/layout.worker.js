@@ -0,0 +1,12 @@
+// Runs ForceAtlas2 off the main thread. Receives
+//   { nodes: [[id, x, y], ...], edges: [[source, target], ...], iterations }
+// and posts back the final positions as { id: { x, y } }.
+import { MultiGraph } from "graphology";
+import forceAtlas2 from "graphology-layout-forceatlas2";
+
+onmessage = ({ data }) => {
+  const graph = new MultiGraph();
+  data.nodes.forEach(([id, x, y]) => graph.addNode(id, { x, y }));
+  data.edges.forEach(([source, target]) => graph.addEdge(source, target));
+  postMessage(forceAtlas2(graph, { iterations: data.iterations }));
+};
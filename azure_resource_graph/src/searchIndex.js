@@ -0,0 +1,67 @@
+// Search and category indexes over a graphology graph, built once per graph so
+// the sigma reducers only look nodes up in precomputed sets:
+//   - lowercase labels
+//   - label trigrams -> nodes, to narrow substring searches of 3+ characters
+//   - resource type -> nodes
+// Nodes added to or dropped from the graph later are indexed one by one.
+
+const trigramsOf = (text) => {
+  const grams = new Set();
+  for (let i = 0; i + 3 <= text.length; i++) grams.add(text.slice(i, i + 3));
+  return grams;
+};
+
+export function buildSearchIndex(graph) {
+  const index = { labels: new Map(), trigrams: new Map(), byType: new Map() };
+  graph.forEachNode((node, attributes) => addToSearchIndex(index, node, attributes));
+  return index;
+}
+
+export function addToSearchIndex(index, node, { label, resourceType }) {
+  const lower = (label || "").toLowerCase();
+  index.labels.set(node, lower);
+  trigramsOf(lower).forEach((gram) => {
+    if (!index.trigrams.has(gram)) index.trigrams.set(gram, new Set());
+    index.trigrams.get(gram).add(node);
+  });
+  if (!index.byType.has(resourceType)) index.byType.set(resourceType, new Set());
+  index.byType.get(resourceType).add(node);
+}
+
+export function removeFromSearchIndex(index, node, { resourceType }) {
+  const lower = index.labels.get(node);
+  if (lower === undefined) return;
+  index.labels.delete(node);
+  trigramsOf(lower).forEach((gram) => {
+    const postings = index.trigrams.get(gram);
+    postings.delete(node);
+    if (postings.size === 0) index.trigrams.delete(gram);
+  });
+  const ofType = index.byType.get(resourceType);
+  if (ofType) ofType.delete(node);
+}
+
+// Nodes whose label contains `query`, case-insensitively.
+export function matchNodes(index, query) {
+  const needle = query.toLowerCase();
+  let candidates = index.labels.keys();
+  if (needle.length >= 3) {
+    // Every match holds all trigrams of the query; the rarest one bounds the candidates.
+    let rarest = null;
+    for (const gram of trigramsOf(needle)) {
+      const postings = index.trigrams.get(gram);
+      if (!postings) return new Set();
+      if (!rarest || postings.size < rarest.size) rarest = postings;
+    }
+    candidates = rarest;
+  }
+  const matches = new Set();
+  for (const node of candidates) {
+    if (index.labels.get(node).includes(needle)) matches.add(node);
+  }
+  return matches;
+}
+
+export function nodesOfType(index, type) {
+  return index.byType.get(type) || new Set();
+}
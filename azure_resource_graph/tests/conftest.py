@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+
+from az_cli import AzureCLI  # noqa: E402
+from azure_resource_graph_collector import RESOURCE_TYPES, AzureResourceProcessor  # noqa: E402
+from graph_model import AzureResourceGraph  # noqa: E402
+from synthetic_tenant import FakeAzBackend, SyntheticTenant  # noqa: E402
+
+SMALL_TENANT = dict(subscriptions=2, resource_groups=3, resources_per_type=2, uamis=3,
+                    principals=20, role_assignments=60, vault_policies=2)
+
+
+def snapshot(graph):
+    """
+    Comparable view of a graph: its (id, label, type) nodes and (source, target, label) edges.
+    """
+    nodes = {(n["id"], n["label"], n["type"]) for n in graph.nodes}
+    edges = {(e["source"], e["target"], e["label"]) for e in graph.edges}
+    return nodes, edges
+
+
+@pytest.fixture
+def tenant():
+    return SyntheticTenant(seed=1, **SMALL_TENANT)
+
+
+@pytest.fixture
+def processor_for():
+    """
+    Builds an AzureResourceProcessor answering from a synthetic tenant.
+    """
+    def processor_for(tenant, graph=None, **options):
+        graph = graph if graph is not None else AzureResourceGraph()
+        return AzureResourceProcessor(graph, AzureCLI(FakeAzBackend(tenant)), **options)
+    return processor_for
+
+
+@pytest.fixture
+def collect(processor_for):
+    """
+    Runs a full collection of a tenant and returns the graph.
+    """
+    def collect(tenant, **options):
+        processor = processor_for(tenant, **options)
+        processor.process_all_subscriptions(RESOURCE_TYPES)
+        return processor.graph
+    return collect
@@ -0,0 +1,185 @@
+"""
+ArmBatchExecutor and the batched per-UAMI reads of AzureResourceProcessor.
+"""
+import threading
+
+from az_cli import ARM_BATCH_URL, ArmBatchExecutor
+from azure_resource_graph_collector import RESOURCE_TYPES, AzureResourceProcessor
+from graph_model import AzureResourceGraph
+
+UAMI_ID = ("/subscriptions/s1/resourceGroups/rg1/providers/"
+           "Microsoft.ManagedIdentity/userAssignedIdentities/uami1")
+
+
+class StubCLI:
+    """
+    Answers ARM /batch POSTs from 'responses' (relative URL -> (status, content))
+    and other 'az rest' GETs from 'pages' (absolute URL -> content). URLs in
+    'throttles' (relative URL -> count) are answered 429 that many times first,
+    with a Retry-After of 'retry_after' seconds.
+    """
+    governor = None
+
+    def __init__(self, responses=None, pages=None, fail_batches=False, throttles=None, retry_after=0):
+        self.responses = responses or {}
+        self.pages = pages or {}
+        self.fail_batches = fail_batches
+        self.throttles = dict(throttles or {})
+        self.retry_after = retry_after
+        self.batches = []
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def run_az_rest(self, method, url, body=None):
+        if url != ARM_BATCH_URL:
+            return self.pages.get(url)
+        with self.lock:
+            self.batches.append([request["url"] for request in body["requests"]])
+        if self.fail_batches:
+            return None
+        return {"responses": [self._response(request) for request in body["requests"]]}
+
+    def _response(self, request):
+        url = request["url"]
+        with self.lock:
+            if self.throttles.get(url):
+                self.throttles[url] -= 1
+                return {"name": request["name"], "httpStatusCode": 429, "headers": {"retry-after": str(self.retry_after)},
+                        "content": {"error": {"code": "TooManyRequests"}}}
+        status, content = self.responses.get(url, (404, None))
+        return {"name": request["name"], "httpStatusCode": status, "content": content}
+
+    def run_az_cli(self, command):
+        self.commands.append(command)
+        return []
+
+
+def test_batches_resolve_by_status():
+    cli = StubCLI({"/a": (200, {"id": "a"}), "/b": (500, {"error": {}})})
+    executor = ArmBatchExecutor(cli, linger=0.2)
+    try:
+        futures = [executor.submit(url) for url in ("/a", "/b", "/c")]
+        assert [future.result() for future in futures] == [{"id": "a"}, None, {}]
+        assert cli.batches == [["/a", "/b", "/c"]]
+    finally:
+        executor.close()
+
+
+def test_same_url_shares_one_request():
+    cli = StubCLI({"/a": (200, {"id": "a"})})
+    executor = ArmBatchExecutor(cli, linger=0.2)
+    try:
+        first, second = executor.submit("/a"), executor.submit("/a")
+        assert first is second
+        assert executor.get("/a") == {"id": "a"}
+        assert executor.futures == {}
+        assert cli.batches == [["/a"]]
+    finally:
+        executor.close()
+
+
+def test_urls_differing_in_case_share_one_request():
+    # ARG returns lowercased IDs, az output keeps the resource's own casing
+    cli = StubCLI({"/Subscriptions/s1/A": (200, {"id": "a"})})
+    executor = ArmBatchExecutor(cli, linger=0.2)
+    try:
+        prefetched = executor.submit("/Subscriptions/s1/A")
+        assert executor.get("/subscriptions/s1/a") == {"id": "a"}
+        assert prefetched.result() == {"id": "a"}
+        assert executor.futures == {}
+        assert cli.batches == [["/Subscriptions/s1/A"]]
+    finally:
+        executor.close()
+
+
+def test_batches_are_split_at_max_size():
+    cli = StubCLI()
+    executor = ArmBatchExecutor(cli, max_batch_size=2, linger=0.2)
+    try:
+        for future in [executor.submit(f"/{i}") for i in range(5)]:
+            future.result()
+        assert sorted(len(batch) for batch in cli.batches) == [1, 2, 2]
+    finally:
+        executor.close()
+
+
+def test_throttled_requests_are_retried(monkeypatch):
+    delays = []
+    monkeypatch.setattr("az_cli.random.uniform", lambda low, high: 0.0)
+    monkeypatch.setattr("az_cli.time.sleep", delays.append)
+    cli = StubCLI({"/a": (200, {"id": "a"}), "/b": (200, {"id": "b"})}, throttles={"/b": 2})
+    executor = ArmBatchExecutor(cli, linger=0.2)
+    try:
+        futures = [executor.submit(url) for url in ("/a", "/b")]
+        assert [future.result() for future in futures] == [{"id": "a"}, {"id": "b"}]
+        # Only the throttled request is sent again
+        assert cli.batches == [["/a", "/b"], ["/b"], ["/b"]]
+    finally:
+        executor.close()
+
+
+def test_retry_after_is_honoured_and_retries_are_bounded(monkeypatch):
+    delays = []
+    monkeypatch.setattr("az_cli.random.uniform", lambda low, high: 0.0)
+    monkeypatch.setattr("az_cli.time.sleep", delays.append)
+    cli = StubCLI({"/a": (200, {"id": "a"})}, throttles={"/a": 10}, retry_after=7)
+    executor = ArmBatchExecutor(cli, linger=0.2, max_retries=2)
+    try:
+        assert executor.submit("/a").result() is None
+        assert len(cli.batches) == 3
+        assert delays == [7.0, 7.0]
+    finally:
+        executor.close()
+
+
+def test_failed_batch_falls_back_to_az():
+    cli = StubCLI(fail_batches=True)
+    processor = AzureResourceProcessor(AzureResourceGraph(), cli, arm_batch=True)
+    try:
+        assert processor.fetch_federated_credentials_for_uami(UAMI_ID) == []
+        assert cli.commands == [processor.federated_credentials_command(UAMI_ID)]
+    finally:
+        processor.close()
+
+
+def test_federated_credentials_follow_next_link():
+    next_link = f"https://management.azure.com{UAMI_ID}/federatedIdentityCredentials?page=2"
+    url = AzureResourceProcessor.federated_credentials_url(UAMI_ID)
+    cli = StubCLI(
+        {url: (200, {"value": [{"name": "fc1", "properties": {}}], "nextLink": next_link})},
+        {next_link: {"value": [{"name": "fc2", "properties": {}}]}},
+    )
+    processor = AzureResourceProcessor(AzureResourceGraph(), cli, arm_batch=True)
+    try:
+        credentials = processor.fetch_federated_credentials_for_uami(UAMI_ID)
+        assert [fc["name"] for fc in credentials] == ["fc1", "fc2"]
+        assert cli.commands == []
+    finally:
+        processor.close()
+
+
+def test_prefetch_skips_fetched_uamis():
+    cli = StubCLI()
+    processor = AzureResourceProcessor(AzureResourceGraph(), cli, arm_batch=True)
+    try:
+        processor.prefetch_uami(UAMI_ID)
+        processor.fetch_federated_credentials_for_uami(UAMI_ID)
+        processor.fetch_uami_principal_id(UAMI_ID)
+        # Later references to the same UAMI would queue responses nobody collects
+        for _ in range(3):
+            processor.prefetch_uami(UAMI_ID)
+        assert processor.batch.futures == {}
+        assert sum(len(batch) for batch in cli.batches) == 2
+    finally:
+        processor.close()
+
+
+def test_collection_leaves_no_uncollected_futures(tenant, processor_for):
+    processor = processor_for(tenant, arm_batch=True)
+    try:
+        processor.process_all_subscriptions(RESOURCE_TYPES)
+        processor.link_uami_principals_by_id()
+        assert processor.batch.futures == {}
+        assert processor.batch.pending == []
+    finally:
+        processor.close()
@@ -0,0 +1,212 @@
+"""
+The in-process REST backend's translation of az commands into REST calls, and
+recording a run and replaying it offline.
+"""
+import json
+import time
+
+import pytest
+from conftest import snapshot
+
+from az_cli import AzureCLI, AzureCLIBackend, RecordingBackend, ReplayBackend, RestBackend
+from az_command import ARM_API_VERSIONS, ARM_ENDPOINT, CALL_INFO, GRAPH_ENDPOINT
+from azure_resource_graph_collector import RESOURCE_TYPES, AzureResourceProcessor
+from graph_model import AzureResourceGraph
+from synthetic_tenant import FakeAzBackend
+
+UAMI = "/subscriptions/s1/resourceGroups/rg/providers/Microsoft.ManagedIdentity/userAssignedIdentities/u1"
+
+
+class FakePool:
+    """
+    Answers requests for the URLs in 'responses' ({url: payload} or {url: (status, payload)})
+    with 404 for the others, and records (method, url, body) of every request.
+    """
+    def __init__(self, responses=None, headers=None):
+        self.responses = responses or {}
+        self.headers = headers or {}
+        self.requests = []
+        self.authorization = []
+
+    def request(self, method, url, body=None, headers=None):
+        self.requests.append((method, url, json.loads(body) if body else None))
+        self.authorization.append(headers["Authorization"])
+        response = self.responses.get(url, (404, {"error": {"code": "NotFound"}}))
+        status, payload = response if isinstance(response, tuple) else (200, response)
+        if isinstance(payload, Exception):
+            raise payload
+        return status, self.headers, json.dumps(payload).encode()
+
+    def close(self):
+        pass
+
+
+class TokenBackend(AzureCLIBackend):
+    """
+    The fallback: hands out one token per audience and records every other command.
+    """
+    def __init__(self):
+        self.commands = []
+
+    def run(self, command):
+        if command.startswith("az account get-access-token"):
+            resource = command.split("--resource ")[1].split()[0]
+            return {"accessToken": f"token for {resource}", "expires_on": time.time() + 3600}
+        self.commands.append(command)
+        return "from az"
+
+
+def rest_backend(responses=None, headers=None):
+    return RestBackend(FakePool(responses, headers), TokenBackend())
+
+
+def arm(path, api):
+    return f"{ARM_ENDPOINT}{path}?api-version={ARM_API_VERSIONS[api]}"
+
+
+@pytest.mark.parametrize("command, method, url, body, response, expected", [
+    (
+        "az account list --output json",
+        "GET", arm("/subscriptions", "subscriptions"), None,
+        {"value": [{"subscriptionId": "s1", "displayName": "one", "state": "Enabled", "tenantId": "t"}]},
+        [{"id": "s1", "name": "one", "state": "Enabled", "tenantId": "t"}],
+    ),
+    (
+        'az graph query -q "Resources | take 1" --first 5 --subscriptions s1 s2 --skip-token "abc" --output json',
+        "POST", arm("/providers/Microsoft.ResourceGraph/resources", "resourcegraph"),
+        {"query": "Resources | take 1", "options": {"$top": 5, "$skipToken": "abc"}, "subscriptions": ["s1", "s2"]},
+        {"count": 1, "data": [{"id": "x"}], "$skipToken": "next", "totalRecords": 9},
+        {"count": 1, "data": [{"id": "x"}], "skip_token": "next", "total_records": 9},
+    ),
+    (
+        f'az identity show --ids "{UAMI}" --query principalId --output tsv',
+        "GET", arm(UAMI, "managedidentity"), None,
+        {"id": UAMI, "properties": {"principalId": "p1"}},
+        "p1\n",
+    ),
+    (
+        "az identity federated-credential list --identity-name u1 --resource-group rg --subscription s1 --output json",
+        "GET", arm(f"{UAMI}/federatedIdentityCredentials", "managedidentity"), None,
+        {"value": [{"name": "fc", "properties": {"issuer": "https://issuer", "subject": "repo:x"}}]},
+        [{"name": "fc", "issuer": "https://issuer", "subject": "repo:x"}],
+    ),
+    (
+        "az ad user show --id p1 --query displayName --output tsv",
+        "GET", f"{GRAPH_ENDPOINT}/v1.0/users/p1", None, {"displayName": "Alice"}, "Alice\n",
+    ),
+    (
+        "az ad sp show --id p2 --query displayName --output tsv",
+        "GET", f"{GRAPH_ENDPOINT}/v1.0/servicePrincipals/p2", None, {"displayName": "app"}, "app\n",
+    ),
+    (
+        "az ad group show --group p3 --query displayName --output tsv",
+        "GET", f"{GRAPH_ENDPOINT}/v1.0/groups/p3", None, {"displayName": "admins"}, "admins\n",
+    ),
+], ids=["account list", "graph query", "identity show", "federated credentials", "user", "sp", "group"])
+def test_commands_map_to_rest_calls(command, method, url, body, response, expected):
+    backend = rest_backend({url: response})
+    cli = AzureCLI(backend)
+    assert cli.run_az_cli(command) == expected
+    assert not cli.last_call_failed()
+    assert backend.pool.requests == [(method, url, body)]
+    audience = url.split("/v1.0/")[0] if url.startswith(GRAPH_ENDPOINT) else ARM_ENDPOINT
+    assert backend.pool.authorization == [f"Bearer token for {audience}/"]
+    assert backend.fallback.commands == []
+
+
+def test_az_rest_sends_the_body_file():
+    url = f"{GRAPH_ENDPOINT}/v1.0/directoryObjects/getByIds"
+    backend = rest_backend({url: {"value": [{"id": "p1"}]}})
+    assert AzureCLI(backend).run_az_rest("POST", url, {"ids": ["p1"]}) == {"value": [{"id": "p1"}]}
+    assert backend.pool.requests == [("POST", url, {"ids": ["p1"]})]
+
+
+def test_role_assignments_keep_the_exact_scope_and_resolve_role_names():
+    scope = "/subscriptions/s1/resourceGroups/rg"
+    definition = "/subscriptions/s1/providers/Microsoft.Authorization/roleDefinitions/r1"
+    listing = arm(f"{scope}/providers/Microsoft.Authorization/roleAssignments", "authorization")
+    listing = listing.replace("?", "?$filter=atScope()&")
+    page = {"value": [
+        {"properties": {"scope": scope.upper(), "principalId": "p1", "roleDefinitionId": definition}},
+        {"properties": {"scope": "/subscriptions/s1", "principalId": "p2", "roleDefinitionId": definition}},
+        {"properties": {"scope": scope, "principalId": "p3", "roleDefinitionId": definition}},
+    ]}
+    backend = rest_backend({listing: page, arm(definition, "authorization"): {"properties": {"roleName": "Reader"}}})
+    result = AzureCLI(backend).run_az_cli(f'az role assignment list --scope "{scope}/" --output json')
+    # The inherited subscription assignment is dropped, the definition is fetched once
+    assert [(a["principalId"], a["roleDefinitionName"]) for a in result] == [("p1", "Reader"), ("p3", "Reader")]
+    assert [request[1] for request in backend.pool.requests] == [listing, arm(definition, "authorization")]
+
+
+def test_unknown_commands_fall_back_to_az():
+    backend = rest_backend()
+    assert AzureCLI(backend).run_az_cli("az vm list --output json") == "from az"
+    assert backend.fallback.commands == ["az vm list --output json"]
+    assert backend.pool.requests == []
+
+
+@pytest.mark.parametrize("status, payload", [(500, {"error": "boom"}), (404, {}), (200, OSError("reset"))])
+def test_rest_errors_fail_the_call(status, payload):
+    url = f"{GRAPH_ENDPOINT}/v1.0/users/p1"
+    cli = AzureCLI(rest_backend({url: (status, payload)}))
+    assert cli.run_az_cli("az ad user show --id p1 --query displayName --output tsv") == []
+    assert cli.last_call_failed()
+
+
+def test_throttling_is_reported():
+    url = arm("/subscriptions", "subscriptions")
+    backend = rest_backend({url: (429, {"error": {"code": "TooManyRequests"}})},
+                           headers={"Retry-After": "7", "x-ms-ratelimit-remaining-subscription-reads": "0"})
+    CALL_INFO.throttled, CALL_INFO.retry_after, CALL_INFO.remaining = False, None, None
+    cli = AzureCLI(backend)
+    assert cli.run_az_cli("az account list --output json") == []
+    assert cli.last_call_failed()
+    assert (CALL_INFO.throttled, CALL_INFO.retry_after, CALL_INFO.remaining) == (True, 7.0, 0)
+
+
+def collect_with(backend):
+    processor = AzureResourceProcessor(AzureResourceGraph(), AzureCLI(backend))
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+    return processor.graph
+
+
+def test_replay_reproduces_a_recorded_run(tenant, tmp_path, capsys):
+    recorded = collect_with(RecordingBackend(FakeAzBackend(tenant), str(tmp_path)))
+    capsys.readouterr()
+    replayed = collect_with(ReplayBackend(str(tmp_path)))
+    assert "No recording" not in capsys.readouterr().out
+    assert snapshot(replayed) == snapshot(recorded)
+    assert len(replayed.nodes) > 0 and len(replayed.edges) > 0
+
+
+def test_replay_miss_fails_the_call(tmp_path):
+    cli = AzureCLI(ReplayBackend(str(tmp_path)))
+    assert cli.run_az_cli("az account list --output json") == []
+    assert cli.last_call_failed()
+
+
+def test_recorded_failures_fail_again_on_replay(tenant, tmp_path):
+    recorder = AzureCLI(RecordingBackend(FakeAzBackend(tenant), str(tmp_path)))
+    # The fake has no handler for this one, so it fails like a real az error
+    assert recorder.run_az_cli("az vm list --output json") == []
+    assert recorder.last_call_failed()
+    assert recorder.run_az_cli("az account list --output json")
+
+    replay = AzureCLI(ReplayBackend(str(tmp_path)))
+    assert replay.run_az_cli("az  vm list  --output json") == []
+    assert replay.last_call_failed()
+    assert replay.run_az_cli("az account list --output json") == recorder.run_az_cli("az account list --output json")
+    assert not replay.last_call_failed()
+
+
+def test_failed_next_page_fails_the_whole_listing():
+    first = arm("/subscriptions", "subscriptions")
+    second = f"{first}&$skiptoken=2"
+    backend = rest_backend({
+        first: {"value": [{"subscriptionId": "s1"}], "nextLink": second},
+        second: (500, {"error": "boom"}),
+    })
+    cli = AzureCLI(backend)
+    assert cli.run_az_cli("az account list --output json") == []
+    assert cli.last_call_failed()
+    assert [request[1] for request in backend.pool.requests] == [first, second]
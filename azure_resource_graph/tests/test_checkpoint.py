@@ -0,0 +1,109 @@
+"""
+Checkpoint journal: a failed collection resumed from its journal.
+"""
+import pytest
+from conftest import snapshot
+
+from az_cli import AzureCLI
+from azure_resource_graph_collector import RESOURCE_TYPES, AzureResourceProcessor
+from checkpoint import CheckpointJournal
+from graph_model import AzureResourceGraph
+from synthetic_tenant import FakeAzBackend
+
+
+def run(tenant, graph, journal, fail_on=None):
+    """
+    Collects the tenant into 'graph' with 'journal' attached, like main() does.
+    Role assignment lookups of scopes containing 'fail_on' raise.
+    Returns the backend, to count its calls.
+    """
+    backend = FakeAzBackend(tenant)
+    if fail_on:
+        answer = backend.run
+
+        def run_or_fail(command):
+            if command.startswith("az role assignment list") and fail_on in command:
+                raise RuntimeError(f"simulated failure: {command}")
+            return answer(command)
+
+        backend.run = run_or_fail
+    journal.attach(graph)
+    processor = AzureResourceProcessor(graph, AzureCLI(backend), max_workers=4, journal=journal)
+    if journal.resumed:
+        processor.queue_unresolved_principals()
+    try:
+        processor.process_all_subscriptions(RESOURCE_TYPES)
+        processor.link_principals_uamis_by_name()
+        processor.link_uami_principals_by_id()
+    finally:
+        processor.close()
+    return backend
+
+
+def full_collection(tenant):
+    graph = AzureResourceGraph()
+    processor = AzureResourceProcessor(graph, AzureCLI(FakeAzBackend(tenant)), max_workers=4)
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+    processor.link_principals_uamis_by_name()
+    processor.link_uami_principals_by_id()
+    return graph
+
+
+@pytest.fixture
+def failed_run(tenant, tmp_path):
+    """
+    A journal left behind by a run whose role assignment lookups failed in one resource group.
+    """
+    path = str(tmp_path / "graph.journal")
+    journal = CheckpointJournal(path, flush_interval=0)
+    with pytest.raises(RuntimeError, match="simulated failure"):
+        run(tenant, AzureResourceGraph(), journal, fail_on="/resourceGroups/rg-0001")
+    journal.close()
+    return path
+
+
+def test_resume_completes_the_graph(tenant, failed_run):
+    graph, journal = CheckpointJournal.resume(failed_run)
+    assert journal.completed
+    assert not any(unit.startswith("subscription:") for unit in journal.completed)
+    backend = run(tenant, graph, journal)
+    assert snapshot(graph) == snapshot(full_collection(tenant))
+
+    # Scopes finished before the failure are not fetched again
+    full = FakeAzBackend(tenant)
+    processor = AzureResourceProcessor(AzureResourceGraph(), AzureCLI(full), max_workers=4)
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+    assert 0 < backend.calls["role assignment list"] < full.calls["role assignment list"]
+
+
+def test_resumed_run_skips_finished_subscriptions(tenant, failed_run):
+    graph, journal = CheckpointJournal.resume(failed_run)
+    run(tenant, graph, journal)
+    journal.close()
+
+    graph, journal = CheckpointJournal.resume(failed_run)
+    assert {f"subscription:{sub['id']}" for sub in tenant.subscriptions} <= journal.completed
+    backend = run(tenant, graph, journal)
+    assert backend.calls["role assignment list"] == 0
+    assert snapshot(graph) == snapshot(full_collection(tenant))
+
+
+def test_resume_drops_a_truncated_last_line(failed_run):
+    with open(failed_run, "a") as file:
+        file.write('{"n": ["/subscriptions/cut-off", "cut')
+    graph, journal = CheckpointJournal.resume(failed_run)
+    assert not graph.has_node("/subscriptions/cut-off")
+    with open(failed_run) as file:
+        assert file.read().endswith("\n")
+
+
+def test_discard_removes_the_journal(tmp_path):
+    path = tmp_path / "graph.journal"
+    journal = CheckpointJournal(str(path))
+    graph = AzureResourceGraph()
+    journal.attach(graph)
+    graph.add_node("/subscriptions/s1", "sub", "Subscription")
+    journal.mark_done("subscription:s1")
+    journal.discard()
+    assert not path.exists()
+    assert graph.sinks == []
@@ -0,0 +1,151 @@
+import pytest
+from conftest import snapshot
+
+import graph_model
+from graph_model import AzureResourceGraph
+from graph_output import GraphWriter
+
+PRINCIPAL = "11111111-1111-1111-1111-111111111111"
+
+
+def write_shard(path, build, fmt="ndjson"):
+    """
+    Writes the graph built by build(graph) into a shard file; ndjson shards
+    stream every change, removals included.
+    """
+    graph = AzureResourceGraph()
+    writer = GraphWriter(str(path), fmt)
+    if writer.streaming:
+        writer.attach(graph)
+    build(graph)
+    writer.write(graph)
+    return str(path)
+
+
+def shard_a(graph):
+    graph.add_node("/subscriptions/a", "sub-a", "Subscription")
+    graph.add_node(PRINCIPAL, PRINCIPAL, "Principal")
+    graph.add_node("/subscriptions/a/resourceGroups/gone", "gone", "ResourceGroup")
+    graph.add_edge("/subscriptions/a", "/subscriptions/a/resourceGroups/gone", "Contains")
+    graph.add_edge(PRINCIPAL, "/subscriptions/a", "Reader")
+    graph.add_edge(PRINCIPAL, "/subscriptions/a", "Owner")
+    graph.metadata["shard"] = "a"
+    # Shard a's own view of the principal and the RG goes away
+    graph.remove(lambda node_id: node_id in (PRINCIPAL, "/subscriptions/a/resourceGroups/gone"),
+                 lambda *edge: False)
+
+
+def shard_b(graph):
+    graph.add_node("/subscriptions/b", "sub-b", "Subscription")
+    graph.add_node(PRINCIPAL, "alice", "Principal")
+    graph.add_edge(PRINCIPAL, "/subscriptions/b", "Reader")
+    graph.add_edge(PRINCIPAL, "/subscriptions/b", "Contributor")
+    graph.remove(lambda node_id: False, lambda *edge: edge[2] == "Contributor")
+    graph.metadata["shard"] = "b"
+
+
+@pytest.fixture
+def shards(tmp_path):
+    return write_shard(tmp_path / "a.ndjson", shard_a), write_shard(tmp_path / "b.ndjson", shard_b)
+
+
+def expected_union(*filenames):
+    nodes, edges = set(), set()
+    for filename in filenames:
+        shard_nodes, shard_edges = snapshot(AzureResourceGraph.load_from_file(filename))
+        nodes |= shard_nodes
+        edges |= shard_edges
+    return nodes, edges
+
+
+@pytest.mark.parametrize("order", [(0, 1), (1, 0)])
+def test_removals_only_touch_their_own_shard(shards, order):
+    graph = AzureResourceGraph()
+    for i in order:
+        graph.merge_from_file(shards[i])
+    assert snapshot(graph) == expected_union(*shards)
+    nodes, edges = snapshot(graph)
+    assert (PRINCIPAL, "alice", "Principal") in nodes
+    assert (PRINCIPAL, "/subscriptions/b", "Reader") in edges
+    # Removed inside their own shard
+    assert not any(node[0].endswith("/gone") for node in nodes)
+    assert (PRINCIPAL, "/subscriptions/a", "Reader") not in edges
+    assert (PRINCIPAL, "/subscriptions/b", "Contributor") not in edges
+
+
+def test_merge_does_not_scan_the_merged_graph(shards, monkeypatch):
+    graph = AzureResourceGraph()
+    monkeypatch.setattr(graph, "remove", lambda *args: pytest.fail("merge scanned the graph for a removal"))
+    for shard in shards:
+        graph.merge_from_file(shard)
+
+
+def test_resolved_label_wins_over_placeholder(tmp_path):
+    def placeholder(graph):
+        graph.add_node(PRINCIPAL, PRINCIPAL, "Principal")
+
+    def resolved(graph):
+        graph.add_node(PRINCIPAL, "alice", "Principal")
+
+    for first, second in ((placeholder, resolved), (resolved, placeholder)):
+        graph = AzureResourceGraph()
+        graph.merge_from_file(write_shard(tmp_path / "first.ndjson", first))
+        graph.merge_from_file(write_shard(tmp_path / "second.ndjson", second))
+        assert graph.get_node(PRINCIPAL)["label"] == "alice"
+
+
+def test_label_updates_are_merged(tmp_path):
+    graph = AzureResourceGraph()
+    graph.merge_from_file(write_shard(tmp_path / "a.ndjson", shard_b))
+
+    def renamed(graph):
+        graph.add_node(PRINCIPAL, "alice", "Principal")
+        graph.update_node_label(PRINCIPAL, "alice.smith")
+
+    graph.merge_from_file(write_shard(tmp_path / "b.ndjson", renamed))
+    assert graph.get_node(PRINCIPAL)["label"] == "alice.smith"
+
+
+@pytest.mark.parametrize("fmt", ["json", "compact", "ndjson"])
+def test_merge_returns_metadata_and_skips_duplicates(tmp_path, fmt):
+    shard = write_shard(tmp_path / f"b.{fmt}", shard_b, fmt)
+    graph = AzureResourceGraph()
+    assert graph.merge_from_file(shard) == {"shard": "b"}
+    before = snapshot(graph)
+    graph.merge_from_file(shard)
+    assert snapshot(graph) == before
+    assert graph.node_count == 2 and graph.edge_count == 1
+
+
+def test_removed_then_re_added_records_are_kept(tmp_path):
+    def readded(graph):
+        graph.add_node(PRINCIPAL, "alice", "Principal")
+        graph.add_edge(PRINCIPAL, "/subscriptions/b", "Reader")
+        graph.remove(lambda node_id: node_id == PRINCIPAL, lambda *edge: False)
+        graph.add_node(PRINCIPAL, "bob", "Principal")
+        graph.add_edge(PRINCIPAL, "/subscriptions/b", "Owner")
+
+    shard = write_shard(tmp_path / "readded.ndjson", readded)
+    graph = AzureResourceGraph()
+    graph.merge_from_file(shard)
+    assert snapshot(graph) == snapshot(AzureResourceGraph.load_from_file(shard))
+    assert snapshot(graph) == (
+        {(PRINCIPAL, "bob", "Principal")}, {(PRINCIPAL, "/subscriptions/b", "Owner")}
+    )
+
+
+def test_merge_applies_records_as_they_are_read(shards, monkeypatch):
+    graph = AzureResourceGraph()
+    read = graph_model.read_graph_records
+
+    def checked(filename):
+        # A shard is read twice; on the second pass each node is in the graph
+        # before the next record is read
+        for kind, record in read(filename):
+            yield kind, record
+            if kind == "node" and graph.node_count:
+                assert graph.has_node(record["id"])
+
+    monkeypatch.setattr(graph_model, "read_graph_records", checked)
+    graph.merge_from_file(shards[1])
+    assert snapshot(graph) == expected_union(shards[1])
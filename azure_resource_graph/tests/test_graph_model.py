@@ -0,0 +1,114 @@
+"""
+The interned, column-wise storage of AzureResourceGraph and its node/edge views.
+"""
+import threading
+
+from graph_model import AzureResourceGraph, StringInterner
+
+SUB = "/subscriptions/s1"
+
+
+def rg(i):
+    return f"{SUB}/resourceGroups/rg{i}"
+
+
+def build(count=10):
+    graph = AzureResourceGraph()
+    graph.add_node(SUB, "sub", "Subscription")
+    for i in range(count):
+        graph.add_node(rg(i), f"rg{i}", "ResourceGroup")
+        graph.add_edge(SUB, rg(i), "Contains")
+    return graph
+
+
+def test_interner_round_trip():
+    strings = StringInterner()
+    assert [strings.intern(value) for value in ("a", "b", "a")] == [0, 1, 0]
+    assert (strings[1], strings.get("b"), strings.get("c"), len(strings)) == ("b", 1, None, 2)
+
+
+def test_records_round_trip():
+    graph = build(2)
+    graph.add_node("p1", "alice", "Principal", color="#123456")
+    graph.add_edge("p1", rg(1), "Reader", color="red")
+    assert graph.get_node("p1") == {"id": "p1", "label": "alice", "type": "Principal", "color": "#123456"}
+    assert graph.get_node("missing") is None
+    assert {"source": "p1", "target": rg(1), "label": "Reader", "color": "red"} in list(graph.edges)
+    # Re-adding keeps the first record
+    graph.add_node("p1", "bob", "Principal")
+    graph.add_edge("p1", rg(1), "Reader", color="blue")
+    assert (graph.get_node("p1")["label"], len(graph.nodes), len(graph.edges)) == ("alice", 4, 3)
+
+
+def test_types_colors_and_labels_are_interned_once():
+    graph = build(100)
+    # 101 node IDs and labels, plus one string each for the two node types, the two
+    # node colors, the edge label and the edge color
+    assert len(graph.strings) == 2 * 101 + 2 + 2 + 1 + 1
+    assert len(set(graph.node_types)) == 2 and len(set(graph.node_colors)) == 2
+    assert set(graph.edge_labels) == {graph.strings.get("Contains")}
+    assert set(graph.edge_colors) == {graph.strings.get("black")}
+
+
+def test_views():
+    graph = build(3)
+    assert (len(graph.nodes), len(graph.edges), bool(graph.edges)) == (4, 3, True)
+    assert not AzureResourceGraph().nodes
+    assert rg(2) in graph.node_set and "missing" not in graph.node_set
+    assert set(graph.node_set) == {SUB, rg(0), rg(1), rg(2)}
+    assert [edge["target"] for edge in graph.edges] == [rg(0), rg(1), rg(2)]
+
+
+def test_compaction_keeps_records_and_positions():
+    graph = build(10)
+    for i in range(10):
+        graph.set_node_position(rg(i), i, -i)
+    graph.remove(lambda node_id: node_id in {rg(i) for i in range(8)}, lambda *edge: False)
+    # More than half of the slots were dead, so the arrays were rewritten
+    assert len(graph.node_alive) == 3 and len(graph.edge_alive) == 2
+    assert graph.get_node(rg(9)) == {
+        "id": rg(9), "label": "rg9", "type": "ResourceGroup", "color": graph.get_node(rg(8))["color"], "x": 9.0, "y": -9.0,
+    }
+    assert [edge["target"] for edge in graph.edges] == [rg(8), rg(9)]
+    graph.add_node(rg(0), "rg0 again", "ResourceGroup")
+    assert graph.get_node(rg(0))["label"] == "rg0 again" and len(graph.nodes) == 4
+
+
+def test_iteration_is_a_snapshot_across_removals():
+    graph = build(10)
+    seen = []
+    for node in graph.nodes:
+        seen.append(node["id"])
+        if len(seen) == 1:
+            # Compacts the arrays under the running iteration
+            graph.remove(lambda node_id: node_id != SUB, lambda *edge: False)
+            graph.add_node("late", "late", "Principal")
+    assert seen == [SUB] + [rg(i) for i in range(10)]
+    assert [node["id"] for node in graph.nodes] == [SUB, "late"]
+
+
+def test_iteration_while_other_threads_insert_and_remove():
+    graph = build(200)
+    labels = {node["id"]: node["label"] for node in graph.nodes}
+    stop = threading.Event()
+
+    def churn():
+        i = 0
+        while not stop.is_set():
+            graph.add_node(f"p{i}", f"p{i}", "Principal")
+            graph.add_edge(f"p{i}", SUB, "Reader")
+            if i % 50 == 49:
+                graph.remove(lambda node_id: node_id.startswith("p"), lambda *edge: False)
+            i += 1
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        for _ in range(50):
+            nodes = list(graph.nodes)
+            assert all(node["label"] == labels.get(node["id"], node["id"]) for node in nodes)
+            edges = list(graph.edges)
+            assert all(edge["label"] == ("Contains" if edge["source"] == SUB else "Reader") for edge in edges)
+    finally:
+        stop.set()
+        thread.join(5)
@@ -0,0 +1,87 @@
+"""
+GraphWriter and SQLiteGraphWriter outputs read back through read_graph_records / load_from_file.
+"""
+import json
+
+import pytest
+
+from azure_resource_graph_collector import RESOURCE_TYPES
+from graph_model import AzureResourceGraph
+from graph_output import GraphWriter, SQLiteGraphWriter, read_graph_records, zstandard
+
+COMPRESSIONS = [None, "gzip", pytest.param("zstd", marks=pytest.mark.skipif(
+    zstandard is None, reason="needs the 'zstandard' package"))]
+
+
+def contents(graph):
+    """
+    Every node and edge dict (positions and colors included), and the metadata.
+    """
+    nodes = sorted((node for node in graph.nodes), key=lambda node: node["id"])
+    edges = sorted((edge for edge in graph.edges), key=lambda edge: (edge["source"], edge["target"], edge["label"]))
+    return nodes, edges, graph.metadata
+
+
+def change(graph):
+    """
+    Label updates, removals, positions and metadata on top of a collected graph.
+    """
+    principal = next(node["id"] for node in graph.nodes if node["type"] == "Principal")
+    graph.update_node_label(principal, "renamed principal")
+    resource_group = next(node["id"] for node in graph.nodes if node["type"] == "ResourceGroup")
+    graph.remove(lambda node_id: node_id == resource_group, lambda *edge: edge[2] == "Linked")
+    for i, node in enumerate(list(graph.nodes)[:10]):
+        graph.set_node_position(node["id"], i * 1.25, -i / 4)
+    graph.metadata["collected_at"] = "2024-01-01T00:00:00Z"
+
+
+@pytest.mark.parametrize("string_table", [False, True])
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+@pytest.mark.parametrize("fmt", GraphWriter.FORMATS)
+def test_round_trip(tenant, collect, tmp_path, fmt, compression, string_table):
+    graph = collect(tenant)
+    change(graph)
+    filename = str(tmp_path / f"graph.{fmt}")
+    GraphWriter(filename, fmt, compression, string_table).write(graph)
+    assert contents(AzureResourceGraph.load_from_file(filename)) == contents(graph)
+
+
+@pytest.mark.parametrize("string_table", [False, True])
+def test_streamed_changes_are_replayed(tenant, processor_for, tmp_path, string_table):
+    filename = str(tmp_path / "graph.ndjson")
+    writer = GraphWriter(filename, "ndjson", string_table=string_table)
+    processor = processor_for(tenant)
+    writer.attach(processor.graph)
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+    change(processor.graph)
+    writer.write(processor.graph)
+
+    kinds = {kind for kind, _ in read_graph_records(filename)}
+    assert kinds == {"node", "edge", "update", "remove_node", "remove_edge", "position", "metadata"}
+    assert contents(AzureResourceGraph.load_from_file(filename)) == contents(processor.graph)
+
+
+@pytest.mark.parametrize("batch_size", [1, 10000])
+def test_sqlite_round_trip(tenant, processor_for, tmp_path, batch_size):
+    filename = str(tmp_path / "graph.sqlite")
+    writer = SQLiteGraphWriter(filename, batch_size)
+    processor = processor_for(tenant)
+    writer.attach(processor.graph)
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+    change(processor.graph)
+    writer.write(processor.graph)
+    assert contents(AzureResourceGraph.load_from_file(filename)) == contents(processor.graph)
+
+
+def test_json_matches_json_dump(tenant, collect, tmp_path):
+    graph = collect(tenant)
+    graph.metadata["collected_at"] = "2024-01-01T00:00:00Z"
+    filename = tmp_path / "graph.json"
+    GraphWriter(str(filename), "json").write(graph)
+    document = {"nodes": list(graph.nodes), "edges": list(graph.edges), "metadata": graph.metadata}
+    assert filename.read_text() == json.dumps(document, indent=2)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError, match="Unknown output format"):
+        GraphWriter("graph.xml", "xml")
@@ -0,0 +1,118 @@
+"""
+Resource Graph paging: following $skipToken with the next page prefetched in
+the background, and failing pages surfacing in the caller.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from az_cli import AzureCLI
+from az_command import CALL_INFO
+from azure_resource_graph_collector import RESOURCE_TYPES, AzureResourceProcessor
+from graph_model import AzureResourceGraph
+from synthetic_tenant import FakeAzBackend, SyntheticTenant
+
+QUERY = "Resources | project id"
+
+
+class PagedBackend(FakeAzBackend):
+    """
+    Serves 'pages' for QUERY, chained by skip tokens "1", "2", ... Page numbers in
+    'failing' fail; the page after the last one is served empty when 'empty_tail'
+    is set. 'requested' is set for every page number once it is asked for.
+    """
+    def __init__(self, tenant, pages, failing=(), empty_tail=False):
+        super().__init__(tenant)
+        self.pages = list(pages) + ([[]] if empty_tail else [])
+        self.failing = set(failing)
+        self.tokens = []
+        self.requested = {number: threading.Event() for number in range(1, len(self.pages) + 1)}
+
+    def _graph_query(self, options):
+        if options.get("q") != QUERY:
+            return super()._graph_query(options)
+        token = options.get("skip-token")
+        with self.lock:
+            self.tokens.append(token if isinstance(token, str) else None)
+        number = int(token) + 1 if isinstance(token, str) else 1
+        self.requested[number].set()
+        if number in self.failing:
+            CALL_INFO.failed = True
+            print(f"[ERROR] Command failed (1): page {number}")
+            return []
+        rows = self.pages[number - 1]
+        return {"count": len(rows), "data": rows,
+                "skip_token": str(number) if number < len(self.pages) else None}
+
+
+@pytest.fixture
+def small():
+    return SyntheticTenant(resources_per_type=0, uamis=0, principals=0, role_assignments=0)
+
+
+def pages(count, size=3):
+    return [[{"id": f"r{page}-{row}"} for row in range(size)] for page in range(count)]
+
+
+def processor(backend, page_size=3):
+    return AzureResourceProcessor(AzureResourceGraph(), AzureCLI(backend), arg_page_size=page_size)
+
+
+def in_thread(function, timeout=5):
+    """
+    Runs function() in another thread so a hang fails the test instead of blocking it.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(function).result(timeout=timeout)
+
+
+def test_follows_skip_tokens_across_pages(small):
+    backend = PagedBackend(small, pages(4))
+    rows = processor(backend).run_graph_query_paginated(QUERY)
+    assert [row["id"] for row in rows] == [row["id"] for page in pages(4) for row in page]
+    assert backend.tokens == [None, "1", "2", "3"]
+
+
+def test_single_and_empty_final_pages(small):
+    assert processor(PagedBackend(small, pages(1))).run_graph_query_paginated(QUERY) == pages(1)[0]
+    assert processor(PagedBackend(small, [[]])).run_graph_query_paginated(QUERY) == []
+    # A skip token that leads to an empty page ends the results
+    backend = PagedBackend(small, pages(2), empty_tail=True)
+    assert processor(backend).run_graph_query_paginated(QUERY) == pages(2)[0] + pages(2)[1]
+    assert backend.tokens == [None, "1", "2"]
+
+
+def test_next_page_is_prefetched_while_the_current_one_is_consumed(small):
+    backend = PagedBackend(small, pages(3))
+    rows = processor(backend).iter_graph_query(QUERY)
+    next(rows)
+    assert backend.requested[2].wait(5)
+    assert not backend.requested[3].is_set()
+    assert len(list(rows)) == 8
+
+
+@pytest.mark.parametrize("failing", [1, 2, 4])
+def test_failed_page_raises_after_the_rows_before_it(small, failing):
+    backend = PagedBackend(small, pages(4), failing={failing})
+    seen = []
+
+    def consume():
+        for row in processor(backend).iter_graph_query(QUERY):
+            seen.append(row["id"])
+
+    with pytest.raises(RuntimeError, match="Resource Graph query failed"):
+        in_thread(consume)
+    assert seen == [row["id"] for page in pages(4)[:failing - 1] for row in page]
+    # Nothing is requested past the failing page
+    assert len(backend.tokens) == failing
+
+
+def test_failed_resource_page_fails_the_collection(monkeypatch):
+    tenant = SyntheticTenant(resources_per_type=2, uamis=1, principals=5, role_assignments=5, seed=2)
+    rows = [[dict(row, type="Microsoft.Unlisted/things") for row in page] for page in pages(3)]
+    backend = PagedBackend(tenant, rows, failing={2})
+    # The resources of every subscription come from the failing query
+    monkeypatch.setattr("azure_resource_graph_collector.build_resources_query", lambda *args: QUERY)
+    with pytest.raises(RuntimeError, match="page after skip token 1"):
+        in_thread(lambda: processor(backend).process_all_subscriptions(RESOURCE_TYPES), timeout=10)
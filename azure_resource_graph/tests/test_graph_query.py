@@ -0,0 +1,123 @@
+"""
+GraphQueryEngine: node lookup, reachability, shortest paths and reverse queries.
+"""
+import collections
+
+import pytest
+
+from graph_model import IAM_EDGE_COLOR, AzureResourceGraph
+
+pytest.importorskip("numpy")
+from graph_query import EDGE_KIND_FLOW, EDGE_LABEL_KINDS, GraphQueryEngine  # noqa: E402
+
+RG1 = "/subscriptions/s1/resourceGroups/rg1"
+RG2 = "/subscriptions/s1/resourceGroups/rg2"
+KV1 = f"{RG1}/providers/Microsoft.KeyVault/vaults/kv1"
+KV2 = f"{RG2}/providers/Microsoft.KeyVault/vaults/kv2"
+SAMI = f"{KV1}/systemAssignedIdentity"
+UAMI = f"{RG2}/providers/Microsoft.ManagedIdentity/userAssignedIdentities/uami1"
+FC = f"{UAMI}/federatedIdentityCredentials/github"
+
+
+@pytest.fixture
+def engine():
+    """
+    p1 --Owner--> rg1 --Contains--> kv1 --SystemAssignedMI--> sami --Linked--> p2
+    p3 --Secrets--> kv2
+    fc <--Federated Credentials-- uami --Linked--> p4 --Reader--> rg2
+    """
+    graph = AzureResourceGraph()
+    for node_id, label, node_type in [
+        ("p1", "alice", "Principal"), ("p2", "kv-identity", "Principal"), ("p3", "alice", "Principal"),
+        ("p4", "deployer", "Principal"), (RG1, "rg1", "ResourceGroup"), (RG2, "rg2", "ResourceGroup"),
+        (KV1, "kv1", "Microsoft.KeyVault/vaults"), (KV2, "kv2", "Microsoft.KeyVault/vaults"),
+        (SAMI, "kv1-identity", "SystemAssignedManagedIdentity"),
+        (UAMI, "uami1", "Microsoft.ManagedIdentity/userAssignedIdentities"), (FC, "github", "FederatedCredential"),
+    ]:
+        graph.add_node(node_id, label, node_type)
+    graph.add_edge("p1", RG1, "Owner", color=IAM_EDGE_COLOR)
+    graph.add_edge(RG1, KV1, "Contains")
+    graph.add_edge(KV1, SAMI, "SystemAssignedMI")
+    graph.add_edge(SAMI, "p2", "Linked")
+    graph.add_edge("p3", KV2, "Secrets")
+    graph.add_edge(UAMI, FC, "Federated Credentials")
+    graph.add_edge(UAMI, "p4", "Linked")
+    graph.add_edge("p4", RG2, "Reader", color=IAM_EDGE_COLOR)
+    graph.add_edge("p4", "never-added", "Owner", color=IAM_EDGE_COLOR)
+    return GraphQueryEngine(graph)
+
+
+def test_reachable(engine):
+    assert engine.reachable("p1") == {RG1: 1, KV1: 2, SAMI: 3, "p2": 4}
+    assert engine.reachable("p1", max_depth=2) == {RG1: 1, KV1: 2}
+    assert engine.reachable("p1", node_types=["Microsoft.KeyVault/vaults"]) == {KV1: 2}
+    assert engine.reachable("p1", kinds=("role",)) == {RG1: 1}
+    assert engine.reachable(["p1", "p3"], max_depth=1) == {RG1: 1, KV2: 1}
+
+
+def test_federated_credential_acts_as_its_uami(engine):
+    assert engine.reachable(FC) == {UAMI: 1, "p4": 2, RG2: 3}
+    assert engine.reachable(UAMI) == {"p4": 1, RG2: 2}
+
+
+def test_shortest_path(engine):
+    path = engine.shortest_path("p1", "p2")
+    assert [(hop["source"], hop["label"], hop["kind"], hop["target"]) for hop in path] == [
+        ("p1", "Owner", "role", RG1),
+        (RG1, "Contains", "contains", KV1),
+        (KV1, "SystemAssignedMI", "identity", SAMI),
+        (SAMI, "Linked", "linked", "p2"),
+    ]
+    # Hops read in the direction control flows, against the stored edge here
+    assert engine.shortest_path(FC, UAMI) == [
+        {"source": FC, "target": UAMI, "label": "Federated Credentials", "kind": "federation"}
+    ]
+    assert engine.shortest_path("p2", "p1") is None
+    assert engine.shortest_path("p1", "p1") == []
+
+
+def test_principals_reaching(engine):
+    assert engine.principals_reaching(KV1) == {KV1: {"p1": 2}}
+    assert engine.principals_reaching([RG2, KV2]) == {RG2: {"p4": 1}, KV2: {"p3": 1}}
+    paths = engine.principals_reaching(RG2, paths=True)[RG2]
+    assert paths == {"p4": [{"source": "p4", "target": RG2, "label": "Reader", "kind": "role"}]}
+
+
+def test_resolve(engine):
+    assert engine.node_id(engine.resolve(KV1)) == KV1
+    assert engine.node_id(engine.resolve(KV1.upper())) == KV1
+    assert engine.node_id(engine.resolve("KV-Identity")) == "p2"
+    with pytest.raises(KeyError, match="matches 2 nodes by label"):
+        engine.resolve("ALICE")
+    with pytest.raises(KeyError, match="No node"):
+        engine.resolve("nobody")
+    with pytest.raises(KeyError, match="No node"):
+        engine.resolve("never-added")
+
+
+def test_matches_plain_bfs_on_a_collected_tenant(tenant, collect):
+    graph = collect(tenant)
+    engine = GraphQueryEngine(graph)
+    nodes = {node["id"] for node in graph.nodes}
+    control = collections.defaultdict(set)
+    for edge in graph.edges:
+        if edge["source"] not in nodes or edge["target"] not in nodes:
+            continue
+        flow = EDGE_KIND_FLOW[EDGE_LABEL_KINDS.get(edge["label"], "other")]
+        if flow != "reverse":
+            control[edge["source"]].add(edge["target"])
+        if flow != "forward":
+            control[edge["target"]].add(edge["source"])
+
+    principals = sorted(node["id"] for node in graph.nodes if node["type"] == "Principal")[:10]
+    assert any(engine.reachable(principal) for principal in principals)
+    for principal in principals:
+        depth = {principal: 0}
+        frontier = [principal]
+        while frontier:
+            reached = [target for node in frontier for target in control[node] if target not in depth]
+            for target in reached:
+                depth.setdefault(target, depth[frontier[0]] + 1)
+            frontier = list(dict.fromkeys(reached))
+        del depth[principal]
+        assert engine.reachable(principal) == depth
@@ -0,0 +1,115 @@
+import json
+import sqlite3
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.request import urlopen
+
+import pytest
+
+from graph_model import AzureResourceGraph
+from graph_output import SQLiteGraphWriter
+from graph_server import GraphRequestHandler, GraphStore, open_graph_store
+
+RG = "/subscriptions/s1/resourceGroups/rg1"
+
+
+@pytest.fixture
+def store_file(tmp_path):
+    graph = AzureResourceGraph()
+    graph.add_node("/subscriptions/s1", "Production", "Subscription")
+    graph.add_node(RG, "rg-Payments", "ResourceGroup")
+    graph.add_edge("/subscriptions/s1", RG, "Contains")
+    for i, name in enumerate(["kv-payments-eu", "kv-payments-us", "web_shop", "Payroll-App"]):
+        node_id = f"{RG}/providers/Microsoft.Web/sites/{name}"
+        graph.add_node(node_id, name, "Microsoft.Web/sites")
+        graph.add_edge(RG, node_id, "Contains")
+        graph.add_node(f"p{i}", f"principal-{i}", "Principal")
+        graph.add_edge(f"p{i}", node_id, "Owner", color="#d62728")
+    filename = str(tmp_path / "graph.sqlite")
+    SQLiteGraphWriter(filename).write(graph)
+    return filename
+
+
+def labels(page):
+    return sorted(node["label"] for node in page["nodes"])
+
+
+def test_search_matches_substrings_case_insensitively(store_file):
+    store = GraphStore(store_file)
+    assert store.fts
+    assert labels(store.search("PAYMENTS")) == ["kv-payments-eu", "kv-payments-us", "rg-Payments"]
+    assert labels(store.search("payments", "Microsoft.Web/sites")) == ["kv-payments-eu", "kv-payments-us"]
+    # IDs match too: every node below the resource group
+    assert store.search("resourceGroups/RG1")["total"] == 5
+    # LIKE wildcards are plain characters
+    assert labels(store.search("b_s")) == ["web_shop"]
+    assert store.search("b%s")["total"] == 0
+
+
+def test_short_queries_match_label_prefixes(store_file):
+    store = GraphStore(store_file)
+    assert labels(store.search("Pa")) == ["Payroll-App"]
+    assert labels(store.search("kv")) == ["kv-payments-eu", "kv-payments-us"]
+
+
+def test_search_pages_and_edges(store_file):
+    store = GraphStore(store_file)
+    page = store.search("payments", offset=1, limit=1)
+    assert page["total"] == 3 and labels(page) == ["kv-payments-us"]
+    page = store.search("payments")
+    assert {(e["source"], e["target"]) for e in page["edges"]} == {
+        (RG, f"{RG}/providers/Microsoft.Web/sites/kv-payments-eu"),
+        (RG, f"{RG}/providers/Microsoft.Web/sites/kv-payments-us"),
+    }
+
+
+def test_search_uses_indexes(tmp_path):
+    graph = AzureResourceGraph()
+    for i in range(5000):
+        graph.add_node(f"/nodes/{i}", f"node-{i:05d}", "Principal")
+    filename = str(tmp_path / "large.sqlite")
+    SQLiteGraphWriter(filename).write(graph)
+    store = GraphStore(filename)
+    for query, total in (("e-0012", 10), ("no", 5000)):
+        statements = []
+        store.conn.set_trace_callback(statements.append)
+        assert store.search(query, limit=10)["total"] == total
+        store.conn.set_trace_callback(None)
+        for statement in statements:
+            if statement.startswith("SELECT") and "FROM nodes WHERE" in statement:
+                plan = [row[-1] for row in store.conn.execute(f"EXPLAIN QUERY PLAN {statement}")]
+                assert not any(step.startswith("SCAN nodes ") for step in plan), plan
+
+
+def test_search_index_added_to_older_stores(store_file):
+    conn = sqlite3.connect(store_file)
+    conn.execute("DROP TABLE nodes_fts")
+    conn.commit()
+    conn.close()
+    assert not GraphStore(store_file).fts
+    assert GraphStore(open_graph_store(store_file)).fts
+
+
+def test_neighborhood(store_file):
+    store = GraphStore(store_file)
+    page = store.neighborhood(RG)
+    assert page["total"] == 6 and not page["truncated"]
+    assert store.neighborhood("p0", hops=2)["total"] == 3
+    with pytest.raises(KeyError):
+        store.neighborhood("missing")
+
+
+@pytest.mark.parametrize("verbose", [False, True])
+def test_requests_are_logged_only_when_verbose(store_file, capsys, monkeypatch, verbose):
+    monkeypatch.setattr(GraphRequestHandler, "store", GraphStore(store_file))
+    monkeypatch.setattr(GraphRequestHandler, "verbose", verbose)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GraphRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with urlopen(f"http://127.0.0.1:{server.server_address[1]}/api/search?q=payments") as response:
+            assert json.load(response)["total"] == 3
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert ("GET /api/search" in capsys.readouterr().out) == verbose
@@ -0,0 +1,164 @@
+"""
+process_incremental against a synthetic tenant changed after the first
+collection: the patched graph must match a fresh full collection.
+"""
+from azure_resource_graph_collector import RESOURCE_TYPES, build_changes_query
+from graph_model import IAM_EDGE_COLOR
+from persistent_cache import PersistentCache
+
+from conftest import snapshot
+
+SINCE = "2000-01-01T00:00:00Z"
+SITE_TYPE = "microsoft.web/sites"
+UAMI_TYPE = "microsoft.managedidentity/userassignedidentities"
+
+
+def patch(tenant, graph, processor_for):
+    processor_for(tenant, graph).process_incremental(SINCE, RESOURCE_TYPES)
+    return graph
+
+
+def first_row(tenant, resource_type=SITE_TYPE):
+    subscription = tenant.subscriptions[0]["id"]
+    return next(row for row in tenant.resources[subscription] if row["type"] == resource_type)
+
+
+def test_changes_query_covers_resource_groups():
+    query = build_changes_query(SINCE)
+    assert query.startswith("union resourcechanges, resourcecontainerchanges")
+
+
+def test_no_changes_keeps_graph(tenant, collect, processor_for):
+    graph = collect(tenant)
+    before = snapshot(graph)
+    assert snapshot(patch(tenant, graph, processor_for)) == before
+
+
+def test_deleted_resource_group(tenant, collect, processor_for):
+    graph = collect(tenant)
+    subscription = tenant.subscriptions[0]["id"]
+    rg = tenant.resource_groups[subscription].pop(0)
+    rg_id = f"/subscriptions/{subscription}/resourceGroups/{rg}"
+    tenant.resources[subscription] = [row for row in tenant.resources[subscription] if row["resourceGroup"] != rg]
+    for scope in list(tenant.role_assignments):
+        if scope == rg_id.lower() or scope.startswith(f"{rg_id.lower()}/"):
+            del tenant.role_assignments[scope]
+    # Only the resource group's deletion is recorded, in resourcecontainerchanges
+    tenant.record_change(rg_id, "Delete")
+
+    patch(tenant, graph, processor_for)
+    assert not any(n["id"].lower().startswith(rg_id.lower()) for n in graph.nodes)
+    assert snapshot(graph) == snapshot(collect(tenant))
+
+
+def test_resource_in_new_resource_group(tenant, collect, processor_for):
+    graph = collect(tenant)
+    subscription = tenant.subscriptions[0]["id"]
+    row = dict(first_row(tenant), name="site-new", resourceGroup="rg-new", identity=None)
+    row["id"] = f"/subscriptions/{subscription}/resourceGroups/rg-new/providers/Microsoft.Web/sites/site-new"
+    rg_id = f"/subscriptions/{subscription}/resourceGroups/rg-new"
+    tenant.resource_groups[subscription].append("rg-new")
+    tenant.resources[subscription].append(row)
+    tenant.record_change(rg_id, "Create")
+    tenant.record_change(row["id"], "Create")
+
+    patch(tenant, graph, processor_for)
+    assert (rg_id, "rg-new", "ResourceGroup") in snapshot(graph)[0]
+    assert (f"/subscriptions/{subscription}", rg_id, "Contains") in snapshot(graph)[1]
+    assert snapshot(graph) == snapshot(collect(tenant))
+
+
+def test_renamed_resource(tenant, collect, processor_for):
+    graph = collect(tenant)
+    row = first_row(tenant)
+    row["name"] = "renamed-site"
+    tenant.record_change(row["id"], "Update")
+
+    patch(tenant, graph, processor_for)
+    assert (row["id"], "renamed-site", "Microsoft.Web/sites") in snapshot(graph)[0]
+    assert snapshot(graph) == snapshot(collect(tenant))
+
+
+def test_moved_resource(tenant, collect, processor_for):
+    graph = collect(tenant)
+    subscription = tenant.subscriptions[0]["id"]
+    row = first_row(tenant)
+    old_rg = row["resourceGroup"]
+    row["resourceGroup"] = next(rg for rg in tenant.resource_groups[subscription] if rg != old_rg)
+    tenant.record_change(row["id"], "Update")
+
+    patch(tenant, graph, processor_for)
+    containers = {e["source"] for e in graph.edges if e["target"] == row["id"] and e["label"] == "Contains"}
+    assert containers == {f"/subscriptions/{subscription}/resourceGroups/{row['resourceGroup']}"}
+    assert snapshot(graph) == snapshot(collect(tenant))
+
+
+def test_deleted_role_assignment(tenant, collect, processor_for):
+    graph = collect(tenant)
+    scope, assignments = next((s, a) for s, a in tenant.role_assignments.items() if len(a) == 1)
+    removed = assignments.pop()
+    # Deleted assignments have no updatedOn and may be missing from the change history
+
+    patch(tenant, graph, processor_for)
+    assert not any(
+        e["source"] == removed["principalId"] and e["target"].lower() == scope
+        and e["label"] == removed["roleDefinitionName"] and e["color"] == IAM_EDGE_COLOR
+        for e in graph.edges
+    )
+    assert snapshot(graph) == snapshot(collect(tenant))
+
+
+def test_added_role_assignment(tenant, collect, processor_for):
+    graph = collect(tenant)
+    scope = f"/subscriptions/{tenant.subscriptions[1]['id']}"
+    principal = next(iter(tenant.principals))
+    tenant.role_assignments.setdefault(scope.lower(), []).append(
+        {"principalId": principal, "roleDefinitionName": "Owner", "scope": scope}
+    )
+
+    patch(tenant, graph, processor_for)
+    assert (principal, scope, "Owner") in snapshot(graph)[1]
+    assert snapshot(graph) == snapshot(collect(tenant))
+
+
+def federated_credential(name):
+    return {"name": name, "issuer": "https://token.actions.githubusercontent.com",
+            "subject": "repo:org/app:ref:refs/heads/main", "audiences": ["api://AzureADTokenExchange"]}
+
+
+def test_federated_credential_changes_refresh_their_uami(tenant, collect, processor_for):
+    graph = collect(tenant)
+    uami_id = first_row(tenant, UAMI_TYPE)["id"]
+    credentials = tenant.federated_credentials[uami_id.lower()]
+    removed = credentials.pop() if credentials else None
+    credentials.append(federated_credential("fc-added"))
+    # Only the credentials show up in the change history, under the ARM child resource ID
+    tenant.record_change(f"{uami_id}/federatedIdentityCredentials/fc-added", "Create")
+    if removed:
+        tenant.record_change(f"{uami_id}/federatedIdentityCredentials/{removed['name']}", "Delete")
+
+    patch(tenant, graph, processor_for)
+    nodes = {n["id"] for n in graph.nodes}
+    assert f"{uami_id}/federatedCredentials/fc-added" in nodes
+    assert not any("/federatedIdentityCredentials/" in node_id for node_id in nodes)
+    if removed:
+        assert f"{uami_id}/federatedCredentials/{removed['name']}" not in nodes
+    assert snapshot(graph) == snapshot(collect(tenant))
+
+
+def test_changed_uami_is_not_served_from_the_cache(tenant, collect, processor_for, tmp_path):
+    cache = PersistentCache(str(tmp_path))
+    graph = collect(tenant, cache=cache)
+    uami_id = first_row(tenant, UAMI_TYPE)["id"]
+    tenant.federated_credentials[uami_id.lower()] = [federated_credential("fc-rotated")]
+    principal_id = tenant._new_principal("servicePrincipal", "uami-recreated")
+    tenant.uami_principals[uami_id.lower()] = principal_id
+    tenant.record_change(uami_id, "Update")
+
+    processor_for(tenant, graph, cache=cache).process_incremental(SINCE, RESOURCE_TYPES)
+    fc_nodes = {n["id"] for n in graph.nodes if n["type"] == "FederatedCredential" and n["id"].startswith(uami_id)}
+    assert fc_nodes == {f"{uami_id}/federatedCredentials/fc-rotated"}
+    assert (uami_id, principal_id, "Linked") in snapshot(graph)[1]
+    assert cache.get("federated_credentials", uami_id.lower())[0]["name"] == "fc-rotated"
+    assert cache.get("uami_principal", uami_id.lower()) == principal_id
+    cache.close()
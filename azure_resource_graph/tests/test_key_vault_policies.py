@@ -0,0 +1,39 @@
+"""
+Key Vault access policies, read from the vault's Resource Graph row.
+"""
+from az_cli import AzureCLI
+from azure_resource_graph_collector import RESOURCE_TYPES, AzureResourceProcessor
+from graph_model import KEY_VAULT_POLICY_LABELS, AzureResourceGraph
+from synthetic_tenant import FakeAzBackend
+
+VAULT_TYPE = "microsoft.keyvault/vaults"
+
+
+def policy_edges(graph, vault_id):
+    return {(e["source"], e["label"]) for e in graph.edges
+            if e["target"] == vault_id and e["label"] in KEY_VAULT_POLICY_LABELS}
+
+
+def test_policies_from_the_resource_row(tenant):
+    vaults = [row for rows in tenant.resources.values() for row in rows if row["type"] == VAULT_TYPE]
+    rbac_vault, policy_vault = vaults[:2]
+    rbac_vault["enableRbacAuthorization"] = True
+    # Vaults using Azure RBAC keep their old access policies, which no longer grant anything
+    rbac_vault["accessPolicies"] = tenant.access_policies[rbac_vault["id"].lower()]
+    policy_vault["enableRbacAuthorization"] = False
+    reader, writer = tenant.access_policies[policy_vault["id"].lower()][:2]
+    reader["permissions"] = {"secrets": ["get"], "keys": [], "certificates": ["list"]}
+    writer["permissions"] = {"secrets": [], "keys": ["get", "sign"], "certificates": []}
+    policy_vault["accessPolicies"] = [reader, writer, {"permissions": {"secrets": ["get"]}}]
+
+    backend = FakeAzBackend(tenant)
+    processor = AzureResourceProcessor(AzureResourceGraph(), AzureCLI(backend))
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+    graph = processor.graph
+
+    assert policy_edges(graph, policy_vault["id"]) == {
+        (reader["objectId"], "Secrets"), (reader["objectId"], "Certificates"), (writer["objectId"], "Keys"),
+    }
+    assert {reader["objectId"], writer["objectId"]} <= {n["id"] for n in graph.nodes if n["type"] == "Principal"}
+    assert policy_edges(graph, rbac_vault["id"]) == set()
+    assert not any(family.startswith("keyvault") for family in backend.calls)
@@ -0,0 +1,52 @@
+"""
+The NumPy ForceAtlas2 layout and its Barnes-Hut repulsion.
+"""
+import pytest
+
+from graph_layout import _repulsion, forceatlas2_layout
+from graph_model import AzureResourceGraph
+
+np = pytest.importorskip("numpy")
+
+
+def exact_repulsion(x, y, mass, scaling_ratio):
+    dx, dy = x[:, None] - x[None, :], y[:, None] - y[None, :]
+    factor = scaling_ratio * mass[:, None] * mass[None, :] / np.maximum(dx * dx + dy * dy, 1e-9)
+    np.fill_diagonal(factor, 0.0)
+    return (dx * factor).sum(axis=1), (dy * factor).sum(axis=1)
+
+
+def clustered(n, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(-500, 500, (10, 2))
+    cluster = rng.integers(0, len(centres), n)
+    x = centres[cluster, 0] + rng.normal(0, 30, n)
+    y = centres[cluster, 1] + rng.normal(0, 30, n)
+    return x, y, 1.0 + rng.integers(0, 5, n)
+
+
+@pytest.mark.parametrize("n", [50, 1500])
+def test_repulsion_matches_exact(n):
+    x, y, mass = clustered(n)
+    fx, fy = _repulsion(x, y, mass, 10.0)
+    ex, ey = exact_repulsion(x, y, mass, 10.0)
+    error = np.hypot(fx - ex, fy - ey) / np.hypot(ex, ey)
+    assert error.max() < 0.1
+    assert np.percentile(error, 99) < 0.02
+
+
+def test_small_batches_give_the_same_forces():
+    x, y, mass = clustered(500)
+    assert np.allclose(_repulsion(x, y, mass, 10.0), _repulsion(x, y, mass, 10.0, max_pairs=1000))
+
+
+def test_layout_positions_every_node():
+    graph = AzureResourceGraph()
+    for i in range(200):
+        graph.add_node(f"n{i}", f"n{i}", "Principal")
+        if i:
+            graph.add_edge(f"n{i // 2}", f"n{i}", "Contains")
+    forceatlas2_layout(graph, iterations=20)
+    nodes = list(graph.nodes)
+    assert all("x" in node and "y" in node for node in nodes)
+    assert len({(node["x"], node["y"]) for node in nodes}) == len(nodes)
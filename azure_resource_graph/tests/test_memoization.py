@@ -0,0 +1,133 @@
+"""
+The processor's per-run memo of az commands: concurrent identical commands
+share one call, and failures are not memoized.
+"""
+import threading
+import time
+
+import pytest
+
+from az_cli import AzureCLI
+from az_command import CALL_INFO
+from azure_resource_graph_collector import AzureResourceProcessor
+from graph_model import AzureResourceGraph
+from synthetic_tenant import FakeAzBackend, SyntheticTenant
+
+
+class GatedBackend(FakeAzBackend):
+    """
+    'identity show' blocks while 'gate' is clear and fails while 'failures' is positive.
+    """
+    def __init__(self, tenant):
+        super().__init__(tenant)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self.failures = 0
+
+    def _identity_show(self, options):
+        self.started.set()
+        self.gate.wait()
+        with self.lock:
+            failing = self.failures > 0
+            self.failures -= failing
+        if failing:
+            CALL_INFO.failed = True
+            return []
+        return super()._identity_show(options)
+
+
+@pytest.fixture
+def uami():
+    tenant = SyntheticTenant(resources_per_type=0, uamis=1, principals=2, role_assignments=0, seed=4)
+    uami_id, principal_id = next(iter(tenant.uami_principals.items()))
+    return tenant, uami_id, principal_id
+
+
+class CountingProcessor(AzureResourceProcessor):
+    """
+    Counts the memo lookups in progress, to know when every caller reached the memo.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lookups = 0
+        self.lookups_lock = threading.Lock()
+
+    def memo_key(self, command):
+        with self.lookups_lock:
+            self.lookups += 1
+        return super().memo_key(command)
+
+
+def processor(backend):
+    return CountingProcessor(AzureResourceGraph(), AzureCLI(backend))
+
+
+def run_together(backend, lookup, function, count):
+    """
+    Starts one caller, waits until its az call is blocked, then lets 'count' - 1
+    more callers reach the memo before the call completes. Returns the results.
+    """
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(function(i))) for i in range(count)]
+    backend.gate.clear()
+    threads[0].start()
+    assert backend.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while lookup.lookups < count and time.monotonic() < deadline:
+        time.sleep(0.001)
+    # From the key to the memo's future is a few instructions away
+    time.sleep(0.05)
+    backend.gate.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_concurrent_identical_commands_share_one_call(uami):
+    tenant, uami_id, principal_id = uami
+    backend = GatedBackend(tenant)
+    lookup = processor(backend)
+    # Casing differs between callers, the command is the same
+    results = run_together(backend, lookup,
+                           lambda i: lookup.fetch_uami_principal_id(uami_id.upper() if i % 2 else uami_id), 8)
+    assert results == [principal_id] * 8
+    assert backend.calls["identity show"] == 1
+    assert lookup.fetch_uami_principal_id(uami_id) == principal_id
+    assert backend.calls["identity show"] == 1
+
+
+def test_failed_calls_are_not_memoized(uami):
+    tenant, uami_id, principal_id = uami
+    backend = GatedBackend(tenant)
+    backend.failures = 1
+    lookup = processor(backend)
+    results = run_together(backend, lookup, lambda i: lookup.fetch_uami_principal_id(uami_id), 4)
+    # Callers waiting on the failed call share its result...
+    assert results == [None] * 4 and backend.calls["identity show"] == 1
+    # ... but the next call tries again, and its success is memoized
+    assert lookup.fetch_uami_principal_id(uami_id) == principal_id
+    assert lookup.fetch_uami_principal_id(uami_id) == principal_id
+    assert backend.calls["identity show"] == 2
+
+
+def test_an_earlier_failure_on_the_thread_does_not_drop_the_result(uami):
+    tenant, uami_id, principal_id = uami
+    lookup = processor(FakeAzBackend(tenant))
+    CALL_INFO.failed = True
+    assert lookup.memoized("az cached thing", lambda: "from the cache") == "from the cache"
+    assert lookup.memoized("az cached thing", lambda: pytest.fail("computed twice")) == "from the cache"
+
+
+def test_exceptions_are_not_memoized(uami):
+    lookup = processor(FakeAzBackend(uami[0]))
+
+    def broken():
+        raise RuntimeError("transient")
+
+    with pytest.raises(RuntimeError, match="transient"):
+        lookup.memoized("az some command", broken)
+    assert lookup.memoized("az  SOME command", lambda: "fixed") == "fixed"
+    assert lookup.memoized("az some command", broken) == "fixed"
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from az_cli import AzureCLI
+from azure_resource_graph_collector import AzureResourceProcessor
+from graph_model import AzureResourceGraph
+from persistent_cache import PersistentCache
+from synthetic_tenant import FakeAzBackend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_their_ttl(tmp_path, clock):
+    cache = PersistentCache(str(tmp_path))
+    cache.set("principal_name", "p1", "Alice")
+    cache.set("federated_credentials", "u1", [], ttl=60)
+    clock[0] += 59
+    assert cache.get("principal_name", "p1") == "Alice"
+    assert cache.get("federated_credentials", "u1") == []
+    clock[0] += 2
+    assert cache.get("federated_credentials", "u1") is None
+    # Namespace default: 7 days
+    clock[0] += 7 * 24 * 3600
+    assert cache.get("principal_name", "p1") is None
+    cache.close()
+
+
+def test_entries_survive_reopening(tmp_path, clock):
+    cache = PersistentCache(str(tmp_path))
+    cache.set_many("principal_name", {"p1": "Alice", "p2": "Bob"})
+    cache.close()
+    cache = PersistentCache(str(tmp_path))
+    assert cache.get_many("principal_name", ["p1", "p2", "p3"]) == {"p1": "Alice", "p2": "Bob"}
+    cache.close()
+
+
+def test_modes(tmp_path, clock):
+    cache = PersistentCache(str(tmp_path))
+    cache.set("principal_name", "p1", "Alice")
+    cache.close()
+
+    refresh = PersistentCache(str(tmp_path), mode="refresh")
+    assert refresh.get("principal_name", "p1") is None
+    refresh.set("principal_name", "p1", "Alice Smith")
+    refresh.close()
+
+    bypass = PersistentCache(str(tmp_path), mode="bypass")
+    assert bypass.get("principal_name", "p1") is None
+    bypass.set("principal_name", "p2", "Bob")
+    bypass.close()
+
+    cache = PersistentCache(str(tmp_path))
+    assert cache.get_many("principal_name", ["p1", "p2"]) == {"p1": "Alice Smith"}
+    cache.close()
+    with pytest.raises(ValueError):
+        PersistentCache(str(tmp_path), mode="sometimes")
+
+
+def test_close_evicts_least_recently_used(tmp_path, clock):
+    cache = PersistentCache(str(tmp_path), max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set("principal_name", key, key.upper())
+        clock[0] += 1
+    cache.get("principal_name", "a")
+    cache.close()
+    cache = PersistentCache(str(tmp_path))
+    assert cache.get_many("principal_name", ["a", "b", "c"]) == {"a": "A", "c": "C"}
+    cache.close()
+
+
+def test_empty_federated_credentials_are_cached(tmp_path, tenant, processor_for):
+    uami = next(iter(tenant.federated_credentials))
+    tenant.federated_credentials[uami] = []
+    cache = PersistentCache(str(tmp_path))
+    assert processor_for(tenant, cache=cache).fetch_federated_credentials_for_uami(uami) == []
+    processor = processor_for(tenant, cache=cache)
+    assert processor.fetch_federated_credentials_for_uami(uami) == []
+    assert processor.cli.backend.calls["identity federated-credential list"] == 0
+    cache.close()
+
+
+def test_failed_federated_credential_listings_are_not_cached(tmp_path, tenant):
+    uami = next(uami for uami, credentials in tenant.federated_credentials.items() if credentials)
+    cache = PersistentCache(str(tmp_path))
+    processor = AzureResourceProcessor(AzureResourceGraph(), AzureCLI(FakeAzBackend(tenant, throttle_rate=1)), cache)
+    assert processor.fetch_federated_credentials_for_uami(uami) == []
+    assert cache.get("federated_credentials", uami.lower()) is None
+    cache.close()
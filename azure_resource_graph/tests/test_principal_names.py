@@ -0,0 +1,103 @@
+"""
+Principal display names: getByIds chunking, coalescing of concurrent lookups
+and what happens when getByIds fails.
+"""
+import json
+import threading
+
+import pytest
+
+from az_cli import AzureCLI
+from az_command import CALL_INFO
+from azure_resource_graph_collector import GRAPH_GET_BY_IDS_MAX, AzureResourceProcessor
+from graph_model import AzureResourceGraph
+from synthetic_tenant import FakeAzBackend, SyntheticTenant
+
+
+class DirectoryBackend(FakeAzBackend):
+    """
+    Records the IDs of every getByIds call. Calls carrying one of 'rejected'
+    fail, all of them do while 'down' is set, and they block while 'gate' is clear.
+    """
+    def __init__(self, tenant, rejected=()):
+        super().__init__(tenant)
+        self.rejected = set(rejected)
+        self.down = False
+        self.requests = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+
+    def _rest(self, options):
+        # The body comes in a file ("@path"), never on the command line
+        with open(options["body"][1:]) as file:
+            ids = json.load(file)["ids"]
+        with self.lock:
+            self.requests.append(ids)
+        self.started.set()
+        self.gate.wait()
+        if self.down or self.rejected.intersection(ids):
+            CALL_INFO.failed = True
+            return []
+        return super()._rest(options)
+
+
+@pytest.fixture
+def directory():
+    return SyntheticTenant(resources_per_type=0, uamis=0, principals=2500, role_assignments=0, seed=3)
+
+
+def processor(backend):
+    return AzureResourceProcessor(AzureResourceGraph(), AzureCLI(backend))
+
+
+def test_chunks_of_at_most_getbyids_max(directory):
+    backend = DirectoryBackend(directory)
+    ids = list(directory.principals)
+    names = processor(backend).get_principal_names(ids + ids[:10])
+    assert names == {pid: p["displayName"] for pid, p in directory.principals.items()}
+    assert sorted(len(request) for request in backend.requests) == [500, 1000, 1000]
+    assert backend.calls["rest getByIds"] == 3
+
+
+def test_concurrent_lookups_of_the_same_ids_are_coalesced(directory):
+    backend = DirectoryBackend(directory)
+    backend.gate.clear()
+    lookup = processor(backend)
+    ids = list(directory.principals)[:50]
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(lookup.get_principal_names(ids))) for _ in range(4)]
+    threads[0].start()
+    assert backend.started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    backend.gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert backend.calls["rest getByIds"] == 1
+    assert len(results) == 4 and all(result == results[0] for result in results)
+    assert results[0][ids[0]] == directory.principals[ids[0]]["displayName"]
+
+
+def test_rejected_id_is_isolated_by_splitting(directory):
+    ids = list(directory.principals)[:GRAPH_GET_BY_IDS_MAX]
+    backend = DirectoryBackend(directory, rejected={ids[123]})
+    names = processor(backend).fetch_principal_names_by_ids(ids)
+    assert names == {pid: directory.principals[pid]["displayName"] for pid in ids}
+    # Bisected down to the one ID in 10 halvings (the failing half is tried twice),
+    # and only that ID is looked up per principal type
+    assert backend.calls["rest getByIds"] == 2 + 10 * 3
+    assert backend.calls["ad user show"] + backend.calls["ad sp show"] + backend.calls["ad group show"] <= 3
+
+
+def test_failing_getbyids_gives_up_without_per_principal_lookups(directory):
+    backend = DirectoryBackend(directory)
+    backend.down = True
+    ids = list(directory.principals)[:GRAPH_GET_BY_IDS_MAX]
+    lookup = processor(backend)
+    assert lookup.fetch_principal_names_by_ids(ids) == {}
+    # The chunk and both halves, each tried twice
+    assert backend.calls["rest getByIds"] == 6
+    assert sum(count for family, count in backend.calls.items() if family.startswith("ad ")) == 0
+    # Unresolved principals keep their ID as label
+    assert lookup.get_principal_names(ids[:2]) == {pid: pid for pid in ids[:2]}
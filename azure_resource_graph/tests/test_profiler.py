@@ -0,0 +1,26 @@
+"""
+Profiler spans of a collection.
+"""
+from azure_resource_graph_collector import RESOURCE_TYPES
+from profiler import Profiler
+
+
+def spans(profiler, phase):
+    return [event for event in profiler.events if event["ph"] == "X" and event["name"] == phase]
+
+
+def test_subscription_span_covers_its_tasks(tenant, processor_for):
+    profiler = Profiler(enabled=True)
+    processor = processor_for(tenant, profiler=profiler, max_workers=4)
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+
+    subscriptions = spans(profiler, "subscription")
+    assert len(subscriptions) == len(spans(profiler, "enumerate subscription")) == len(tenant.subscriptions)
+    for span in subscriptions:
+        scope = span["args"]["scope"]
+        end = span["ts"] + span["dur"]
+        tasks = [event for event in spans(profiler, "iam scope") + spans(profiler, "resource identities")
+                 if event["args"]["scope"].startswith(scope)]
+        assert tasks
+        # Trace timestamps are rounded to microseconds
+        assert all(span["ts"] <= task["ts"] + 1 and task["ts"] + task["dur"] <= end + 2 for task in tasks)
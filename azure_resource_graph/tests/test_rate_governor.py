@@ -0,0 +1,61 @@
+"""
+Throttling detection and the retries of RateGovernor.
+"""
+import pytest
+
+from az_command import CALL_INFO
+from rate_governor import THROTTLE_PATTERN, RateGovernor
+
+
+@pytest.mark.parametrize("stderr", [
+    "ERROR: (TooManyRequests) The request is being throttled.\nCode: TooManyRequests",
+    'ERROR: Too Many Requests({"error":{"code":"TooManyRequests","message":"Rate limit exceeded"}})',
+    "ERROR: (SubscriptionRequestsThrottled) Number of 'read' requests for subscription exceeded the limit",
+    "ERROR: (RateLimiting) Please provide below info when asking for support",
+    "ERROR: Code: Request_ThrottledTemporarily",
+    "ERROR: Operation returned an invalid status code 429",
+    "HTTP/1.1 429",
+])
+def test_throttling_is_detected(stderr):
+    assert THROTTLE_PATTERN.search(stderr)
+
+
+@pytest.mark.parametrize("stderr", [
+    "ERROR: (ResourceGroupNotFound) Resource group 'rg-429' could not be found.",
+    "ERROR: (ResourceNotFound) The Resource 'Microsoft.Storage/storageAccounts/sa429' was not found.",
+    "ERROR: (AuthorizationFailed) The client does not have authorization; request id 429",
+    "ERROR: (InvalidTemplate) The throttling policy 'throttle-all' is invalid.",
+    "ERROR: Operation returned an invalid status code 404",
+])
+def test_other_errors_are_not_throttling(stderr):
+    assert not THROTTLE_PATTERN.search(stderr)
+
+
+def test_governor_retries_throttled_calls(monkeypatch):
+    delays = []
+    monkeypatch.setattr("rate_governor.time.sleep", delays.append)
+    answers = iter([(True, 0.2), (True, None), (False, None)])
+
+    def run(command):
+        CALL_INFO.throttled, CALL_INFO.retry_after = next(answers)
+        CALL_INFO.remaining = None
+        return [] if CALL_INFO.throttled else ["ok"]
+
+    governor = RateGovernor(max_retries=3)
+    assert governor.call("az account list --output json", run) == ["ok"]
+    assert governor.retries == 2 and governor.gave_up == 0
+    assert delays[0] >= 0.2
+    assert governor.limiters["arm"].throttles == 2
+
+
+def test_governor_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr("rate_governor.time.sleep", lambda delay: None)
+
+    def run(command):
+        CALL_INFO.throttled, CALL_INFO.retry_after, CALL_INFO.remaining = True, None, None
+        return []
+
+    governor = RateGovernor(max_retries=2)
+    assert governor.call("az graph query -q 'Resources'", run) == []
+    assert governor.retries == 2 and governor.gave_up == 1
+    assert governor.limiters["arg"].throttles == 3
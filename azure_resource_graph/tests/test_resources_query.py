@@ -0,0 +1,73 @@
+"""
+The KQL resources query: type and ID filters, string literal escaping, and the
+query surviving the az command line unchanged.
+"""
+import re
+
+from az_cli import AzureCLI, AzureCLIBackend
+from az_command import parse_az_command
+from azure_resource_graph_collector import AzureResourceProcessor, build_resources_query, kql_string
+from graph_model import AzureResourceGraph
+
+LITERAL = re.compile(r"'((?:[^'\\]|\\.)*)'")
+
+
+def literals(query, clause):
+    """
+    The decoded string literals of the first '| where <clause> in~ (...)' of the query.
+    """
+    match = re.search(rf"\| where {clause} in~ \(((?:{LITERAL.pattern}|, )*)\) ", query)
+    assert match, f"no {clause} filter in {query}"
+    return [re.sub(r"\\(.)", r"\1", value) for value in LITERAL.findall(match.group(1))]
+
+
+def test_type_filter():
+    query = build_resources_query(["Microsoft.Compute/virtualMachines", "microsoft.web/sites"])
+    assert query.startswith(
+        "Resources | where type in~ ('Microsoft.Compute/virtualMachines', 'microsoft.web/sites') | extend"
+    )
+    assert "where id" not in query
+
+
+def test_type_and_id_filters():
+    ids = ["/subscriptions/s1/resourceGroups/rg/providers/Microsoft.Web/sites/a", "/subscriptions/s1/x/b"]
+    query = build_resources_query(["microsoft.web/sites"], ids)
+    assert literals(query, "type") == ["microsoft.web/sites"]
+    assert literals(query, "id") == ids
+    assert query.index("where type") < query.index("where id") < query.index("| project")
+
+
+def test_quotes_and_backslashes_are_escaped():
+    assert kql_string("plain") == "'plain'"
+    assert kql_string("it's") == r"'it\'s'"
+    assert kql_string("back\\slash'") == r"'back\\slash\''"
+    odd_types = ["microsoft.web/sites' or 1==1 or type == '", "a\\'b", "trailing\\"]
+    odd_ids = ["/subscriptions/s1/resourceGroups/o'brien"]
+    query = build_resources_query(odd_types, odd_ids)
+    assert literals(query, "type") == odd_types
+    assert literals(query, "id") == odd_ids
+
+
+def test_no_filters():
+    for types in (None, []):
+        query = build_resources_query(types)
+        assert query.startswith("Resources | extend isVault")
+        assert "in~" not in query
+    assert build_resources_query(["a/b"], []) == build_resources_query(["a/b"])
+
+
+class QueryBackend(AzureCLIBackend):
+    def __init__(self):
+        self.queries = []
+
+    def run(self, command):
+        self.queries.append(parse_az_command(command)[1]["q"])
+        return {"data": [], "skip_token": None}
+
+
+def test_query_reaches_az_unchanged():
+    backend = QueryBackend()
+    processor = AzureResourceProcessor(AzureResourceGraph(), AzureCLI(backend))
+    query = build_resources_query(["a/b'c", 'd"e/$f`g'], ["/subscriptions/s1/x\\y"])
+    assert processor.run_graph_query_paginated(query) == []
+    assert backend.queries == [query]
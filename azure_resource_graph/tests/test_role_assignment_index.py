@@ -0,0 +1,79 @@
+"""
+The tenant-wide role assignment index read from the ARG 'authorizationresources'
+table (--iam-source arg): assignments must land on the node of their scope.
+"""
+from az_cli import AzureCLI
+from azure_resource_graph_collector import ARG_ROLE_ASSIGNMENTS_QUERY, RESOURCE_TYPES, AzureResourceProcessor
+from graph_model import IAM_EDGE_COLOR, AzureResourceGraph
+from synthetic_tenant import FakeAzBackend, SyntheticTenant
+
+ROOT = "/"
+MANAGEMENT_GROUP = "/providers/Microsoft.Management/managementGroups/mg-root"
+
+
+class AssignmentBackend(FakeAzBackend):
+    """
+    Serves the given (scope, principalId, roleDefinitionId) rows as the role assignments.
+    """
+    def __init__(self, tenant, rows):
+        super().__init__(tenant)
+        self.rows = rows
+
+    def _graph_query(self, options):
+        if options.get("q") != ARG_ROLE_ASSIGNMENTS_QUERY:
+            return super()._graph_query(options)
+        data = [{"scope": scope, "principalId": pid, "roleDefinitionId": definition}
+                for scope, pid, definition in self.rows]
+        return {"count": len(data), "data": data, "skip_token": None, "total_records": len(data)}
+
+
+def iam_edges(graph):
+    return {(e["source"], e["target"], e["label"]) for e in graph.edges if e["color"] == IAM_EDGE_COLOR}
+
+
+def test_assignments_map_to_their_scope_nodes():
+    tenant = SyntheticTenant(subscriptions=2, resource_groups=2, resources_per_type=1, uamis=1,
+                             principals=6, role_assignments=0, seed=5)
+    (sub, other_sub), principals = tenant.subscriptions, list(tenant.principals)
+    sub_id = f"/subscriptions/{sub['id']}"
+    rg_id = f"{sub_id}/resourceGroups/{tenant.resource_groups[sub['id']][0]}"
+    resource_id = next(row["id"] for row in tenant.resources[other_sub["id"]]
+                       if row["type"] == "microsoft.compute/virtualmachines")
+    definitions = tenant.role_definitions
+    rows = [
+        # Casing and trailing slashes differ from the graphed IDs
+        (sub_id.upper(), principals[0], f"{sub_id}/providers/Microsoft.Authorization/roleDefinitions/"
+                                        f"{definitions['Owner']}"),
+        (rg_id.lower() + "/", principals[1], f"/providers/Microsoft.Authorization/roleDefinitions/"
+                                             f"{definitions['Reader'].upper()}"),
+        (resource_id.lower(), principals[2], f"/subscriptions/{other_sub['id']}/providers/"
+                                             f"Microsoft.Authorization/roleDefinitions/{definitions['Contributor']}"),
+        # Above the subscriptions: not graphed, and never attached to a subscription
+        (MANAGEMENT_GROUP, principals[3], f"{MANAGEMENT_GROUP}/providers/Microsoft.Authorization/"
+                                          f"roleDefinitions/{definitions['Owner']}"),
+        (ROOT, principals[4], f"/providers/Microsoft.Authorization/roleDefinitions/"
+                              f"{definitions['User Access Administrator']}"),
+        # Unknown definitions keep their GUID
+        (sub_id, principals[5], f"{sub_id}/providers/Microsoft.Authorization/roleDefinitions/"
+                                f"00000000-0000-0000-0000-00000000abcd"),
+    ]
+    backend = AssignmentBackend(tenant, rows)
+    processor = AzureResourceProcessor(AzureResourceGraph(), AzureCLI(backend), iam_source="arg")
+    processor.process_all_subscriptions(RESOURCE_TYPES)
+
+    index = processor.role_assignment_index
+    assert set(index) == {sub_id.lower(), rg_id.lower(), resource_id.lower(), MANAGEMENT_GROUP.lower(), ROOT}
+    assert index[ROOT] == [{"principalId": principals[4], "roleDefinitionName": "User Access Administrator"}]
+    assert processor.fetch_role_assignments(MANAGEMENT_GROUP.upper()) == [
+        {"principalId": principals[3], "roleDefinitionName": "Owner"}
+    ]
+    assert processor.fetch_role_assignments(f"/subscriptions/{other_sub['id']}") == []
+
+    assert iam_edges(processor.graph) == {
+        (principals[0], sub_id, "Owner"),
+        (principals[1], rg_id, "Reader"),
+        (principals[2], resource_id, "Contributor"),
+        (principals[5], sub_id, "00000000-0000-0000-0000-00000000abcd"),
+    }
+    # Served from the index, not per scope
+    assert backend.calls["role assignment list"] == 0
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+
+from work_scheduler import WorkScheduler
+
+
+def test_wait_covers_nested_tasks():
+    done = []
+    with WorkScheduler(max_workers=2) as scheduler:
+        def parent(i):
+            for j in range(3):
+                scheduler.submit(done.append, (i, j))
+        for i in range(4):
+            scheduler.submit(parent, i)
+        scheduler.wait()
+        assert sorted(done) == [(i, j) for i in range(4) for j in range(3)]
+
+
+def test_wait_raises_first_failure():
+    def fail():
+        raise ValueError("boom")
+    with WorkScheduler(max_workers=2) as scheduler:
+        scheduler.submit(fail)
+        with pytest.raises(ValueError):
+            scheduler.wait()
+        # Errors are reported once
+        scheduler.submit(lambda: None)
+        scheduler.wait()
+
+
+def test_submit_blocks_when_queue_is_full():
+    release = threading.Event()
+    lock = threading.Lock()
+    outstanding = [0, 0]  # current, peak
+
+    def task():
+        release.wait()
+        with lock:
+            outstanding[0] -= 1
+
+    with WorkScheduler(max_workers=2, queue_factor=2) as scheduler:
+        def produce():
+            for _ in range(20):
+                with lock:
+                    outstanding[0] += 1
+                    outstanding[1] = max(outstanding[1], outstanding[0])
+                scheduler.submit(task)
+        producer = threading.Thread(target=produce)
+        producer.start()
+        time.sleep(0.2)
+        # 2 workers x 2: the producer waits for a slot instead of queueing all 20 tasks
+        assert producer.is_alive()
+        assert outstanding[0] == 5
+        release.set()
+        producer.join()
+        scheduler.wait()
+    assert outstanding == [0, 5]
+
+
+def test_workers_run_tasks_inline_when_full():
+    done = []
+    with WorkScheduler(max_workers=1, queue_factor=1) as scheduler:
+        def parent():
+            # Every slot is taken by this task: its children run on this worker
+            futures = [scheduler.submit(done.append, i) for i in range(10)]
+            assert all(future.done() for future in futures)
+        scheduler.submit(parent)
+        scheduler.wait()
+    assert done == list(range(10))
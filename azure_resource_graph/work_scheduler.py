@@ -0,0 +1,80 @@
+"""
+Bounded thread pool for the collector's per-scope tasks.
+"""
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# Default number of concurrent per-scope tasks
+DEFAULT_MAX_WORKERS = 16
+# Tasks queued or running per worker before WorkScheduler.submit applies backpressure
+SCHEDULER_QUEUE_FACTOR = 4
+
+
+class WorkScheduler:
+    """
+    Runs per-scope tasks on one bounded thread pool. Tasks may schedule more
+    tasks; wait() returns once every task, including those, has finished and
+    re-raises the first failure.
+
+    At most queue_factor * max_workers tasks are queued or running at once.
+    Beyond that, submit() blocks other threads until a task finishes, and a
+    worker runs the new task itself: blocking it could leave no worker to
+    free a slot.
+    """
+    def __init__(self, max_workers: int = DEFAULT_MAX_WORKERS, queue_factor: int = SCHEDULER_QUEUE_FACTOR):
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="arg-worker",
+                                           initializer=self._mark_worker)
+        self.slots = threading.BoundedSemaphore(max(1, queue_factor) * max_workers)
+        self.pending = 0
+        self.errors = []
+        self.condition = threading.Condition()
+
+    def _mark_worker(self):
+        self.local.worker = True
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        with self.condition:
+            self.pending += 1
+        if self.slots.acquire(blocking=not getattr(self.local, "worker", False)):
+            future = self.executor.submit(fn, *args, **kwargs)
+            future.add_done_callback(self._release_slot)
+        else:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        future.add_done_callback(self._task_done)
+        return future
+
+    def _release_slot(self, future: Future):
+        self.slots.release()
+
+    def _task_done(self, future: Future):
+        error = None if future.cancelled() else future.exception()
+        if error is not None:
+            print(f"[ERROR] Task failed: {error!r}")
+        with self.condition:
+            if error is not None:
+                self.errors.append(error)
+            self.pending -= 1
+            if self.pending == 0:
+                self.condition.notify_all()
+
+    def wait(self):
+        with self.condition:
+            while self.pending:
+                self.condition.wait()
+            errors, self.errors = self.errors, []
+        if errors:
+            raise errors[0]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()